@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import click
+from frappe.commands import pass_context
+
+
+@click.command("ocr-ai-stub")
+@click.option("--host", default="127.0.0.1", help="Interface to bind")
+@click.option("--port", default=8765, type=int, help="Port to listen on")
+@click.option("--latency", default=0.5, type=float, help="Seconds per completion")
+@click.option("--jitter", default=0.0, type=float, help="Random +/- seconds added to latency")
+@click.option("--chunk-delay", default=0.02, type=float, help="Seconds between streamed chunks")
+@click.option("--error-rate", default=0.0, type=float, help="Fraction of requests answered with 429")
+@click.option("--responses", default=None, help="JSON file with canned responses")
+@click.option("--model", default="local-model", help="Model id reported by /v1/models")
+def ocr_ai_stub(host, port, latency, jitter, chunk_delay, error_rate, responses, model):
+	"""Run an OpenAI-compatible stub server for offline AI pipeline testing"""
+	from erpnext_ocr.erpnext_ocr.local_ai_stub import serve
+
+	serve(host, port, latency, jitter, chunk_delay, error_rate, responses, model)
+
+
+@click.command("ocr-train-classifier")
+@pass_context
+def ocr_train_classifier(context):
+	"""Train the local document classifier from classified OCR Reads"""
+	import frappe
+	from erpnext_ocr.erpnext_ocr.local_classifier import train_and_save
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			metadata = train_and_save()
+			click.echo("{0}: trained on {1} documents, holdout accuracy {2}, coverage at threshold {3}".format(
+				site, metadata.get("samples"), metadata.get("accuracy", "n/a"), metadata.get("coverage", "n/a")))
+		finally:
+			frappe.destroy()
+
+
+@click.command("ocr-rebuild-duplicate-index")
+@pass_context
+def ocr_rebuild_duplicate_index(context):
+	"""Index all Purchase Invoices and OCR Read texts for duplicate detection"""
+	import frappe
+	from erpnext_ocr.erpnext_ocr.duplicate_index import rebuild_index
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			rebuild_index()
+			click.echo("{0}: duplicate index rebuilt".format(site))
+		finally:
+			frappe.destroy()
+
+
+@click.command("ocr-rebuild-template-index")
+@pass_context
+def ocr_rebuild_template_index(context):
+	"""Index all extracted OCR Reads for reuse by documents with the same layout"""
+	import frappe
+	from erpnext_ocr.erpnext_ocr.extraction_reuse import rebuild_index
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			rebuild_index()
+			click.echo("{0}: template index rebuilt".format(site))
+		finally:
+			frappe.destroy()
+
+
+commands = [
+	ocr_ai_stub,
+	ocr_train_classifier,
+	ocr_rebuild_duplicate_index,
+	ocr_rebuild_template_index,
+]
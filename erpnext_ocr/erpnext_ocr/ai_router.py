@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Health-aware routing across all active AI Integration Settings.
+
+Active settings are grouped by ``priority`` (lower is preferred). Within a
+priority, traffic is spread by ``weight`` scaled by each provider's recent
+latency and error rate. A circuit breaker takes a provider out of rotation
+after repeated failures and lets a single probe through once it cools down.
+When a call fails, the next candidate is tried.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import random
+import threading
+import time
+from frappe import _
+from frappe.utils import cint
+from erpnext_ocr.erpnext_ocr.ai_usage import get_request_latency, log_ai_call, reset_request_stats
+
+FAILURE_THRESHOLD = 5
+COOLDOWN_SECONDS = 60
+EWMA_ALPHA = 0.2
+LATENCY_REFERENCE = 5.0
+HEALTH_TTL = 24 * 60 * 60
+
+SETTINGS_VERSION_KEY = "ai_integration_settings_version"
+
+VISION_PROVIDERS = ("OpenAI", "OpenRouter", "Local Model")
+TEXT_PROVIDERS = ("OpenAI", "Perplexity AI", "OpenRouter", "Local Model")
+
+# site -> (settings version, active settings documents)
+_settings_cache = {}
+_settings_lock = threading.Lock()
+
+
+def _health_key(settings_name):
+    return "ai_provider_health:{0}".format(settings_name)
+
+
+def _probe_key(settings_name):
+    return "ai_provider_probe:{0}".format(settings_name)
+
+
+def get_health(settings_name):
+    """Latency/error EWMAs and breaker state recorded for a settings record"""
+    health = {"latency": 0.0, "error_rate": 0.0, "failures": 0, "open_until": 0.0, "calls": 0}
+    try:
+        health.update(frappe.cache().get_value(_health_key(settings_name)) or {})
+    except Exception:
+        pass
+    return health
+
+
+def _save_health(settings_name, health):
+    try:
+        frappe.cache().set_value(_health_key(settings_name), health, expires_in_sec=HEALTH_TTL)
+    except Exception:
+        pass
+
+
+def record_success(settings_name, latency):
+    health = get_health(settings_name)
+    health["latency"] = latency if not health["calls"] else (
+        EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health["latency"]
+    )
+    health["error_rate"] = (1 - EWMA_ALPHA) * health["error_rate"]
+    health["failures"] = 0
+    health["open_until"] = 0
+    health["calls"] += 1
+    _save_health(settings_name, health)
+
+
+def record_failure(settings_name, latency=None):
+    health = get_health(settings_name)
+    if latency is not None and health["calls"]:
+        health["latency"] = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health["latency"]
+    health["error_rate"] = EWMA_ALPHA + (1 - EWMA_ALPHA) * health["error_rate"]
+    health["failures"] += 1
+    health["calls"] += 1
+    if health["failures"] >= FAILURE_THRESHOLD:
+        health["open_until"] = time.time() + COOLDOWN_SECONDS
+    _save_health(settings_name, health)
+
+
+def is_available(settings_name, health=None):
+    """Closed breaker, or an open one whose cooldown expired and whose probe slot is free
+
+    Only reads the state; the probe slot is claimed when a call is dispatched.
+    """
+    health = health or get_health(settings_name)
+    if not health["open_until"]:
+        return True
+    if health["open_until"] > time.time():
+        return False
+
+    try:
+        cache = frappe.cache()
+        return not cache.get(cache.make_key(_probe_key(settings_name)))
+    except Exception:
+        return True
+
+
+def _claim_probe(settings_name):
+    """Whether a call may be dispatched to a provider now
+
+    Half-open: only one worker gets to probe the provider per cooldown window.
+    A closed breaker, or one still cooling down (tried only as a last
+    resort), claims nothing.
+    """
+    health = get_health(settings_name)
+    if not health["open_until"] or health["open_until"] > time.time():
+        return True
+
+    try:
+        cache = frappe.cache()
+        return bool(cache.set(cache.make_key(_probe_key(settings_name)), 1, nx=True, ex=COOLDOWN_SECONDS))
+    except Exception:
+        return True
+
+
+def _effective_weight(settings, health):
+    weight = max(cint(settings.get("weight")), 1)
+    return weight * max(0.05, 1 - health["error_rate"]) / (1 + health["latency"] / LATENCY_REFERENCE)
+
+
+def _weighted_order(candidates):
+    """Weighted random ordering (sampling without replacement)"""
+    keyed = []
+    for settings, weight in candidates:
+        keyed.append((random.random() ** (1.0 / weight), settings))
+    keyed.sort(key=lambda x: x[0], reverse=True)
+    return [settings for _key, settings in keyed]
+
+
+def _get_settings_version():
+    """Current generation of the settings, shared by all processes through Redis"""
+    cache = frappe.cache()
+    key = cache.make_key(SETTINGS_VERSION_KEY)
+    version = cache.get(key)
+    if version is None:
+        cache.set(key, frappe.generate_hash(length=10), nx=True)
+        version = cache.get(key)
+    return frappe.safe_decode(version)
+
+
+def get_active_settings_list():
+    """All active AI Integration Settings, ordered by priority.
+
+    Resolved documents are kept per process and site until any settings record
+    changes, so the hot path costs one Redis read instead of several queries.
+    """
+    site = frappe.local.site
+    try:
+        version = _get_settings_version()
+    except Exception:
+        version = None
+
+    cached = _settings_cache.get(site)
+    if cached and version and cached[0] == version:
+        return list(cached[1])
+
+    # Read the version before loading so a concurrent change is never cached as current
+    names = frappe.get_all("AI Integration Settings",
+                           filters={"is_active": 1},
+                           fields=["name"],
+                           order_by="priority asc, modified desc")
+    settings_list = [frappe.get_doc("AI Integration Settings", d.name) for d in names]
+
+    if version:
+        with _settings_lock:
+            _settings_cache[site] = (version, settings_list)
+    return list(settings_list)
+
+
+def _bump_settings_version():
+    cache = frappe.cache()
+    cache.set(cache.make_key(SETTINGS_VERSION_KEY), frappe.generate_hash(length=10))
+
+
+def clear_settings_cache(doc=None, method=None):
+    """Invalidate resolved settings in every process (AI Integration Settings on_update/on_trash)"""
+    with _settings_lock:
+        _settings_cache.pop(frappe.local.site, None)
+    _bump_settings_version()
+    # Other workers may reload before this transaction commits, so bump again afterwards
+    frappe.db.after_commit.add(_bump_settings_version)
+
+
+def get_routed_settings(capability=None):
+    """Active settings in the order they should be tried for the next call"""
+    settings_list = get_active_settings_list()
+    if capability == "vision":
+        settings_list = [s for s in settings_list if s.ai_provider in VISION_PROVIDERS]
+    elif capability == "text":
+        settings_list = [s for s in settings_list if s.ai_provider in TEXT_PROVIDERS]
+
+    tiers = {}
+    for settings in settings_list:
+        tiers.setdefault(cint(settings.get("priority")), []).append(settings)
+
+    ordered = []
+    tripped = []
+    for priority in sorted(tiers):
+        candidates = []
+        for settings in tiers[priority]:
+            health = get_health(settings.name)
+            if is_available(settings.name, health):
+                candidates.append((settings, _effective_weight(settings, health)))
+            else:
+                tripped.append(settings)
+        ordered.extend(_weighted_order(candidates))
+
+    # Providers with an open breaker are only tried as a last resort
+    return ordered + tripped
+
+
+def call_with_failover(handler, capability=None, prompt_type=None, reference=None):
+    """Call ``handler(settings)`` on the best provider, failing over on errors.
+
+    Every attempt is recorded in the AI usage log against ``reference``, a
+    ``(doctype, name)`` tuple of the document being processed.
+    """
+    candidates = get_routed_settings(capability)
+    if not candidates:
+        frappe.throw(_("No active AI integration settings found"))
+
+    def attempt(settings):
+        start_time = time.time()
+        reset_request_stats(settings, prompt_type, reference)
+        try:
+            result = handler(settings)
+        except Exception as e:
+            record_failure(settings.name, time.time() - start_time)
+            log_ai_call(settings, prompt_type, get_request_latency(), status="Error", error=str(e),
+                        reference=reference)
+            reset_request_stats()
+            frappe.clear_messages()
+            return None, e
+
+        record_success(settings.name, time.time() - start_time)
+        log_ai_call(settings, prompt_type, get_request_latency(), result=result, reference=reference)
+        reset_request_stats()
+        return result, None
+
+    last_error = None
+    probing = []
+    for settings in candidates:
+        if not _claim_probe(settings.name):
+            # Another worker is probing it; only try it if every other provider fails
+            probing.append(settings)
+            continue
+        result, last_error = attempt(settings)
+        if last_error is None:
+            return result
+
+    for settings in probing:
+        result, last_error = attempt(settings)
+        if last_error is None:
+            return result
+
+    raise last_error
+
+
+@frappe.whitelist()
+def get_provider_health():
+    """Routing health for every active AI Integration Settings record"""
+    frappe.only_for("System Manager")
+    result = []
+    for settings in get_active_settings_list():
+        health = get_health(settings.name)
+        health.update({
+            "name": settings.name,
+            "ai_provider": settings.ai_provider,
+            "priority": cint(settings.get("priority")),
+            "weight": cint(settings.get("weight")),
+            "circuit_open": health["open_until"] > time.time(),
+        })
+        result.append(health)
+    return result
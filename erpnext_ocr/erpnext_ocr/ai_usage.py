@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Usage and latency ledger for AI provider calls.
+
+Every call is appended to a Redis list as it happens (no database write on
+the request path) and a scheduler job moves the buffered events into the
+append-only AI Usage Log in bulk. ``get_usage_summary`` rolls the log up into
+latency percentiles, error rates and tokens per document type.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import json
+import threading
+import time
+from frappe.utils import add_days, cint, flt, now, now_datetime
+
+BUFFER_KEY = "ai_usage_log_buffer"
+MAX_BUFFERED_EVENTS = 100000
+FLUSH_BATCH_SIZE = 5000
+DEFAULT_SUMMARY_DAYS = 7
+
+LOG_FIELDS = (
+    "ai_settings", "provider", "model", "prompt_type", "status", "cache_hit",
+    "reference_doctype", "reference_name", "latency", "bytes_sent",
+    "input_tokens", "output_tokens", "total_tokens", "error"
+)
+
+# Append one event and drop the oldest ones beyond the cap
+_PUSH_SCRIPT = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+return 1
+"""
+
+# Atomically take up to ARGV[1] events from the head of the buffer
+_POP_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return items
+"""
+
+# Put a batch that could not be saved back at the head of the buffer, in its order
+_RESTORE_SCRIPT = """
+for i = #ARGV, 1, -1 do
+    redis.call('LPUSH', KEYS[1], ARGV[i])
+end
+return #ARGV
+"""
+
+_request_stats = threading.local()
+
+
+def reset_request_stats(settings=None, prompt_type=None, reference=None):
+    """Start one handler call; round trips it makes before its last are logged against these"""
+    _request_stats.bytes_sent = 0
+    _request_stats.started = time.time()
+    _request_stats.call = (settings, prompt_type, reference)
+
+
+def add_bytes_sent(size):
+    _request_stats.bytes_sent = getattr(_request_stats, "bytes_sent", 0) + size
+
+
+def get_bytes_sent():
+    return getattr(_request_stats, "bytes_sent", 0)
+
+
+def get_request_latency():
+    """Seconds since the handler call started or its last logged round trip"""
+    return time.time() - getattr(_request_stats, "started", time.time())
+
+
+def log_request_attempt(result=None, status="Success", error=None):
+    """Log a round trip that is followed by another in the same handler call; never raises
+
+    The handler's last round trip is logged by ``call_with_failover``. Calls
+    made outside it (such as connection tests) are not logged.
+    """
+    settings, prompt_type, reference = getattr(_request_stats, "call", None) or (None, None, None)
+    if settings is None:
+        return
+    log_ai_call(settings, prompt_type, get_request_latency(), result=result, status=status,
+                error=error, reference=reference)
+    _request_stats.bytes_sent = 0
+    _request_stats.started = time.time()
+
+
+def _buffer_key():
+    return frappe.cache().make_key(BUFFER_KEY)
+
+
+def log_ai_call(settings=None, prompt_type=None, latency=None, result=None, status="Success",
+                error=None, reference=None, cache_hit=False, bytes_sent=None):
+    """Buffer one usage event; never raises"""
+    usage = (result or {}).get("usage") or {}
+    input_tokens = cint(usage.get("prompt_tokens") or usage.get("input_tokens"))
+    output_tokens = cint(usage.get("completion_tokens") or usage.get("output_tokens"))
+    reference_doctype, reference_name = reference or (None, None)
+
+    event = {
+        "timestamp": now(),
+        "user": frappe.session.user if getattr(frappe.local, "session", None) else "Administrator",
+        "ai_settings": settings.name if settings else None,
+        "provider": settings.ai_provider if settings else None,
+        "model": (result or {}).get("model") or (settings.model_name if settings else None),
+        "prompt_type": prompt_type,
+        "status": status,
+        "cache_hit": 1 if cache_hit else 0,
+        "reference_doctype": reference_doctype,
+        "reference_name": reference_name,
+        "latency": flt(latency, 3),
+        "bytes_sent": cint(get_bytes_sent() if bytes_sent is None else bytes_sent),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": cint(usage.get("total_tokens")) or input_tokens + output_tokens,
+        "error": (error or "")[:1000] or None
+    }
+
+    try:
+        frappe.cache().eval(_PUSH_SCRIPT, 1, _buffer_key(), json.dumps(event), MAX_BUFFERED_EVENTS)
+    except Exception:
+        pass
+
+
+def flush_usage_log():
+    """Scheduler entry point: move buffered events into AI Usage Log with bulk inserts"""
+    fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus"] + list(LOG_FIELDS)
+
+    while True:
+        items = frappe.cache().eval(_POP_SCRIPT, 1, _buffer_key(), FLUSH_BATCH_SIZE) or []
+        if not items:
+            break
+
+        values = []
+        for item in items:
+            try:
+                event = json.loads(frappe.safe_decode(item))
+            except ValueError:
+                continue
+            values.append(
+                [frappe.generate_hash(length=10), event["timestamp"], event["timestamp"],
+                 event["user"], event["user"], 0] + [event.get(field) for field in LOG_FIELDS]
+            )
+
+        try:
+            frappe.db.bulk_insert("AI Usage Log", fields, values)
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            # Keep the events for the next run instead of losing them
+            frappe.cache().eval(_RESTORE_SCRIPT, 1, _buffer_key(), *items)
+            frappe.log_error(frappe.get_traceback(), "AI Usage Log Flush Error")
+            break
+
+        if len(items) < FLUSH_BATCH_SIZE:
+            break
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100.0 * (len(sorted_values) - 1))))
+    return flt(sorted_values[index], 3)
+
+
+@frappe.whitelist()
+def get_usage_summary(from_date=None, to_date=None):
+    """Latency percentiles and error rates per provider/model/task, and tokens per document type"""
+    frappe.only_for("System Manager")
+
+    to_date = to_date or now_datetime()
+    from_date = from_date or add_days(to_date, -DEFAULT_SUMMARY_DAYS)
+
+    rows = frappe.db.sql("""
+        SELECT provider, model, prompt_type, status, cache_hit, latency,
+            input_tokens, output_tokens
+        FROM `tabAI Usage Log`
+        WHERE creation BETWEEN %s AND %s
+        ORDER BY latency
+    """, (from_date, to_date), as_dict=True)
+
+    groups = {}
+    for row in rows:
+        key = (row.provider or "Cache", row.model or "", row.prompt_type or "")
+        group = groups.setdefault(key, {
+            "provider": key[0], "model": key[1], "prompt_type": key[2],
+            "calls": 0, "errors": 0, "cache_hits": 0, "input_tokens": 0, "output_tokens": 0,
+            "latencies": []
+        })
+        group["calls"] += 1
+        group["errors"] += 1 if row.status == "Error" else 0
+        group["cache_hits"] += cint(row.cache_hit)
+        group["input_tokens"] += cint(row.input_tokens)
+        group["output_tokens"] += cint(row.output_tokens)
+        if not row.cache_hit and row.status == "Success":
+            group["latencies"].append(flt(row.latency))
+
+    by_model = []
+    for group in groups.values():
+        latencies = group.pop("latencies")
+        group["error_rate"] = flt(group["errors"] / group["calls"], 3)
+        group["p50_latency"] = _percentile(latencies, 50)
+        group["p95_latency"] = _percentile(latencies, 95)
+        group["avg_tokens"] = flt((group["input_tokens"] + group["output_tokens"]) / group["calls"], 1)
+        by_model.append(group)
+
+    by_document_type = frappe.db.sql("""
+        SELECT IFNULL(NULLIF(ocr.detected_document_type, ''), 'Unknown') AS document_type,
+            COUNT(DISTINCT log.reference_name) AS documents,
+            COUNT(*) AS calls,
+            SUM(log.input_tokens) AS input_tokens,
+            SUM(log.output_tokens) AS output_tokens,
+            SUM(log.total_tokens) / GREATEST(COUNT(DISTINCT log.reference_name), 1) AS tokens_per_document
+        FROM `tabAI Usage Log` log
+        LEFT JOIN `tabOCR Read` ocr
+            ON log.reference_doctype = 'OCR Read' AND ocr.name = log.reference_name
+        WHERE log.creation BETWEEN %s AND %s
+        GROUP BY document_type
+        ORDER BY input_tokens DESC
+    """, (from_date, to_date), as_dict=True)
+
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "by_model": sorted(by_model, key=lambda g: (g["provider"], g["model"], g["prompt_type"])),
+        "by_document_type": by_document_type
+    }
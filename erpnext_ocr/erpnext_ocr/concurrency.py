@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Run independent, I/O-bound tasks (mostly AI requests) in parallel threads.
+
+Frappe keeps the site, session and database connection in thread-local
+state, so every worker thread initialises its own site context and DB
+connection and tears it down again when the task is done.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def _run_in_site_context(task, site, sites_path, user):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        frappe.set_user(user)
+        return task()
+    finally:
+        frappe.destroy()
+
+
+def run_concurrently(tasks, max_workers=None):
+    """Run callables concurrently and return a ``(result, error)`` tuple per task, in order"""
+    if len(tasks) <= 1:
+        outcomes = []
+        for task in tasks:
+            try:
+                outcomes.append((task(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    site = frappe.local.site
+    sites_path = frappe.local.sites_path
+    user = frappe.session.user
+
+    with ThreadPoolExecutor(max_workers=min(len(tasks), max_workers or DEFAULT_MAX_WORKERS)) as executor:
+        futures = [executor.submit(_run_in_site_context, task, site, sites_path, user) for task in tasks]
+
+    outcomes = []
+    for future in futures:
+        try:
+            outcomes.append((future.result(), None))
+        except Exception as e:
+            outcomes.append((None, e))
+    return outcomes
@@ -0,0 +1,51 @@
+// Copyright (c) 2025, John Vincent Fiel and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('AI Batch Job', {
+    refresh: function(frm) {
+        let indicators = {
+            'Draft': 'gray',
+            'Queued': 'blue',
+            'In Progress': 'orange',
+            'Completed': 'green',
+            'Failed': 'red',
+            'Cancelled': 'red',
+            'Expired': 'red'
+        };
+        frm.page.set_indicator(__(frm.doc.status), indicators[frm.doc.status] || 'gray');
+    },
+    
+    submit_batch: function(frm) {
+        call_batch_method(frm, 'submit_batch', __('Submitting batch...'));
+    },
+    
+    check_status: function(frm) {
+        call_batch_method(frm, 'check_status', __('Checking batch status...'));
+    },
+    
+    cancel_batch: function(frm) {
+        frappe.confirm(__('Cancel this batch? Requests that already finished will still be applied.'), function() {
+            call_batch_method(frm, 'cancel_batch', __('Cancelling batch...'));
+        });
+    }
+});
+
+function call_batch_method(frm, method, message) {
+    frappe.call({
+        method: method,
+        doc: frm.doc,
+        freeze: true,
+        freeze_message: message,
+        callback: function(r) {
+            if (r.message && r.message.provider_status) {
+                frappe.show_alert({
+                    message: __('Provider status: {0}', [r.message.provider_status]),
+                    indicator: 'blue'
+                });
+            } else if (r.message && r.message.message) {
+                frappe.show_alert({message: r.message.message, indicator: 'green'});
+            }
+            frm.reload_doc();
+        }
+    });
+}
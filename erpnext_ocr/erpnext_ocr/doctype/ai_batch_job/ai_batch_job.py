@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import cint, now_datetime
+import base64
+import json
+import os
+from erpnext_ocr.erpnext_ocr import openai_compat
+from erpnext_ocr.erpnext_ocr.ai_router import get_active_settings_list
+from erpnext_ocr.erpnext_ocr.ai_usage import log_ai_call
+from erpnext_ocr.erpnext_ocr.doctype.ai_integration_settings.ai_integration_settings import get_prompt
+from erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read import get_classification_values
+from erpnext_ocr.erpnext_ocr.duplicate_index import _index_text
+from erpnext_ocr.erpnext_ocr.extraction_reuse import _index as _index_extraction
+from erpnext_ocr.erpnext_ocr.structured_output import get_response_format, parse_json_object
+from erpnext_ocr.erpnext_ocr.text_chunker import split_into_chunks, merge_extractions
+from erpnext_ocr.erpnext_ocr.token_budget import DEFAULT_MAX_TOKENS, get_input_budget
+
+# Providers implementing the /files + /batches API: (default base URL, default model)
+BATCH_PROVIDERS = {
+    "OpenAI": ("https://api.openai.com/v1", "gpt-4o"),
+    "Local Model": (openai_compat.DEFAULT_LOCAL_BASE_URL, openai_compat.DEFAULT_LOCAL_MODEL),
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.gif')
+DEFAULT_BATCH_LIMIT = 500
+UPDATE_CHUNK_SIZE = 100
+CUSTOM_ID_SEPARATOR = "::"
+
+# Provider batch states and the job status they end in
+FINAL_STATUSES = {
+    "completed": "Completed",
+    "failed": "Failed",
+    "expired": "Expired",
+    "cancelled": "Cancelled"
+}
+
+
+class AIBatchJob(Document):
+    def validate(self):
+        if self.ai_settings:
+            provider = frappe.db.get_value("AI Integration Settings", self.ai_settings, "ai_provider")
+            if provider not in BATCH_PROVIDERS:
+                frappe.throw(_("{0} does not support the Batch API. Use one of: {1}").format(
+                    provider, ", ".join(BATCH_PROVIDERS)))
+
+    @frappe.whitelist()
+    def submit_batch(self):
+        """Queue packing and submission of pending OCR Reads"""
+        if self.status != "Draft":
+            frappe.throw(_("Only draft batch jobs can be submitted"))
+
+        self.db_set("status", "Queued")
+        frappe.enqueue_doc(self.doctype, self.name, "_submit", queue="long", timeout=3600)
+        return {"status": "success", "message": _("Batch job queued for submission")}
+
+    def _submit(self):
+        """Pack pending OCR Reads into a JSONL file and start a provider batch"""
+        claimed = []
+        try:
+            settings = self._get_settings()
+            self.ai_settings = settings.name
+
+            lines = []
+            for name in self._get_pending_reads():
+                try:
+                    requests = self._build_requests(settings, frappe.get_doc("OCR Read", name))
+                except Exception as e:
+                    self.append("items", {"ocr_read": name, "status": "Failed", "error": str(e)})
+                    continue
+                self.append("items", {"ocr_read": name, "requests": len(requests), "status": "Pending"})
+                lines.extend(requests)
+
+            if not lines:
+                frappe.throw(_("No pending OCR Reads could be packed into a batch"))
+
+            # Claim the documents up front so that a concurrent job cannot pick them up
+            claimed = [item.ocr_read for item in self.items if item.status == "Pending"]
+            frappe.db.set_value("OCR Read", {"name": ["in", claimed]}, "ai_batch_job", self.name,
+                                update_modified=False)
+            frappe.db.commit()
+
+            base_url = BATCH_PROVIDERS[settings.ai_provider][0]
+            content = "\n".join(json.dumps(line) for line in lines).encode("utf-8")
+            self.input_file_id = openai_compat.upload_batch_file(settings, content, base_url)
+            batch = openai_compat.create_batch(settings, self.input_file_id, base_url,
+                                               metadata={"ai_batch_job": self.name})
+
+            self.provider_batch_id = batch["id"]
+            self.total_documents = len(claimed)
+            self.total_requests = len(lines)
+            self.submitted_on = now_datetime()
+            self.status = "In Progress"
+            self.save(ignore_permissions=True)
+        except Exception:
+            frappe.db.rollback()
+            self._release(claimed)
+            self.db_set({"status": "Failed", "error_log": frappe.get_traceback()})
+            frappe.db.commit()
+
+    def _get_settings(self):
+        if self.ai_settings:
+            return frappe.get_doc("AI Integration Settings", self.ai_settings)
+
+        for settings in get_active_settings_list():
+            if settings.ai_provider in BATCH_PROVIDERS:
+                return settings
+
+        frappe.throw(_("No active AI integration settings support the Batch API ({0})").format(
+            ", ".join(BATCH_PROVIDERS)))
+
+    def _get_pending_reads(self):
+        """Oldest OCR Reads that still need this task and are not in another batch"""
+        result_field = "detected_document_type" if self.prompt_type == "classification" else "ai_result"
+        return frappe.get_all(
+            "OCR Read",
+            filters={
+                "file_to_read": ["is", "set"],
+                result_field: ["is", "not set"],
+                "ai_batch_job": ["is", "not set"]
+            },
+            pluck="name",
+            order_by="creation asc",
+            limit=cint(self.batch_limit) or DEFAULT_BATCH_LIMIT
+        )
+
+    def _build_requests(self, settings, ocr_read):
+        """Batch request lines for one OCR Read: one per image, or one per text chunk"""
+        file_ext = os.path.splitext(ocr_read.file_to_read)[1].lower()
+
+        if file_ext in IMAGE_EXTENSIONS:
+            with open(frappe.get_site_path() + ocr_read.file_to_read, "rb") as image_file:
+                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+            prompt = get_prompt(settings, self.prompt_type)
+            return [self._make_request(settings, ocr_read.name, 1, openai_compat.build_messages(prompt, image_data))]
+
+        text_content = ocr_read._get_file_content_for_ai(file_ext)
+        chunks = split_into_chunks(text_content or "", get_input_budget(settings, self.prompt_type), settings.model_name)
+        if self.prompt_type == "classification":
+            # Classification only needs the start of the document
+            chunks = chunks[:1]
+
+        return [
+            self._make_request(settings, ocr_read.name, part, openai_compat.build_messages(
+                ocr_read._get_chunk_prompt(settings, chunk, self.prompt_type, part, len(chunks))))
+            for part, chunk in enumerate(chunks, 1)
+        ]
+
+    def _make_request(self, settings, ocr_read_name, part, messages):
+        body = {
+            "model": settings.model_name or BATCH_PROVIDERS[settings.ai_provider][1],
+            "messages": messages,
+            # A truncated reply cannot be retried inside the batch, so reserve the full cap
+            "max_tokens": cint(settings.max_tokens) or DEFAULT_MAX_TOKENS,
+            "temperature": settings.temperature or 0.1
+        }
+        response_format = get_response_format(settings, self.prompt_type)
+        if response_format:
+            body["response_format"] = response_format
+
+        return {
+            "custom_id": f"{ocr_read_name}{CUSTOM_ID_SEPARATOR}{part}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        }
+
+    @frappe.whitelist()
+    def check_status(self):
+        """Poll the provider and fan results back into the OCR Reads once the batch has finished"""
+        if self.status != "In Progress":
+            return {"status": self.status}
+
+        settings = frappe.get_doc("AI Integration Settings", self.ai_settings)
+        base_url = BATCH_PROVIDERS[settings.ai_provider][0]
+        batch = openai_compat.retrieve_batch(settings, self.provider_batch_id, base_url)
+
+        counts = batch.get("request_counts") or {}
+        self.completed_requests = cint(counts.get("completed"))
+        self.failed_requests = cint(counts.get("failed"))
+
+        provider_status = batch.get("status")
+        if provider_status not in FINAL_STATUSES:
+            self.save(ignore_permissions=True)
+            return {"status": self.status, "provider_status": provider_status}
+
+        # Expired and cancelled batches can still carry partial results
+        self.output_file_id = batch.get("output_file_id")
+        self.error_file_id = batch.get("error_file_id")
+        if self.output_file_id:
+            self._apply_results(settings, openai_compat.get_file_content(settings, self.output_file_id, base_url))
+        if self.error_file_id:
+            self._apply_results(settings, openai_compat.get_file_content(settings, self.error_file_id, base_url))
+
+        for item in self.items:
+            if item.status == "Pending":
+                item.status = "Failed"
+                item.error = _("No result returned by the provider (batch {0})").format(provider_status)
+
+        # Failed documents go back into the pending pool for the next batch
+        self._release([item.ocr_read for item in self.items if item.status == "Failed"])
+
+        if batch.get("errors"):
+            self.error_log = json.dumps(batch["errors"], indent=2)
+        self.status = FINAL_STATUSES[provider_status]
+        self.completed_on = now_datetime()
+        self.save(ignore_permissions=True)
+        return {"status": self.status, "provider_status": provider_status}
+
+    @frappe.whitelist()
+    def cancel_batch(self):
+        """Ask the provider to cancel the batch; finished requests are still applied"""
+        if self.status != "In Progress":
+            frappe.throw(_("Only running batch jobs can be cancelled"))
+
+        settings = frappe.get_doc("AI Integration Settings", self.ai_settings)
+        openai_compat.cancel_batch(settings, self.provider_batch_id, BATCH_PROVIDERS[settings.ai_provider][0])
+        return self.check_status()
+
+    def _apply_results(self, settings, output):
+        """Write the results of a batch output (or error) file to the OCR Reads in bulk"""
+        contents = {}
+        errors = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            name, _sep, part = (record.get("custom_id") or "").rpartition(CUSTOM_ID_SEPARATOR)
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+
+            reference = ("OCR Read", name)
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or body.get("error") or {}
+                errors[name] = error.get("message") or json.dumps(error)
+                log_ai_call(settings, self.prompt_type, status="Error", error=errors[name],
+                            reference=reference, bytes_sent=0)
+                continue
+
+            # Batch requests have no meaningful per-call latency
+            log_ai_call(settings, self.prompt_type, result=body, reference=reference, bytes_sent=0)
+
+            choice = body["choices"][0]
+            if choice.get("finish_reason") == "length":
+                errors[name] = _("Reply truncated at max_tokens")
+                continue
+            contents.setdefault(name, {})[cint(part)] = choice["message"]["content"]
+
+        # Parsing helpers on OCR Read do not touch document state
+        parser = frappe.new_doc("OCR Read")
+        updates = {}
+        for item in self.items:
+            if item.status != "Pending":
+                continue
+            if item.ocr_read in errors:
+                item.status = "Failed"
+                item.error = errors[item.ocr_read]
+                continue
+
+            parts = contents.get(item.ocr_read) or {}
+            if len(parts) < cint(item.requests):
+                # Remaining parts may still be in the error file
+                continue
+
+            updates[item.ocr_read] = self._get_field_values(parser, [parts[part] for part in sorted(parts)])
+            item.status = "Completed"
+
+        if updates:
+            frappe.db.bulk_update("OCR Read", updates, chunk_size=UPDATE_CHUNK_SIZE)
+            self._index_reads(list(updates))
+
+    def _index_reads(self, ocr_reads):
+        """Do the indexing OCR Read.on_update would have done, which the bulk update skips"""
+        for read in frappe.get_all("OCR Read", filters={"name": ["in", ocr_reads]},
+                                   fields=["name", "read_result", "ai_result"]):
+            _index_text(read.name, read.read_result)
+            _index_extraction(read.name, read.read_result if read.ai_result else None)
+
+    def _get_field_values(self, parser, contents):
+        """OCR Read field values from the reply of every part of one document"""
+        parsed = [parse_json_object(content) for content in contents]
+        all_json = all(isinstance(data, dict) for data in parsed)
+
+        if self.prompt_type == "classification":
+            classification_data = parsed[0] if all_json else parser._parse_classification_text(contents[0])
+            return get_classification_values(classification_data)
+
+        if self.prompt_type == "combined":
+            if all_json:
+                classification_data, extracted_data = parser._split_combined_result(merge_extractions(parsed))
+            else:
+                classification_data = parser._parse_classification_text(contents[0])
+                extracted_data = {"extracted_text": "\n".join(contents)}
+            values = get_classification_values(classification_data)
+            values["ai_result"] = json.dumps(extracted_data, indent=2)
+            return values
+
+        extracted_data = merge_extractions([
+            data if isinstance(data, dict) else {"extracted_text": content}
+            for data, content in zip(parsed, contents)
+        ])
+        return {"ai_result": json.dumps(extracted_data, indent=2)}
+
+    def _release(self, ocr_reads):
+        """Detach OCR Reads from this job so they can be picked up again"""
+        if ocr_reads:
+            frappe.db.set_value("OCR Read", {"name": ["in", ocr_reads], "ai_batch_job": self.name},
+                                "ai_batch_job", None, update_modified=False)
+
+
+def poll_ai_batch_jobs():
+    """Scheduler entry point: check every running batch job once"""
+    for name in frappe.get_all("AI Batch Job", filters={"status": "In Progress"}, pluck="name"):
+        try:
+            frappe.get_doc("AI Batch Job", name).check_status()
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), "AI Batch Job Poll Error")
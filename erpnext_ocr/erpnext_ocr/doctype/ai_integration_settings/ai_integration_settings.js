@@ -34,6 +34,8 @@ frappe.ui.form.on('AI Integration Settings', {
             frm.set_value('model_name', 'gemini-pro-vision');
         } else if (frm.doc.ai_provider === 'Anthropic Claude' && !frm.doc.model_name) {
             frm.set_value('model_name', 'claude-3-opus-20240229');
+        } else if (frm.doc.ai_provider === 'Local Model' && !frm.doc.base_url) {
+            frm.set_value('base_url', 'http://localhost:8000/v1');
         }
     },
     
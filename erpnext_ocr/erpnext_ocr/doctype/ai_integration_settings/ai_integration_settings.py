@@ -10,8 +10,20 @@ import json
 import base64
 import requests
 from datetime import datetime
+from erpnext_ocr.erpnext_ocr.ai_router import call_with_failover, get_routed_settings
+from erpnext_ocr.erpnext_ocr.token_budget import call_with_budget, count_tokens
+from erpnext_ocr.erpnext_ocr.openai_compat import build_messages, chat_completion, get_endpoint, get_headers, list_models
+from erpnext_ocr.erpnext_ocr.structured_output import get_response_format
 
 class AIIntegrationSettings(Document):
+    _api_key = None
+    
+    def get_api_key(self):
+        """Decrypted API key, memoized because active settings are cached per process"""
+        if self._api_key is None and self.api_key:
+            self._api_key = self.get_password("api_key", raise_exception=False)
+        return self._api_key
+    
     @frappe.whitelist()
     def test_connection(self):
         """Test AI provider connection"""
@@ -39,7 +51,7 @@ class AIIntegrationSettings(Document):
             return {"status": "error", "message": "API Key is required for OpenAI"}
         
         headers = {
-            "Authorization": f"Bearer {self.get_password('api_key')}",
+            "Authorization": f"Bearer {self.get_api_key()}",
             "Content-Type": "application/json"
         }
         
@@ -85,7 +97,7 @@ class AIIntegrationSettings(Document):
             return {"status": "error", "message": "API Key is required for Perplexity AI"}
         
         headers = {
-            "Authorization": f"Bearer {self.get_password('api_key')}",
+            "Authorization": f"Bearer {self.get_api_key()}",
             "Content-Type": "application/json"
         }
         
@@ -115,7 +127,7 @@ class AIIntegrationSettings(Document):
             return {"status": "error", "message": "API Key is required for OpenRouter"}
         
         headers = {
-            "Authorization": f"Bearer {self.get_password('api_key')}",
+            "Authorization": f"Bearer {self.get_api_key()}",
             "Content-Type": "application/json"
         }
         
@@ -141,8 +153,17 @@ class AIIntegrationSettings(Document):
     
     def _test_local_model(self):
         """Test local model connection"""
-        # Implement local model test
-        return {"status": "success", "message": "Local model connection test not implemented yet"}
+        try:
+            models = list_models(self)
+            self.last_tested = datetime.now()
+            self.test_status = "Success"
+            self.save()
+            return {
+                "status": "success",
+                "message": "Connection successful. Available models: {0}".format(", ".join(models) or "none reported")
+            }
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
 
 @frappe.whitelist()
 def test_ai_query(settings_name, query, query_type="Custom Query"):
@@ -168,6 +189,8 @@ def test_ai_query(settings_name, query, query_type="Custom Query"):
             result = _test_perplexity_query(settings, query)
         elif settings.ai_provider == "OpenRouter":
             result = _test_openrouter_query(settings, query)
+        elif settings.ai_provider == "Local Model":
+            result = _test_local_query(settings, query)
         else:
             return {"status": "error", "message": "Unsupported AI provider for testing"}
         
@@ -192,7 +215,7 @@ def test_ai_query(settings_name, query, query_type="Custom Query"):
 def _test_openai_query(settings, query):
     """Test query with OpenAI"""
     headers = {
-        "Authorization": f"Bearer {settings.get_password('api_key')}",
+        "Authorization": f"Bearer {settings.get_api_key()}",
         "Content-Type": "application/json"
     }
     
@@ -236,7 +259,7 @@ def _test_gemini_query(settings, query):
     try:
         import google.generativeai as genai
         
-        genai.configure(api_key=settings.get_password('api_key'))
+        genai.configure(api_key=settings.get_api_key())
         model = genai.GenerativeModel(settings.model_name or 'gemini-pro')
         
         response = model.generate_content(query)
@@ -256,7 +279,7 @@ def _test_claude_query(settings, query):
     try:
         import anthropic
         
-        client = anthropic.Anthropic(api_key=settings.get_password('api_key'))
+        client = anthropic.Anthropic(api_key=settings.get_api_key())
         
         message = client.messages.create(
             model=settings.model_name or "claude-3-opus-20240229",
@@ -283,7 +306,7 @@ def _test_claude_query(settings, query):
 def _test_perplexity_query(settings, query):
     """Test query with Perplexity AI"""
     headers = {
-        "Authorization": f"Bearer {settings.get_password('api_key')}",
+        "Authorization": f"Bearer {settings.get_api_key()}",
         "Content-Type": "application/json"
     }
     
@@ -325,7 +348,7 @@ def _test_perplexity_query(settings, query):
 def _test_openrouter_query(settings, query):
     """Test query with OpenRouter"""
     headers = {
-        "Authorization": f"Bearer {settings.get_password('api_key')}",
+        "Authorization": f"Bearer {settings.get_api_key()}",
         "Content-Type": "application/json"
     }
     
@@ -364,150 +387,162 @@ def _test_openrouter_query(settings, query):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def _test_local_query(settings, query):
+    """Test query with a local OpenAI-compatible model"""
+    try:
+        result = chat_completion(
+            settings,
+            get_endpoint(settings, "/chat/completions"),
+            get_headers(settings),
+            [
+                {
+                    "role": "system",
+                    "content": "You are a helpful AI assistant for document processing and OCR tasks. Provide clear, concise, and helpful responses."
+                },
+                {
+                    "role": "user",
+                    "content": query
+                }
+            ],
+            max_tokens=min(settings.max_tokens or 1000, 1000)  # Limit for testing
+        )
+        return {
+            "status": "success",
+            "response": result["content"],
+            "usage": result["usage"],
+            "model": result["model"]
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"Local Model API Error: {str(e)}"}
+
 @frappe.whitelist()
 def get_active_ai_settings():
-    """Get active AI integration settings"""
-    settings = frappe.get_all("AI Integration Settings", 
-                             filters={"is_active": 1}, 
-                             fields=["name", "title", "ai_provider", "model_name"],
-                             limit=1)
-    
-    if settings:
-        return frappe.get_doc("AI Integration Settings", settings[0].name)
-    return None
+    """Get the active AI integration settings that the router would use next"""
+    candidates = get_routed_settings()
+    return candidates[0] if candidates else None
+
+def get_prompt(settings, prompt_type, custom_prompt=None):
+    """Get the configured prompt for the given prompt type"""
+    if custom_prompt:
+        return custom_prompt
+    elif prompt_type == "classification":
+        return settings.classification_prompt
+    elif prompt_type == "extraction":
+        return settings.extraction_prompt
+    elif prompt_type == "combined":
+        # Records saved before the field existed fall back to its default in the DocType
+        return settings.combined_prompt or frappe.get_meta("AI Integration Settings").get_field("combined_prompt").default
+    else:
+        return settings.ocr_prompt
 
 @frappe.whitelist()
-def process_image_with_ai(image_path, prompt_type="ocr", custom_prompt=None):
-    """Process image with AI"""
-    settings = get_active_ai_settings()
-    if not settings:
-        frappe.throw(_("No active AI integration settings found"))
+def process_image_with_ai(image_path, prompt_type="ocr", custom_prompt=None, stream=None, reference=None):
+    """Process image with AI, failing over across active providers.
     
+    Pass a ``RealtimeStream`` as ``stream`` to relay the reply to the browser
+    while it is generated (OpenAI, OpenRouter and Local Model). ``reference``
+    is the ``(doctype, name)`` the call is logged against.
+    """
     try:
         # Read and encode image
         full_path = frappe.get_site_path() + image_path
         with open(full_path, "rb") as image_file:
             image_data = base64.b64encode(image_file.read()).decode('utf-8')
         
-        # Get appropriate prompt
-        if custom_prompt:
-            prompt = custom_prompt
-        elif prompt_type == "classification":
-            prompt = settings.classification_prompt
-        elif prompt_type == "extraction":
-            prompt = settings.extraction_prompt
-        else:
-            prompt = settings.ocr_prompt
+        def process(settings):
+            prompt = get_prompt(settings, prompt_type, custom_prompt)
+            response_format = get_response_format(settings, prompt_type)
+            
+            # Process based on provider
+            def call(max_tokens):
+                on_delta = None
+                if stream:
+                    # A retry or failover starts the reply over
+                    stream.restart()
+                    on_delta = stream.send
+                
+                if settings.ai_provider == "OpenAI":
+                    result = _process_with_openai(settings, image_data, prompt, max_tokens, on_delta, response_format)
+                elif settings.ai_provider == "Google Gemini":
+                    result = _process_with_gemini(settings, image_data, prompt, max_tokens)
+                elif settings.ai_provider == "Anthropic Claude":
+                    result = _process_with_claude(settings, image_data, prompt, max_tokens)
+                elif settings.ai_provider == "Perplexity AI":
+                    result = _process_with_perplexity(settings, image_data, prompt, max_tokens)
+                elif settings.ai_provider == "OpenRouter":
+                    result = _process_with_openrouter(settings, image_data, prompt, max_tokens, on_delta, response_format)
+                elif settings.ai_provider == "Local Model":
+                    result = _process_with_local(settings, image_data, prompt, max_tokens, on_delta, response_format)
+                else:
+                    frappe.throw(_("Unsupported AI provider: {0}").format(settings.ai_provider))
+                
+                if stream:
+                    stream.flush()
+                return result
+            
+            prompt_tokens = count_tokens(prompt, settings.model_name)
+            return call_with_budget(settings, prompt_type, prompt_tokens, call, has_image=True)
         
-        # Process based on provider
-        if settings.ai_provider == "OpenAI":
-            return _process_with_openai(settings, image_data, prompt)
-        elif settings.ai_provider == "Google Gemini":
-            return _process_with_gemini(settings, image_data, prompt)
-        elif settings.ai_provider == "Anthropic Claude":
-            return _process_with_claude(settings, image_data, prompt)
-        elif settings.ai_provider == "Perplexity AI":
-            return _process_with_perplexity(settings, image_data, prompt)
-        elif settings.ai_provider == "OpenRouter":
-            return _process_with_openrouter(settings, image_data, prompt)
-        else:
-            frappe.throw(_("Unsupported AI provider: {0}").format(settings.ai_provider))
+        return call_with_failover(process, capability="vision", prompt_type=prompt_type, reference=reference)
             
     except Exception as e:
         frappe.throw(_("Error processing image with AI: {0}").format(str(e)))
 
-def _process_with_openai(settings, image_data, prompt):
+def _process_with_openai(settings, image_data, prompt, max_tokens=None, on_delta=None, response_format=None):
     """Process image with OpenAI"""
-    headers = {
-        "Authorization": f"Bearer {settings.get_password('api_key')}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": settings.model_name or "gpt-4-vision-preview",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                    }
-                ]
-            }
-        ],
-        "max_tokens": settings.max_tokens or 4000,
-        "temperature": settings.temperature or 0.1
-    }
-    
-    url = settings.base_url or "https://api.openai.com/v1/chat/completions"
-    
-    response = requests.post(url, headers=headers, json=data, timeout=settings.timeout or 30)
-    
-    if response.status_code == 200:
-        result = response.json()
-        return {
-            "status": "success",
-            "content": result["choices"][0]["message"]["content"],
-            "usage": result.get("usage", {}),
-            "model": result.get("model", "")
-        }
-    else:
-        frappe.throw(_("OpenAI API Error: {0}").format(response.text))
+    return chat_completion(
+        settings,
+        settings.base_url or "https://api.openai.com/v1/chat/completions",
+        get_headers(settings),
+        build_messages(prompt, image_data),
+        max_tokens=max_tokens,
+        model=settings.model_name or "gpt-4-vision-preview",
+        stream=bool(on_delta),
+        on_delta=on_delta,
+        provider_label="OpenAI",
+        response_format=response_format
+    )
 
-def _process_with_gemini(settings, image_data, prompt):
+def _process_with_gemini(settings, image_data, prompt, max_tokens=None):
     """Process image with Google Gemini"""
     # Implement Gemini processing
     frappe.throw(_("Gemini processing not implemented yet"))
 
-def _process_with_claude(settings, image_data, prompt):
+def _process_with_claude(settings, image_data, prompt, max_tokens=None):
     """Process image with Anthropic Claude"""
     # Implement Claude processing
     frappe.throw(_("Claude processing not implemented yet"))
 
-def _process_with_perplexity(settings, image_data, prompt):
+def _process_with_perplexity(settings, image_data, prompt, max_tokens=None):
     """Process image with Perplexity AI"""
     # Note: Perplexity AI doesn't support vision/image processing yet
     # This is a text-only implementation for now
     frappe.throw(_("Perplexity AI does not currently support image processing. Please use OpenAI, Google Gemini, or Anthropic Claude for OCR tasks."))
 
-def _process_with_openrouter(settings, image_data, prompt):
+def _process_with_openrouter(settings, image_data, prompt, max_tokens=None, on_delta=None, response_format=None):
     """Process image with OpenRouter"""
-    headers = {
-        "Authorization": f"Bearer {settings.get_password('api_key')}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": settings.model_name or "google/gemini-2.5-flash-image-preview:free",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                    }
-                ]
-            }
-        ],
-        "max_tokens": settings.max_tokens or 4000,
-        "temperature": settings.temperature or 0.1
-    }
-    
-    url = settings.base_url or "https://openrouter.ai/api/v1/chat/completions"
-    
-    response = requests.post(url, headers=headers, json=data, timeout=settings.timeout or 30)
-    
-    if response.status_code == 200:
-        result = response.json()
-        return {
-            "status": "success",
-            "content": result["choices"][0]["message"]["content"],
-            "usage": result.get("usage", {}),
-            "model": result.get("model", "")
-        }
-    else:
-        frappe.throw(_("OpenRouter API Error: {0}").format(response.text))
\ No newline at end of file
+    return chat_completion(
+        settings,
+        settings.base_url or "https://openrouter.ai/api/v1/chat/completions",
+        get_headers(settings),
+        build_messages(prompt, image_data),
+        max_tokens=max_tokens,
+        model=settings.model_name or "google/gemini-2.5-flash-image-preview:free",
+        stream=bool(on_delta),
+        on_delta=on_delta,
+        provider_label="OpenRouter",
+        response_format=response_format
+    )
+
+def _process_with_local(settings, image_data, prompt, max_tokens=None, on_delta=None, response_format=None):
+    """Process image with a local OpenAI-compatible model"""
+    return chat_completion(
+        settings,
+        get_endpoint(settings, "/chat/completions"),
+        get_headers(settings),
+        build_messages(prompt, image_data),
+        max_tokens=max_tokens,
+        stream=bool(on_delta),
+        on_delta=on_delta,
+        response_format=response_format
+    )
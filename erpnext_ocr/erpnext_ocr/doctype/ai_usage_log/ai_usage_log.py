@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+from frappe.model.document import Document
+
+
+class AIUsageLog(Document):
+    """One AI provider call. Rows are bulk-inserted by ``ai_usage.flush_usage_log``"""
+    pass
@@ -0,0 +1,16 @@
+// Copyright (c) 2025, John Vincent Fiel and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('OCR Classification Settings', {
+    train_classifier: function(frm) {
+        frappe.call({
+            method: 'train_classifier',
+            doc: frm.doc,
+            callback: function(r) {
+                if (r.message) {
+                    frappe.show_alert({message: r.message.message, indicator: 'blue'});
+                }
+            }
+        });
+    }
+});
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class OCRClassificationSettings(Document):
+    def validate(self):
+        if not 0 < (self.confidence_threshold or 0) <= 1:
+            frappe.throw(_("Confidence Threshold must be between 0 and 1"))
+
+    @frappe.whitelist()
+    def train_classifier(self):
+        """Train the local classifier in the background"""
+        frappe.enqueue("erpnext_ocr.erpnext_ocr.local_classifier.train_and_save", queue="long", timeout=3600)
+        return {"status": "success", "message": _("Training queued. Results appear here when it finishes.")}
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class OCRFieldAlias(Document):
+    def validate(self):
+        self.extracted_key = (self.extracted_key or "").strip()
+        self.fieldname = (self.fieldname or "").strip()
+
+        if self.target_doctype and not frappe.get_meta(self.target_doctype).has_field(self.fieldname):
+            frappe.throw(_("{0} has no field {1}").format(self.target_doctype, self.fieldname))
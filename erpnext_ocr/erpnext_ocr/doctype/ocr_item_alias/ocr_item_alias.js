@@ -0,0 +1,8 @@
+// Copyright (c) 2025, John Vincent Fiel and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('OCR Item Alias', {
+    // refresh: function(frm) {
+
+    // }
+});
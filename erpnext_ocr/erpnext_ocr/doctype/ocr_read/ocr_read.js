@@ -82,13 +82,14 @@ frappe.ui.form.on('OCR Read', {
             return;
         }
         
-        frappe.show_progress(__('Processing'), 30, 100, __('Processing file with AI...'));
+        // Show the reply as it streams in; the saved result replaces it when the call returns
+        let stream = show_ai_stream_dialog(frm, __('Processing file with AI...'));
         
         frappe.call({
             method: 'read_with_ai',
             doc: frm.doc,
             callback: function(r) {
-                frappe.hide_progress();
+                stream.close();
                 console.log('AI processing response:', r);
                 
                 if (r.message && r.message.status === 'success') {
@@ -105,7 +106,7 @@ frappe.ui.form.on('OCR Read', {
                 }
             },
             error: function(r) {
-                frappe.hide_progress();
+                stream.close();
                 console.error('AI processing error:', r);
                 let error_msg = 'Unknown error';
                 if (r.responseJSON && r.responseJSON.message) {
@@ -160,6 +161,77 @@ frappe.ui.form.on('OCR Read', {
         });
     },
     
+    auto_process: function(frm) {
+        if (!frm.doc.file_to_read) {
+            frappe.msgprint(__('Please select a file first'));
+            return;
+        }
+        
+        frappe.show_progress(__('Processing'), 40, 100, __('Trying the cheapest stage first...'));
+        
+        frappe.call({
+            method: 'auto_process',
+            doc: frm.doc,
+            callback: function(r) {
+                frappe.hide_progress();
+                
+                if (r.message && r.message.status === 'success') {
+                    frappe.show_alert({
+                        message: r.message.accepted
+                            ? __('Resolved by the {0} stage with {1} AI call(s)', [r.message.stage, r.message.ai_calls])
+                            : __('No stage met the thresholds; kept the {0} result', [r.message.stage]),
+                        indicator: r.message.accepted ? 'green' : 'orange'
+                    });
+                    frm.refresh();
+                    
+                    show_classification_results(frm, r.message.classification);
+                }
+            },
+            error: function(r) {
+                frappe.hide_progress();
+            }
+        });
+    },
+    
+    classify_and_extract: function(frm) {
+        if (!frm.doc.file_to_read) {
+            frappe.msgprint(__('Please select a file first'));
+            return;
+        }
+        
+        frappe.show_progress(__('Processing'), 40, 100, __('Classifying and extracting in one pass...'));
+        
+        frappe.call({
+            method: 'classify_and_extract',
+            doc: frm.doc,
+            callback: function(r) {
+                frappe.hide_progress();
+                
+                if (r.message && r.message.status === 'success') {
+                    frappe.show_alert({
+                        message: __('Classification and extraction completed'),
+                        indicator: 'green'
+                    });
+                    frm.refresh();
+                    
+                    show_classification_results(frm, r.message.classification);
+                } else {
+                    frappe.msgprint(__('AI processing failed or returned no data'));
+                }
+            },
+            error: function(r) {
+                frappe.hide_progress();
+                let error_msg = 'Unknown error';
+                if (r.responseJSON && r.responseJSON.message) {
+                    error_msg = r.responseJSON.message;
+                } else if (r.message) {
+                    error_msg = r.message;
+                }
+                frappe.msgprint(__('Error processing file with AI: {0}', [error_msg]));
+            }
+        });
+    },
+    
     proceed_with_doctype: function(frm) {
         if (!frm.doc.detected_document_type && !frm.doc.suggested_doctype) {
             frappe.msgprint(__('Please run document classification first to detect document type'));
@@ -184,6 +256,7 @@ frappe.ui.form.on('OCR Read', {
                     
                     // Navigate to new document with OCR data
                     frappe.set_route('Form', r.message.doctype, 'new');
+                    warn_about_duplicates(r.message.duplicates);
                     
                 } else {
                     frappe.msgprint(__('Failed to prepare document data. Please check the error logs.'));
@@ -249,6 +322,44 @@ function get_image_preview_html(file_url) {
     `;
 }
 
+function show_ai_stream_dialog(frm, title) {
+    // Streamed text per chunk, relayed by the server through publish_realtime
+    let parts = {};
+    let dialog = new frappe.ui.Dialog({
+        title: title,
+        fields: [{fieldname: 'stream_html', fieldtype: 'HTML'}]
+    });
+    let $output = $('<pre style="max-height: 400px; overflow: auto; white-space: pre-wrap;"></pre>')
+        .text(__('Waiting for the AI provider...'));
+    dialog.fields_dict.stream_html.$wrapper.append($output);
+    dialog.show();
+    
+    let handler = function(data) {
+        if (data.name !== frm.doc.name) {
+            return;
+        }
+        if (data.restart) {
+            parts[data.part] = '';
+        } else if (data.delta) {
+            parts[data.part] = (parts[data.part] || '') + data.delta;
+        } else {
+            return;
+        }
+        let text = Object.keys(parts).sort(function(a, b) { return a - b; })
+            .map(function(part) { return parts[part]; }).join('\n');
+        $output.text(text);
+        $output.scrollTop($output[0].scrollHeight);
+    };
+    frappe.realtime.on('ocr_ai_stream', handler);
+    
+    return {
+        close: function() {
+            frappe.realtime.off('ocr_ai_stream', handler);
+            dialog.hide();
+        }
+    };
+}
+
 function show_ai_data_dialog(frm) {
     if (!frm.doc.ai_result) {
         frappe.msgprint(__('No AI data available'));
@@ -307,6 +418,41 @@ function show_classification_results(frm, classification) {
     });
 }
 
+function warn_about_duplicates(duplicates) {
+    if (!duplicates || (!duplicates.documents.length && !duplicates.ocr_reads.length)) return;
+    
+    let lines = duplicates.documents.map(function(duplicate) {
+        return `<li>${__(duplicate.doctype)} <a href="/app/${frappe.router.slug(duplicate.doctype)}/${encodeURIComponent(duplicate.name)}">${frappe.utils.escape_html(duplicate.name)}</a> (${__('same {0}', [duplicate.matched_on])})</li>`;
+    }).concat(duplicates.ocr_reads.map(function(similar) {
+        return `<li>${__('OCR Read')} <a href="/app/ocr-read/${encodeURIComponent(similar.ocr_read)}">${frappe.utils.escape_html(similar.ocr_read)}</a> (${__('near-identical text')})</li>`;
+    }));
+    
+    frappe.msgprint({
+        title: __('Possible Duplicate'),
+        message: `<p>${__('This document may already have been entered:')}</p><ul>${lines.join('')}</ul>`,
+        indicator: 'orange'
+    });
+}
+
+function describe_match(match) {
+    let score = __('{0}% match', [Math.round(match.score * 100)]);
+    if (match.runner_up) {
+        score += ', ' + __('next best {0}%', [Math.round(match.runner_up * 100)]);
+    }
+    return `${__('by {0}', [__(match.matched_on.replace('_', ' '))])}, ${score}`;
+}
+
+function describe_item_match(match) {
+    if (!match) {
+        return '-';
+    }
+    if (match.confident) {
+        return `<small class="text-muted">${describe_match(match)}</small>`;
+    }
+    return `<span class="badge badge-warning">${__('Not Set')}</span>
+        <small class="text-muted">${__('closest: {0}', [frappe.utils.escape_html(match.item)])}, ${describe_match(match)}</small>`;
+}
+
 function show_document_preview_dialog(frm, data) {
     let preview_html = `
         <div class="document-preview">
@@ -335,6 +481,9 @@ function show_document_preview_dialog(frm, data) {
         let status_badge = field.mapped ? 
             '<span class="badge badge-success">Mapped</span>' : 
             '<span class="badge badge-secondary">Default</span>';
+        if (field.match) {
+            status_badge += ` <small class="text-muted">${describe_match(field.match)}</small>`;
+        }
         
         preview_html += `
             <tr>
@@ -345,40 +494,19 @@ function show_document_preview_dialog(frm, data) {
         `;
     });
     
-    preview_html += '</tbody></table>';
+    // Links left empty because no match was certain enough
+    (data.unresolved_links || []).forEach(function(match) {
+        preview_html += `
+            <tr>
+                <td><strong>${__(match.label)}</strong></td>
+                <td>${frappe.utils.escape_html(match.text)}</td>
+                <td><span class="badge badge-warning">${__('Not Set')}</span>
+                    <small class="text-muted">${__('closest: {0}', [frappe.utils.escape_html(match.party)])}, ${describe_match(match)}</small></td>
+            </tr>
+        `;
+    });
     
-    // Add items preview if available
-    if (data.items_preview && data.items_preview.length > 0) {
-        preview_html += `<h5>${__('Items Preview')}</h5>`;
-        preview_html += '<table class="table table-bordered table-sm"><thead><tr>';
-        
-        // Get item field headers
-        let item_fields = [];
-        if (data.items_preview[0]) {
-            Object.keys(data.items_preview[0]).forEach(function(key) {
-                if (key !== 'row_index') {
-                    item_fields.push(key);
-                    preview_html += `<th>${data.items_preview[0][key].label || key}</th>`;
-                }
-            });
-        }
-        preview_html += '</tr></thead><tbody>';
-        
-        // Add item rows
-        data.items_preview.forEach(function(item) {
-            preview_html += '<tr>';
-            item_fields.forEach(function(field) {
-                if (item[field]) {
-                    preview_html += `<td>${item[field].value}</td>`;
-                } else {
-                    preview_html += '<td>-</td>';
-                }
-            });
-            preview_html += '</tr>';
-        });
-        
-        preview_html += '</tbody></table>';
-    }
+    preview_html += '</tbody></table>';
     
     preview_html += '</div>';
     
@@ -391,15 +519,24 @@ function show_document_preview_dialog(frm, data) {
                 fieldname: 'preview_content',
                 options: preview_html
             },
+            {
+                fieldtype: 'HTML',
+                fieldname: 'items_preview'
+            },
             {
                 fieldtype: 'Section Break'
             },
             {
-                fieldtype: 'Select',
+                fieldtype: 'Link',
                 fieldname: 'target_doctype',
                 label: __('Change Document Type'),
-                options: data.available_doctypes.map(dt => dt.name).join('\n'),
-                default: data.doctype
+                options: 'DocType',
+                default: data.doctype,
+                get_query: function() {
+                    return {
+                        query: 'erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read.search_doctypes'
+                    };
+                }
             }
         ],
         primary_action_label: __('Create Document'),
@@ -451,6 +588,67 @@ function show_document_preview_dialog(frm, data) {
     });
     
     dialog.show();
+    render_items_preview_page(frm, dialog, data);
+}
+
+function render_items_preview_page(frm, dialog, data) {
+    let wrapper = dialog.fields_dict.items_preview.$wrapper;
+    if (!data.items_count) {
+        wrapper.empty();
+        return;
+    }
+    
+    let item_fields = Object.keys(data.item_fields || {});
+    let first = data.items_start + 1;
+    let last = data.items_start + data.items_preview.length;
+    
+    let html = `<h5>${__('Items Preview')} <small>${__('{0}-{1} of {2}', [first, last, data.items_count])}</small></h5>`;
+    html += '<table class="table table-bordered table-sm"><thead><tr><th>#</th>';
+    item_fields.forEach(function(field) {
+        html += `<th>${data.item_fields[field].label || field}</th>`;
+    });
+    html += `<th>${__('Item Match')}</th></tr></thead><tbody>`;
+    
+    data.items_preview.forEach(function(item) {
+        html += `<tr><td>${item.row_index}</td>`;
+        item_fields.forEach(function(field) {
+            html += `<td>${item[field] !== undefined ? frappe.utils.escape_html(item[field]) : '-'}</td>`;
+        });
+        html += `<td>${describe_item_match(item.item_match)}</td></tr>`;
+    });
+    html += '</tbody></table>';
+    
+    html += `
+        <div class="text-right">
+            <button class="btn btn-xs btn-default items-prev" ${data.items_start > 0 ? '' : 'disabled'}>${__('Previous')}</button>
+            <button class="btn btn-xs btn-default items-next" ${last < data.items_count ? '' : 'disabled'}>${__('Next')}</button>
+        </div>
+    `;
+    wrapper.html(html);
+    
+    let load_page = function(start) {
+        // The mapping is cached on the server, so a page costs only its own rows
+        frappe.call({
+            method: 'preview_document_creation',
+            doc: frm.doc,
+            args: {
+                target_doctype: data.doctype,
+                items_start: start,
+                items_page_length: data.items_page_length
+            },
+            callback: function(r) {
+                if (r.message && r.message.status === 'success') {
+                    render_items_preview_page(frm, dialog, r.message);
+                }
+            }
+        });
+    };
+    wrapper.find('.items-prev').on('click', function() {
+        load_page(Math.max(data.items_start - data.items_page_length, 0));
+    });
+    wrapper.find('.items-next').on('click', function() {
+        load_page(data.items_start + data.items_page_length);
+    });
 }
 
 function show_document_creation_dialog(frm, data) {
@@ -0,0 +1,121 @@
+// Copyright (c) 2025, John Vincent Fiel and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['OCR Read'] = {
+    onload: function(listview) {
+        listview.page.add_actions_menu_item(__('Create Documents'), function() {
+            create_documents_from_selection(listview);
+        });
+    }
+};
+
+function create_documents_from_selection(listview) {
+    let names = listview.get_checked_items(true);
+    if (!names.length) {
+        frappe.msgprint(__('Select the OCR Reads to convert'));
+        return;
+    }
+
+    let dialog = new frappe.ui.Dialog({
+        title: __('Create Documents from {0} OCR Reads', [names.length]),
+        fields: [
+            {
+                fieldtype: 'Link',
+                fieldname: 'target_doctype',
+                label: __('Document Type'),
+                options: 'DocType',
+                reqd: 1,
+                get_query: function() {
+                    return {
+                        query: 'erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read.search_doctypes'
+                    };
+                }
+            }
+        ],
+        primary_action_label: __('Create'),
+        primary_action: function(values) {
+            dialog.hide();
+
+            frappe.call({
+                method: 'erpnext_ocr.erpnext_ocr.document_batch.create_documents_from_ocr',
+                args: {
+                    ocr_read_names: names,
+                    target_doctype: values.target_doctype
+                },
+                freeze: true,
+                freeze_message: __('Creating documents...'),
+                callback: function(r) {
+                    if (!r.message) return;
+
+                    if (r.message.status === 'Queued') {
+                        follow_document_batch(r.message.batch_id);
+                    } else {
+                        show_document_batch_results(r.message);
+                    }
+                    listview.clear_checked_items();
+                }
+            });
+        }
+    });
+
+    dialog.show();
+}
+
+function follow_document_batch(batch_id) {
+    frappe.show_alert({
+        message: __('Document creation queued. Progress is shown as documents are created.'),
+        indicator: 'blue'
+    });
+
+    let handler = function(data) {
+        if (data.batch_id !== batch_id) return;
+
+        let done = data.created + (data.duplicates || 0) + data.failed;
+        frappe.show_progress(__('Creating Documents'), done, data.total,
+            __('{0} created, {1} duplicates skipped, {2} failed', [data.created, data.duplicates || 0, data.failed]));
+
+        if (data.status === 'Completed' || data.status === 'Failed') {
+            frappe.realtime.off('ocr_document_batch_progress', handler);
+            frappe.hide_progress();
+            frappe.call({
+                method: 'erpnext_ocr.erpnext_ocr.document_batch.get_document_batch',
+                args: {batch_id: batch_id},
+                callback: function(r) {
+                    if (r.message) show_document_batch_results(r.message);
+                }
+            });
+        }
+    };
+    frappe.realtime.on('ocr_document_batch_progress', handler);
+}
+
+function show_document_batch_results(summary) {
+    let rows = (summary.results || []).map(function(result) {
+        let outcome;
+        if (result.status === 'Created') {
+            outcome = `<a href="/app/${frappe.router.slug(summary.target_doctype)}/${encodeURIComponent(result.name)}">${frappe.utils.escape_html(result.name)}</a>`;
+        } else if (result.status === 'Duplicate') {
+            outcome = `<span class="text-warning">${__('Skipped, likely duplicate of {0}',
+                [result.duplicate_of.map(function(duplicate) { return frappe.utils.escape_html(duplicate.name); }).join(', ')])}</span>`;
+        } else {
+            outcome = `<span class="text-danger">${frappe.utils.escape_html(result.error || '')}</span>`;
+        }
+        return `<tr><td>${frappe.utils.escape_html(result.ocr_read)}</td><td>${outcome}</td></tr>`;
+    }).join('');
+
+    let message = `
+        <p>${__('{0} created, {1} duplicates skipped, {2} failed in {3}s ({4} documents/s)',
+            [summary.created, summary.duplicates || 0, summary.failed, summary.duration || 0, summary.documents_per_second || 0])}</p>
+        ${summary.error ? `<p class="text-danger">${frappe.utils.escape_html(summary.error)}</p>` : ''}
+        <table class="table table-bordered table-condensed">
+            <thead><tr><th>${__('OCR Read')}</th><th>${__('Result')}</th></tr></thead>
+            <tbody>${rows}</tbody>
+        </table>
+    `;
+    frappe.msgprint({
+        title: __('Document Creation {0}', [__(summary.status)]),
+        message: message,
+        indicator: (summary.failed || summary.duplicates) ? 'orange' : 'green',
+        wide: true
+    });
+}
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Create documents of one DocType from many OCR Reads.
+
+The extracted data of every OCR Read is read in one query, mapped through
+the cached mapping plan and party/item indexes, and inserted in chunks.
+Each chunk is committed as one transaction. A document that fails is rolled
+back to its savepoint without losing the rest of its chunk. Likely
+duplicates, including of documents created earlier in the same batch, are
+skipped unless asked otherwise. Small batches run in the request. Larger
+ones run as a background job that publishes its progress and keeps the
+results in the cache for the caller to fetch.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import json
+import time
+from frappe import _
+from frappe.utils import cint, flt
+
+from erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read import build_document_from_ai_data, confirm_classification
+from erpnext_ocr.erpnext_ocr.duplicate_index import find_duplicate_documents, find_similar_ocr_reads
+from erpnext_ocr.erpnext_ocr.item_index import remember_item_sources
+
+CHUNK_SIZE = 50
+INLINE_LIMIT = 20
+MAX_DOCUMENTS = 5000
+RESULT_TTL = 24 * 60 * 60
+
+RESULT_KEY = "ocr_document_batch:{0}"
+PROGRESS_EVENT = "ocr_document_batch_progress"
+
+
+def create_documents(ocr_read_names, target_doctype, field_mapping=None, ignore_duplicates=False,
+                     chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Insert one document per OCR Read, committing every ``chunk_size`` documents
+
+    Returns a summary with a result per OCR Read (in the given order) and the
+    throughput. ``on_chunk(summary)`` is called after each commit.
+    """
+    if isinstance(field_mapping, str):
+        field_mapping = json.loads(field_mapping)
+
+    reads = {
+        row.name: row
+        for row in frappe.get_list("OCR Read", filters={"name": ["in", ocr_read_names]},
+                                   fields=["name", "ai_result", "read_result"])
+    }
+
+    start = time.time()
+    summary = {"target_doctype": target_doctype, "total": len(ocr_read_names), "created": 0, "duplicates": 0,
+               "failed": 0, "results": []}
+
+    for offset in range(0, len(ocr_read_names), chunk_size):
+        for ocr_read_name in ocr_read_names[offset:offset + chunk_size]:
+            summary["results"].append(_create_document(ocr_read_name, reads.get(ocr_read_name),
+                                                       target_doctype, field_mapping, ignore_duplicates))
+        frappe.db.commit()
+
+        for status, key in (("Created", "created"), ("Duplicate", "duplicates"), ("Failed", "failed")):
+            summary[key] = sum(1 for result in summary["results"] if result["status"] == status)
+        summary["duration"] = flt(time.time() - start, 3)
+        summary["documents_per_second"] = flt(len(summary["results"]) / summary["duration"], 2) \
+            if summary["duration"] else 0.0
+        if on_chunk:
+            on_chunk(summary)
+
+    return summary
+
+
+def _create_document(ocr_read_name, ocr_read, target_doctype, field_mapping, ignore_duplicates):
+    if not ocr_read or not ocr_read.ai_result:
+        return {"ocr_read": ocr_read_name, "status": "Failed",
+                "error": _("OCR Read not found or has no AI extracted data")}
+
+    result = {"ocr_read": ocr_read_name}
+    similar = find_similar_ocr_reads(ocr_read_name, ocr_read.read_result)
+    if similar:
+        result["similar_ocr_reads"] = similar
+
+    savepoint = "ocr_document_batch"
+    frappe.db.savepoint(savepoint)
+    try:
+        new_doc = build_document_from_ai_data(target_doctype, json.loads(ocr_read.ai_result), field_mapping)
+        duplicates = None if ignore_duplicates else find_duplicate_documents(target_doctype, new_doc)
+        if duplicates:
+            return dict(result, status="Duplicate", duplicate_of=duplicates)
+        new_doc.insert()
+        remember_item_sources(new_doc)
+        confirm_classification(ocr_read_name, target_doctype)
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        frappe.clear_messages()
+        return dict(result, status="Failed", error=str(e))
+
+    return dict(result, status="Created", name=new_doc.name)
+
+
+@frappe.whitelist()
+def create_documents_from_ocr(ocr_read_names, target_doctype, field_mapping=None, ignore_duplicates=False):
+    """Create a document per OCR Read; batches over the inline limit are queued as a background job"""
+    ocr_read_names = frappe.parse_json(ocr_read_names) if isinstance(ocr_read_names, str) else ocr_read_names
+    # Keep the given order, once per name
+    ocr_read_names = list(dict.fromkeys(ocr_read_names or []))
+
+    if not ocr_read_names:
+        frappe.throw(_("Select at least one OCR Read"))
+    if len(ocr_read_names) > MAX_DOCUMENTS:
+        frappe.throw(_("At most {0} OCR Reads can be converted at once").format(MAX_DOCUMENTS))
+    if not frappe.db.exists("DocType", target_doctype):
+        frappe.throw(_("DocType '{0}' does not exist").format(target_doctype))
+    frappe.has_permission("OCR Read", "read", throw=True)
+    frappe.has_permission(target_doctype, "create", throw=True)
+
+    ignore_duplicates = cint(ignore_duplicates)
+    if len(ocr_read_names) <= INLINE_LIMIT:
+        return dict(create_documents(ocr_read_names, target_doctype, field_mapping, ignore_duplicates),
+                    status="Completed")
+
+    batch_id = frappe.generate_hash(length=10)
+    _set_result(batch_id, {"status": "Queued", "target_doctype": target_doctype, "total": len(ocr_read_names),
+                           "created": 0, "duplicates": 0, "failed": 0})
+    frappe.enqueue(
+        "erpnext_ocr.erpnext_ocr.document_batch.run_document_batch",
+        queue="long",
+        timeout=max(1500, len(ocr_read_names) * 2),
+        batch_id=batch_id,
+        ocr_read_names=ocr_read_names,
+        target_doctype=target_doctype,
+        field_mapping=field_mapping,
+        ignore_duplicates=ignore_duplicates
+    )
+    return {"status": "Queued", "batch_id": batch_id, "total": len(ocr_read_names)}
+
+
+def run_document_batch(batch_id, ocr_read_names, target_doctype, field_mapping=None, ignore_duplicates=False):
+    """Background job for create_documents_from_ocr"""
+    def on_chunk(summary):
+        progress = dict(summary, status="In Progress", results=None)
+        _set_result(batch_id, progress)
+        frappe.publish_realtime(PROGRESS_EVENT, dict(progress, batch_id=batch_id), user=frappe.session.user)
+
+    try:
+        summary = dict(create_documents(ocr_read_names, target_doctype, field_mapping, ignore_duplicates,
+                                        on_chunk=on_chunk), status="Completed")
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), "OCR Document Batch Error")
+        summary = dict(_get_result(batch_id) or {}, status="Failed",
+                       error=_("The batch stopped unexpectedly. Chunks committed so far are kept."))
+
+    _set_result(batch_id, summary)
+    frappe.publish_realtime(PROGRESS_EVENT, dict(summary, batch_id=batch_id, results=None), user=frappe.session.user)
+
+
+@frappe.whitelist()
+def get_document_batch(batch_id):
+    """Progress, and once finished the per-document results, of a queued batch"""
+    result = _get_result(batch_id)
+    if not result:
+        frappe.throw(_("Batch {0} not found or expired").format(batch_id))
+    if result.get("user") != frappe.session.user and "System Manager" not in frappe.get_roles():
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    return result
+
+
+def _get_result(batch_id):
+    return frappe.cache().get_value(RESULT_KEY.format(batch_id))
+
+
+def _set_result(batch_id, result):
+    result = dict(result, user=frappe.session.user)
+    result["results"] = result.get("results") or []
+    frappe.cache().set_value(RESULT_KEY.format(batch_id), result, expires_in_sec=RESULT_TTL)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Likely duplicates of a supplier bill, found before a document is created.
+
+Two indexes live in Redis, so every check costs a few hash lookups however
+many invoices there are:
+
+- Invoice keys: every Purchase Invoice is indexed by (supplier, normalized
+  bill number) and by (supplier, bill date, grand total), kept current by
+  document hooks. The supplier is taken both as the Link and as the
+  normalized supplier name, so a bill whose supplier could not be matched to
+  a Supplier is still checked by the name read from it. A hit is confirmed
+  by reading that one invoice by name, which also drops keys left behind by
+  edits.
+- Text SimHash: a 64-bit SimHash of the word pairs of each OCR Read's text,
+  split into six bands. Texts within five bits of each other (the same
+  document read twice, with some OCR noise) share at least one band, so only
+  reads sharing a band are compared. Different bills on the same template
+  are typically more than a dozen bits apart.
+
+The indexes are built once in the background when first needed (or with
+``bench ocr-rebuild-duplicate-index``).
+"""
+
+from __future__ import unicode_literals
+import frappe
+import hashlib
+import re
+from frappe import _
+from frappe.utils import flt, getdate
+
+from erpnext_ocr.erpnext_ocr.item_index import normalize_code
+from erpnext_ocr.erpnext_ocr.party_index import normalize_name
+
+# DocType -> (party field, party name field, bill number field, date fields in order of preference)
+INDEXED_DOCTYPES = {
+    "Purchase Invoice": ("supplier", "supplier_name", "bill_no", ("bill_date", "posting_date"))
+}
+
+INVOICE_KEYS = "ocr_invoice_keys"
+SIMHASH_VALUES = "ocr_simhash_values"
+SIMHASH_BAND_KEY = "ocr_simhash_band:{0}:{1}"
+# Versioned so sites indexed before invoices were also keyed by party name rebuild once
+INDEX_STATE_KEY = "ocr_duplicate_index_state:2"
+
+SIMHASH_BITS = 64
+BAND_SIZES = (11, 11, 11, 11, 10, 10)
+MAX_TEXT_DISTANCE = len(BAND_SIZES) - 1
+SHINGLE_SIZE = 2
+MIN_SHINGLES = 5
+REBUILD_PAGE_SIZE = 1000
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _party_keys(values, party_field, name_field):
+    """Normalized party Link and party name, once each; the name stands in for an empty Link"""
+    parties = []
+    for value in (values.get(party_field), values.get(name_field)):
+        party = normalize_name(value) if isinstance(value, str) else None
+        if party and party not in parties:
+            parties.append(party)
+    return parties
+
+
+def get_invoice_keys(doctype, values):
+    """Index keys for a document or a dict of its field values"""
+    party_field, name_field, bill_field, date_fields = INDEXED_DOCTYPES[doctype]
+    parties = _party_keys(values, party_field, name_field)
+    if not parties:
+        return []
+
+    bill_no = normalize_code(values.get(bill_field))
+    date = next((values.get(field) for field in date_fields if values.get(field)), None)
+    total = flt(values.get("grand_total"), 2)
+
+    keys = []
+    for party in parties:
+        if bill_no:
+            keys.append("bill|{0}|{1}".format(party, bill_no))
+        if date and total:
+            keys.append("amount|{0}|{1}|{2:.2f}".format(party, getdate(date).isoformat(), total))
+    return keys
+
+
+def get_shingles(text):
+    """64-bit hashes of the word pairs of a text, or None for too little text"""
+    words = _WORD.findall((text or "").lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    return [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in shingles]
+
+
+def simhash(text):
+    """64-bit SimHash of the word shingles of a text, or None for too little text"""
+    shingles = get_shingles(text)
+    if shingles is None:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for value in shingles:
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _bands(value):
+    bands = []
+    for band, size in enumerate(BAND_SIZES):
+        bands.append((band, value & ((1 << size) - 1)))
+        value >>= size
+    return bands
+
+
+def _band_member(name, value):
+    # Members carry their hash so a lookup needs no second read
+    return "{0}|{1:x}".format(name, value)
+
+
+def _ensure_index():
+    """Queue the one-time build of both indexes if they have never been built"""
+    cache = frappe.cache()
+    if cache.get(cache.make_key(INDEX_STATE_KEY)):
+        return
+    # Claim the build for an hour so concurrent checks queue it only once
+    if cache.set(cache.make_key(INDEX_STATE_KEY), "building", nx=True, ex=3600):
+        frappe.enqueue("erpnext_ocr.erpnext_ocr.duplicate_index.rebuild_index", queue="long", timeout=3600)
+
+
+def rebuild_index():
+    """Index every Purchase Invoice and OCR Read text; the only pass that scans them"""
+    cache = frappe.cache()
+    for doctype, (party_field, name_field, bill_field, date_fields) in INDEXED_DOCTYPES.items():
+        fields = ["name", party_field, name_field, bill_field, "grand_total"] + list(date_fields)
+        start = 0
+        while True:
+            rows = frappe.get_all(doctype, filters={"docstatus": ["<", 2]}, fields=fields,
+                                  order_by="creation asc", start=start, page_length=REBUILD_PAGE_SIZE)
+            for row in rows:
+                for key in get_invoice_keys(doctype, row):
+                    cache.hset(INVOICE_KEYS, key, (doctype, row.name))
+            if len(rows) < REBUILD_PAGE_SIZE:
+                break
+            start += REBUILD_PAGE_SIZE
+
+    start = 0
+    while True:
+        rows = frappe.get_all("OCR Read", filters={"read_result": ["is", "set"]}, fields=["name", "read_result"],
+                              order_by="creation asc", start=start, page_length=REBUILD_PAGE_SIZE)
+        for row in rows:
+            _index_text(row.name, row.read_result)
+        if len(rows) < REBUILD_PAGE_SIZE:
+            break
+        start += REBUILD_PAGE_SIZE
+
+    cache.set(cache.make_key(INDEX_STATE_KEY), "built")
+
+
+def index_invoice(doc, method=None):
+    """Purchase Invoice after_insert and on_update"""
+    for key in get_invoice_keys(doc.doctype, doc):
+        frappe.cache().hset(INVOICE_KEYS, key, (doc.doctype, doc.name))
+
+
+def unindex_invoice(doc, method=None):
+    """Purchase Invoice on_cancel and on_trash"""
+    cache = frappe.cache()
+    for key in get_invoice_keys(doc.doctype, doc):
+        if cache.hget(INVOICE_KEYS, key) == (doc.doctype, doc.name):
+            cache.hdel(INVOICE_KEYS, key)
+
+
+def _index_text(name, text):
+    _unindex_text(name)
+    value = simhash(text)
+    if value is None:
+        return
+    cache = frappe.cache()
+    cache.hset(SIMHASH_VALUES, name, value)
+    for band, band_value in _bands(value):
+        cache.sadd(SIMHASH_BAND_KEY.format(band, band_value), _band_member(name, value))
+
+
+def _unindex_text(name):
+    cache = frappe.cache()
+    value = cache.hget(SIMHASH_VALUES, name)
+    if value is None:
+        return
+    for band, band_value in _bands(value):
+        cache.srem(SIMHASH_BAND_KEY.format(band, band_value), _band_member(name, value))
+    cache.hdel(SIMHASH_VALUES, name)
+
+
+def index_ocr_text(doc):
+    """Keep an OCR Read's SimHash current (OCR Read on_update)"""
+    if doc.has_value_changed("read_result"):
+        _index_text(doc.name, doc.read_result)
+
+
+def unindex_ocr_text(doc):
+    """OCR Read on_trash"""
+    _unindex_text(doc.name)
+
+
+def find_duplicate_documents(doctype, values, exclude=None):
+    """Existing documents with the same bill number, or the same date and total, for the same party"""
+    if doctype not in INDEXED_DOCTYPES:
+        return []
+    _ensure_index()
+
+    cache = frappe.cache()
+    party_field, name_field, bill_field, date_fields = INDEXED_DOCTYPES[doctype]
+    fields = [party_field, name_field, bill_field, "grand_total", "docstatus"] + list(date_fields)
+    duplicates = []
+    for key in get_invoice_keys(doctype, values):
+        hit = cache.hget(INVOICE_KEYS, key)
+        if not hit or hit[1] == exclude or any(duplicate["name"] == hit[1] for duplicate in duplicates):
+            continue
+
+        # Confirm against the invoice itself; its keys may have changed since it was indexed
+        existing = frappe.db.get_value(hit[0], hit[1], fields, as_dict=True)
+        if not existing or existing.docstatus == 2 or key not in get_invoice_keys(hit[0], existing):
+            cache.hdel(INVOICE_KEYS, key)
+            continue
+
+        duplicates.append({
+            "doctype": hit[0],
+            "name": hit[1],
+            "matched_on": _("bill number") if key.startswith("bill|") else _("date and grand total")
+        })
+    return duplicates
+
+
+def find_similar_ocr_reads(name, text):
+    """Other OCR Reads whose text is near-identical, closest first"""
+    value = simhash(text)
+    if value is None:
+        return []
+    _ensure_index()
+
+    cache = frappe.cache()
+    candidates = {}
+    for band, band_value in _bands(value):
+        for member in cache.smembers(SIMHASH_BAND_KEY.format(band, band_value)) or ():
+            candidate, _sep, other = frappe.safe_decode(member).rpartition("|")
+            candidates[candidate] = int(other, 16)
+    candidates.pop(name, None)
+
+    similar = []
+    for candidate, other in candidates.items():
+        distance = bin(value ^ other).count("1")
+        if distance <= MAX_TEXT_DISTANCE:
+            similar.append({"ocr_read": candidate, "distance": distance})
+    return sorted(similar, key=lambda entry: entry["distance"])
+
+
+def check_duplicates(ocr_read, doctype, values):
+    """Likely duplicates of the document an OCR Read would create
+
+    ``documents`` are existing documents with the same key fields, and
+    creating another is refused by default. ``ocr_reads`` are other reads of
+    near-identical text and are only a warning.
+    """
+    return {
+        "documents": find_duplicate_documents(doctype, values),
+        "ocr_reads": find_similar_ocr_reads(ocr_read.name, ocr_read.read_result)
+    }
+
+
+def describe_duplicates(duplicates):
+    return ", ".join("{0} {1} ({2})".format(_(duplicate["doctype"]), duplicate["name"], duplicate["matched_on"])
+                     for duplicate in duplicates)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Reuse of an earlier extraction for a document laid out like one already read.
+
+Recurring bills from one supplier repeat most of their text month to month.
+Every OCR Read with extracted fields gets a MinHash signature of its word
+pairs, split into bands stored in Redis, so the most similar earlier read is
+found with a few set lookups. When one shares at least half of its word
+pairs, the two texts are compared line by line:
+
+- A value of the earlier extraction whose lines all reappear unchanged is
+  kept as it is. A table (e.g. items) is kept only when no line among or
+  next to its rows changed or was added.
+- The other fields are asked for in a short prompt that carries only the
+  changed lines (with their neighbours), and the earlier values as examples.
+- A changed line that no re-read field accounts for means the earlier
+  extraction does not cover the new text, and the full extraction runs.
+
+When no extracted value sits on a changed line, no AI call is made at all.
+"""
+
+from __future__ import unicode_literals
+import difflib
+import frappe
+import hashlib
+import json
+import random
+import re
+from frappe import _
+
+from erpnext_ocr.erpnext_ocr.duplicate_index import get_shingles
+from erpnext_ocr.erpnext_ocr.structured_output import parse_json_object, parse_json_reply
+
+SIGNATURES = "ocr_minhash_signatures"
+BAND_KEY = "ocr_minhash_band:{0}:{1}"
+INDEX_STATE_KEY = "ocr_template_index_state"
+
+# 20 bands of 3: texts sharing half their word pairs meet in a band 93% of the time, a tenth 2%
+NUM_PERMUTATIONS = 60
+BAND_ROWS = 3
+MIN_SIMILARITY = 0.5
+MAX_CANDIDATES = 20
+# Beyond this share of the text, a full extraction is as cheap as re-reading the changes
+MAX_EXCERPT_SHARE = 0.6
+CONTEXT_LINES = 1
+EXAMPLE_ROWS = 2
+REBUILD_PAGE_SIZE = 1000
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_PRIME = (1 << 61) - 1
+_generator = random.Random(20251019)
+_PERMUTATIONS = [(_generator.randrange(1, _PRIME), _generator.randrange(_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+REREAD_PROMPT = """This document has the same layout as one read before. Only its lines that differ from that document are given, with their neighbours.
+Read the current values of the fields below from these lines and return a JSON object with exactly these keys. The values of the earlier document show the expected format:
+{examples}"""
+
+
+def minhash(text):
+    """MinHash signature of the word shingles of a text, or None for too little text"""
+    shingles = get_shingles(text)
+    if shingles is None:
+        return None
+    shingles = [value % _PRIME for value in shingles]
+    return tuple(min((a * value + b) % _PRIME for value in shingles) for a, b in _PERMUTATIONS)
+
+
+def _bands(signature):
+    for band in range(NUM_PERMUTATIONS // BAND_ROWS):
+        rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]
+        yield band, hashlib.blake2b("-".join(map(str, rows)).encode(), digest_size=8).hexdigest()
+
+
+def _similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / float(NUM_PERMUTATIONS)
+
+
+def _ensure_index():
+    """Queue the one-time build of the index if it has never been built"""
+    cache = frappe.cache()
+    if cache.get(cache.make_key(INDEX_STATE_KEY)):
+        return
+    # Claim the build for an hour so concurrent lookups queue it only once
+    if cache.set(cache.make_key(INDEX_STATE_KEY), "building", nx=True, ex=3600):
+        frappe.enqueue("erpnext_ocr.erpnext_ocr.extraction_reuse.rebuild_index", queue="long", timeout=3600)
+
+
+def rebuild_index():
+    """Index every OCR Read with text and extracted fields; the only pass that scans them"""
+    start = 0
+    while True:
+        rows = frappe.get_all("OCR Read", filters={"read_result": ["is", "set"], "ai_result": ["is", "set"]},
+                              fields=["name", "read_result"], order_by="creation asc",
+                              start=start, page_length=REBUILD_PAGE_SIZE)
+        for row in rows:
+            _index(row.name, row.read_result)
+        if len(rows) < REBUILD_PAGE_SIZE:
+            break
+        start += REBUILD_PAGE_SIZE
+
+    cache = frappe.cache()
+    cache.set(cache.make_key(INDEX_STATE_KEY), "built")
+
+
+def _index(name, text):
+    _unindex(name)
+    signature = minhash(text)
+    if signature is None:
+        return
+    cache = frappe.cache()
+    cache.hset(SIGNATURES, name, signature)
+    for band, band_value in _bands(signature):
+        cache.sadd(BAND_KEY.format(band, band_value), name)
+
+
+def _unindex(name):
+    cache = frappe.cache()
+    signature = cache.hget(SIGNATURES, name)
+    if signature is None:
+        return
+    for band, band_value in _bands(signature):
+        cache.srem(BAND_KEY.format(band, band_value), name)
+    cache.hdel(SIGNATURES, name)
+
+
+def index_extraction(doc):
+    """Keep an OCR Read's signature current (OCR Read on_update); only reads with extracted fields are indexed"""
+    if doc.has_value_changed("read_result") or doc.has_value_changed("ai_result"):
+        _index(doc.name, doc.read_result if doc.ai_result else None)
+
+
+def unindex_extraction(doc):
+    """OCR Read on_trash"""
+    _unindex(doc.name)
+
+
+def find_template(name, text):
+    """``(ocr_read, estimated share of word pairs in common)`` of the most similar earlier read, or None"""
+    signature = minhash(text)
+    if signature is None:
+        return None
+    _ensure_index()
+
+    cache = frappe.cache()
+    shared_bands = {}
+    for band, band_value in _bands(signature):
+        for member in cache.smembers(BAND_KEY.format(band, band_value)) or ():
+            member = frappe.safe_decode(member)
+            shared_bands[member] = shared_bands.get(member, 0) + 1
+    shared_bands.pop(name, None)
+
+    best = None
+    for candidate in sorted(shared_bands, key=shared_bands.get, reverse=True)[:MAX_CANDIDATES]:
+        other = cache.hget(SIGNATURES, candidate)
+        similarity = _similarity(signature, other) if other else 0.0
+        if similarity >= MIN_SIMILARITY and (not best or similarity > best[1]):
+            best = (candidate, similarity)
+    return best
+
+
+def _lines(text):
+    """``(line, words)`` of the lines of a text that have any words"""
+    lines = []
+    for line in (text or "").splitlines():
+        words = " ".join(_WORD.findall(line.lower()))
+        if words:
+            lines.append((line.strip(), words))
+    return lines
+
+
+def _words(value):
+    return " ".join(_WORD.findall(str(value).lower()))
+
+
+def _value_words(value):
+    """Each non-empty scalar in an extracted value, as the ways its words may be written"""
+    if isinstance(value, dict):
+        return [words for item in value.values() for words in _value_words(item)]
+    if isinstance(value, list):
+        return [words for item in value for words in _value_words(item)]
+    if value in (None, "") or isinstance(value, bool):
+        return []
+    if isinstance(value, (int, float)):
+        # 1234.5 may be printed "1234.50" or "1,234.50"
+        spellings = {_words(value), _words("{0:.2f}".format(value)), _words("{0:,.2f}".format(value))}
+        if value == int(value):
+            spellings.add(_words(int(value)))
+        return [tuple(sorted(spelling for spelling in spellings if spelling))]
+    words = _words(value)
+    return [(words,)] if words else []
+
+
+def _find_lines(value, lines):
+    """``(indexes of the lines holding a field's values, whether every value was found as written)``"""
+    found = set()
+    complete = True
+    for spellings in _value_words(value):
+        holding = [index for index, (_line, line_words) in enumerate(lines)
+                   if any(" %s " % words in " %s " % line_words for words in spellings)]
+        complete = complete and bool(holding)
+        found.update(holding)
+    return found, complete
+
+
+def _line_map(earlier_lines, lines):
+    """For each earlier line, ``(new line indexes it became, new index it sits at)``, and the changed new lines"""
+    matcher = difflib.SequenceMatcher(None, [words for _line, words in earlier_lines],
+                                      [words for _line, words in lines], autojunk=False)
+    line_map = {}
+    changed_lines = set()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            line_map.update((i1 + offset, ((j1 + offset,), j1 + offset)) for offset in range(i2 - i1))
+            continue
+        # Replaced or deleted: it became the whole changed block, or nothing
+        line_map.update((index, (tuple(range(j1, j2)), j1)) for index in range(i1, i2))
+        changed_lines.update(range(j1, j2))
+    return line_map, changed_lines
+
+
+def plan_reuse(earlier_text, earlier_fields, text):
+    """Which earlier fields still hold, and the lines to re-read the others from
+
+    Returns ``{"kept", "changed", "unlocated", "excerpt"}``, or None when a
+    partial read could miss something or would not pay off. ``changed``
+    fields had a value on a line that differs, or are tables with a changed
+    or added line among or next to their rows (re-read as a whole).
+    ``unlocated`` ones had a value not found as written (e.g. a reformatted
+    date) and are read from the changed lines no other field accounts for.
+    When such lines remain and no field is unlocated, they may hold data
+    the earlier extraction has no field for, so a full extraction is needed.
+    """
+    earlier_lines, lines = _lines(earlier_text), _lines(text)
+    if not lines:
+        return None
+
+    line_map, changed_lines = _line_map(earlier_lines, lines)
+    plan = {"kept": [], "changed": [], "unlocated": []}
+    covered = set()
+    excerpt = set()
+
+    for key, value in earlier_fields.items():
+        found, complete = _find_lines(value, earlier_lines)
+        if isinstance(value, list) and value:
+            if not found:
+                # Its rows cannot be placed in the new text
+                return None
+            anchors = [line_map[index][1] for index in found]
+            table = set(range(max(min(anchors) - 1, 0), min(max(anchors) + 2, len(lines))))
+            table.update(new for index in found for new in line_map[index][0])
+            if complete and not table & changed_lines:
+                plan["kept"].append(key)
+                continue
+            plan["changed"].append(key)
+            covered.update(table & changed_lines)
+            excerpt.update(table)
+            continue
+
+        new_lines = {new for index in found for new in line_map[index][0]}
+        if not complete and not found:
+            plan["unlocated"].append(key)
+        elif complete and not new_lines & changed_lines:
+            plan["kept"].append(key)
+        else:
+            plan["changed"].append(key)
+            covered.update(new_lines & changed_lines)
+
+    uncovered = changed_lines - covered
+    if uncovered and not plan["unlocated"]:
+        return None
+
+    for index in changed_lines:
+        excerpt.update(range(max(index - CONTEXT_LINES, 0), min(index + CONTEXT_LINES + 1, len(lines))))
+    if len(excerpt) > MAX_EXCERPT_SHARE * len(lines):
+        return None
+    plan["excerpt"] = "\n".join(lines[index][0] for index in sorted(excerpt))
+    return plan
+
+
+def _example(value):
+    return value[:EXAMPLE_ROWS] if isinstance(value, list) else value
+
+
+def get_reread_prompt(earlier_fields, keys):
+    examples = {key: _example(earlier_fields[key]) for key in keys}
+    return REREAD_PROMPT.format(examples=json.dumps(examples, indent=1, default=str))
+
+
+def reuse_extraction(doc, text):
+    """Extraction of ``text`` built from the most similar earlier OCR Read
+
+    Returns ``(result, None)`` with the ``classification``, ``fields``, the
+    ``source`` read, its ``similarity`` and whether an ``ai_call`` was made,
+    or ``(None, reason)`` when no earlier read can be reused.
+    """
+    template = find_template(doc.name, text)
+    if not template:
+        return None, _("No earlier document with the same layout")
+
+    source, similarity = template
+    earlier = frappe.db.get_value("OCR Read", source, ["read_result", "ai_result", "detected_document_type",
+                                                      "confidence_score", "suggested_doctype"], as_dict=True)
+    earlier_fields = parse_json_object(earlier.ai_result or "") if earlier else None
+    if not isinstance(earlier_fields, dict) or not earlier_fields:
+        _unindex(source)
+        return None, _("No earlier document with the same layout")
+
+    plan = plan_reuse(earlier.read_result, earlier_fields, text)
+    if not plan:
+        return None, _("Too much of the text differs from {0}").format(source)
+
+    fields = dict(earlier_fields)
+    reread = plan["changed"] + plan["unlocated"]
+    if reread:
+        result = doc._process_text_chunk_with_ai(plan["excerpt"], "extraction",
+                                                 custom_prompt=get_reread_prompt(earlier_fields, reread))
+        if result["status"] != "success":
+            raise Exception(result.get("message", "Unknown error"))
+        reply, partial = parse_json_reply(result["content"])
+        if partial:
+            return None, _("The re-read reply was cut off")
+        reply = reply or {}
+        if isinstance(reply.get("fields"), dict):
+            reply = reply["fields"]
+
+        for key in reread:
+            if reply.get(key) not in (None, "", [], {}):
+                fields[key] = reply[key]
+            elif key in plan["changed"]:
+                # Its line changed and no longer shows a value
+                fields.pop(key, None)
+
+    return {
+        "source": source,
+        "similarity": similarity,
+        "classification": {
+            "document_type": earlier.detected_document_type,
+            "confidence": earlier.confidence_score,
+            "suggested_doctype": earlier.suggested_doctype
+        },
+        "fields": fields,
+        "kept": plan["kept"],
+        "reread": reread,
+        "ai_call": bool(reread)
+    }, None
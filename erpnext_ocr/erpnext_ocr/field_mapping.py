@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Compiled plans for mapping extracted data onto a target DocType.
+
+A plan merges the configured OCR Field Alias records and the built-in
+aliases with the target DocType's meta into a reverse index from extracted
+key to ``(rank, fieldname, converter)``, keeping only fields the DocType
+actually has. Mapping is then one pass over the extracted keys. Plans are
+kept per process and site, and rebuilt when an alias, DocType, Custom Field
+or Property Setter changes.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import threading
+from frappe.utils import cint
+
+from erpnext_ocr.erpnext_ocr.item_index import resolve_items
+from erpnext_ocr.erpnext_ocr.party_index import PARTY_TYPES, resolve_party
+from erpnext_ocr.erpnext_ocr.value_formats import ValueFormats, get_value_formats
+
+MAPPING_VERSION_KEY = "ocr_field_mapping_version"
+
+# Priority of an alias by where it comes from; lower wins
+RANK_CONFIGURED = 0
+RANK_CONFIGURED_ANY = 1
+RANK_DOCTYPE = 2
+RANK_GENERIC = 3
+
+# target DocType -> {fieldname: extracted keys in order of preference}
+DEFAULT_ALIASES = {
+    "Sales Invoice": {
+        "customer": ["customer_name", "customer", "client_name", "bill_to", "client"],
+        "customer_name": ["customer_name", "client_name", "customer"],
+        "posting_date": ["date", "invoice_date", "bill_date"],
+        "due_date": ["due_date", "payment_due_date", "payment_due"],
+        "grand_total": ["total", "grand_total", "amount", "invoice_total"],
+        "remarks": ["notes", "description", "remarks"],
+        "po_no": ["po_number", "purchase_order", "reference"]
+    },
+    "Purchase Invoice": {
+        "supplier": ["supplier_name", "vendor", "supplier"],
+        "supplier_name": ["supplier_name", "vendor_name"],
+        "posting_date": ["date", "invoice_date", "bill_date"],
+        "due_date": ["due_date", "payment_due_date", "payment_due"],
+        "grand_total": ["total", "grand_total", "amount", "bill_total"],
+        "bill_no": ["invoice_no", "bill_no", "invoice_number"],
+        "remarks": ["notes", "description", "remarks"]
+    },
+    "Sales Order": {
+        "customer": ["customer_name", "customer", "client_name", "client"],
+        "customer_name": ["customer_name", "client_name"],
+        "transaction_date": ["date", "order_date", "so_date"],
+        "delivery_date": ["delivery_date", "required_date", "required_by_date"],
+        "grand_total": ["total", "grand_total", "amount"],
+        "po_no": ["customer_po", "po_number", "po_no", "reference"]
+    },
+    "Purchase Order": {
+        "supplier": ["supplier_name", "vendor", "supplier"],
+        "supplier_name": ["supplier_name", "vendor_name"],
+        "transaction_date": ["date", "order_date", "po_date"],
+        "schedule_date": ["delivery_date", "required_date", "required_by_date", "due_date"],
+        "grand_total": ["total", "grand_total", "amount"],
+        "remarks": ["description", "notes", "remarks"]
+    },
+    "Quotation": {
+        "party_name": ["customer_name", "client", "party"],
+        "transaction_date": ["date", "quotation_date"],
+        "valid_till": ["valid_until", "expiry_date"],
+        "grand_total": ["total", "grand_total", "amount"]
+    }
+}
+
+# Aliases for any DocType that has the field
+GENERIC_ALIASES = {
+    "customer_name": ["customer_name"],
+    "party_name": ["customer_name"],
+    "supplier_name": ["supplier_name", "supplier"],
+    "company": ["company"],
+    "posting_date": ["date"],
+    "transaction_date": ["date"],
+    "date": ["date"],
+    "due_date": ["due_date"],
+    "grand_total": ["total"],
+    "total_taxes_and_charges": ["tax"],
+    "description": ["description"],
+    "subject": ["description"],
+    "address": ["address"],
+    "customer_address": ["address"],
+    "supplier_address": ["address"],
+    "phone": ["phone"],
+    "mobile_no": ["phone"],
+    "contact_no": ["phone"],
+    "email_id": ["email"],
+    "email": ["email"],
+    "reference_no": ["reference"],
+    "po_no": ["reference"],
+    "invoice_no": ["reference"]
+}
+
+ITEM_ALIASES = {
+    "item_name": ["name", "description", "item_name", "product", "item"],
+    "description": ["description", "name", "item_name", "product", "item"],
+    "qty": ["quantity", "qty", "amount_qty"],
+    "rate": ["rate", "price", "unit_price", "cost"],
+    "amount": ["amount", "total", "line_total"]
+}
+
+# Item master fields copied onto rows resolved to an Item
+ITEM_DETAIL_FIELDS = ("item_name", "stock_uom")
+
+# Values set regardless of the extracted data
+STATIC_VALUES = {
+    "Quotation": {"quotation_to": "Customer"}
+}
+
+NO_VALUE_FIELDTYPES = ("Section Break", "Column Break", "Tab Break", "HTML", "Button", "Image",
+                       "Fold", "Heading", "Table", "Table MultiSelect")
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def _as_text(value, formats):
+    if isinstance(value, (list, dict)):
+        return None
+    return value
+
+
+def _only_strings(parse):
+    def convert(value, formats):
+        return parse(formats, value) if isinstance(value, str) else value
+    return convert
+
+
+# fieldtype -> converter(value, ValueFormats of the document)
+CONVERTERS = {
+    "Date": _only_strings(ValueFormats.parse_date),
+    "Datetime": _only_strings(ValueFormats.parse_datetime),
+    "Currency": lambda value, formats: formats.parse_amount(value),
+    "Float": lambda value, formats: formats.parse_amount(value),
+    "Percent": lambda value, formats: formats.parse_amount(value),
+    "Int": lambda value, formats: cint(formats.parse_amount(value)),
+    "Check": lambda value, formats: cint(value)
+}
+
+DATE_FIELDTYPES = ("Date", "Datetime")
+AMOUNT_FIELDTYPES = ("Currency", "Float", "Percent")
+
+
+def _party_converter(party_type):
+    def convert(value, formats):
+        # The whole match is returned so map() can report it; the raw text stays in the name field
+        match = resolve_party(party_type, value) if isinstance(value, str) else None
+        return dict(match, text=value) if match else None
+    return convert
+
+
+def get_converter(df):
+    if df.fieldtype == "Link" and df.options in PARTY_TYPES:
+        return _party_converter(df.options)
+    return CONVERTERS.get(df.fieldtype, _as_text)
+
+
+class MappingPlan(object):
+    """Reverse index from extracted key to the target fields it can fill"""
+
+    def __init__(self, doctype, aliases, static_values=None, items_field=None, item_plan=None):
+        self.doctype = doctype
+        self.index = {}
+        meta = frappe.get_meta(doctype)
+        fields = {df.fieldname: df for df in meta.fields if df.fieldtype not in NO_VALUE_FIELDTYPES}
+        self.fieldnames = frozenset(fields)
+        self.date_keys = set()
+        self.amount_keys = set()
+
+        for rank, fieldname, keys in aliases:
+            df = fields.get(fieldname)
+            if not df:
+                continue
+            converter = get_converter(df)
+            for position, key in enumerate(keys):
+                self.index.setdefault(key.lower(), []).append(((rank, position), fieldname, converter))
+            if df.fieldtype in DATE_FIELDTYPES:
+                self.date_keys.update(key.lower() for key in keys)
+            elif df.fieldtype in AMOUNT_FIELDTYPES:
+                self.amount_keys.update(key.lower() for key in keys)
+
+        self.static_values = {fieldname: value for fieldname, value in (static_values or {}).items()
+                              if fieldname in fields}
+        self.items_field = items_field
+        self.item_plan = item_plan
+        self.detail_fields = [fieldname for fieldname in ITEM_DETAIL_FIELDS if fieldname in self.fieldnames]
+        self.has_uom = "uom" in self.fieldnames and "stock_uom" in self.detail_fields
+        self.has_conversion_factor = self.has_uom and "conversion_factor" in self.fieldnames
+
+    def map(self, data, formats=None, only=None, matches=None):
+        """Field values for extracted data; each field takes its best-ranked key with a value
+
+        ``only`` limits mapping to those fields. Link fields resolved against a
+        master only take confident matches; every match, taken or not, is
+        added to ``matches`` when given.
+        """
+        formats = formats or ValueFormats()
+        best = {}
+        for key, value in data.items():
+            if not value or not isinstance(key, str):
+                continue
+            for rank, fieldname, converter in self.index.get(key.lower(), ()):
+                if fieldname in best and best[fieldname][0] <= rank:
+                    continue
+                if only is not None and fieldname not in only:
+                    continue
+                try:
+                    converted = converter(value, formats)
+                except Exception:
+                    continue
+                if converted is not None:
+                    best[fieldname] = (rank, converted)
+
+        values = dict(self.static_values) if only is None else {}
+        for fieldname, (_rank, value) in best.items():
+            if isinstance(value, dict):
+                # A master record match from a Link converter
+                if matches is not None:
+                    matches[fieldname] = value
+                if not value["confident"]:
+                    continue
+                value = value["party"]
+            values[fieldname] = value
+        return values
+
+    def get_value_formats(self, data, supplier=None):
+        """Date and amount conventions for a document, from its header and line item values"""
+        dates, amounts = [], []
+        plans_and_rows = [(self, [data])]
+        if self.item_plan and isinstance(data.get("items"), list):
+            plans_and_rows.append((self.item_plan, data["items"]))
+
+        for plan, rows in plans_and_rows:
+            for row in rows:
+                if not isinstance(row, dict):
+                    continue
+                for key, value in row.items():
+                    if not isinstance(value, str) or not isinstance(key, str):
+                        continue
+                    key = key.lower()
+                    if key in plan.date_keys:
+                        dates.append(value)
+                    elif key in plan.amount_keys:
+                        amounts.append(value)
+        return get_value_formats(dates, amounts, supplier)
+
+    def map_items(self, rows, supplier=None, formats=None, matches=None):
+        """Child rows for every extracted line item, with item codes resolved in one pass
+
+        Rows only take confident item matches. ``matches``, when given, gets
+        the match of every returned row, taken or not, or None.
+        """
+        if not self.item_plan or not isinstance(rows, list):
+            return []
+
+        item_plan = self.item_plan
+        rows = [row for row in rows if isinstance(row, dict)]
+        items = []
+        for row in rows:
+            item = item_plan.map(row, formats)
+            # Setting the child doctype up front spares a meta lookup per appended row
+            item["doctype"] = item_plan.doctype
+            if not item.get("qty"):
+                item["qty"] = 1
+            if not item.get("item_name"):
+                item["item_name"] = "OCR Item {0}".format(len(items) + 1)
+            items.append(item)
+
+        if items and "item_code" in item_plan.fieldnames:
+            matched = []
+            for item, match in zip(items, resolve_items(rows, supplier)):
+                if matches is not None:
+                    matches.append(match)
+                if match and match["confident"]:
+                    item["item_code"] = match["item"]
+                    matched.append(item)
+            if matched and item_plan.detail_fields:
+                item_plan.set_item_details(matched)
+        elif matches is not None:
+            matches.extend([None] * len(items))
+        return items
+
+    def set_item_details(self, items):
+        """Copy item master fields onto resolved rows, reading every Item once"""
+        details = {
+            row.name: row for row in frappe.get_all(
+                "Item",
+                filters={"name": ["in", list({item["item_code"] for item in items})]},
+                fields=["name"] + list(ITEM_DETAIL_FIELDS)
+            )
+        }
+        for item in items:
+            detail = details.get(item["item_code"])
+            if not detail:
+                continue
+            for fieldname in self.detail_fields:
+                item[fieldname] = detail[fieldname]
+            if self.has_uom and not item.get("uom"):
+                item["uom"] = detail.stock_uom
+                if self.has_conversion_factor:
+                    item["conversion_factor"] = 1
+
+    def apply(self, doc, data, matches=None, item_matches=None):
+        """Set mapped values and item rows on a document; returns the mapped fields
+
+        ``matches`` collects how Link fields were resolved (see ``map``) and
+        ``item_matches`` how each item row was (see ``map_items``).
+        """
+        # The supplier comes first: its learned conventions apply to every value
+        supplier = self.map(data, only=("supplier",)).get("supplier")
+        formats = self.get_value_formats(data, supplier)
+        values = self.map(data, formats, matches=matches)
+        doc.update(values)
+
+        items = self.map_items(data.get("items"), supplier, formats, item_matches)
+        if items:
+            doc.extend(self.items_field, items)
+            values["items_count"] = len(items)
+        return values
+
+
+def _get_configured_aliases(doctype):
+    """OCR Field Alias records for a DocType, and those for every DocType"""
+    rows = frappe.get_all(
+        "OCR Field Alias",
+        filters={"disabled": 0},
+        fields=["target_doctype", "fieldname", "extracted_key"],
+        order_by="priority asc, creation asc"
+    )
+    aliases = {}
+    for row in rows:
+        if row.target_doctype and row.target_doctype != doctype:
+            continue
+        rank = RANK_CONFIGURED if row.target_doctype else RANK_CONFIGURED_ANY
+        aliases.setdefault((rank, row.fieldname), []).append(row.extracted_key)
+    return [(rank, fieldname, keys) for (rank, fieldname), keys in aliases.items()]
+
+
+def _compile_plan(doctype):
+    aliases = _get_configured_aliases(doctype)
+    aliases += [(RANK_DOCTYPE, fieldname, keys) for fieldname, keys in DEFAULT_ALIASES.get(doctype, {}).items()]
+    aliases += [(RANK_GENERIC, fieldname, keys) for fieldname, keys in GENERIC_ALIASES.items()]
+
+    items_field = item_plan = None
+    items_df = frappe.get_meta(doctype).get_field("items")
+    if items_df and items_df.fieldtype == "Table" and items_df.options:
+        items_field = "items"
+        item_plan = MappingPlan(items_df.options, [(RANK_DOCTYPE, fieldname, keys)
+                                                   for fieldname, keys in ITEM_ALIASES.items()])
+
+    return MappingPlan(doctype, aliases, STATIC_VALUES.get(doctype), items_field, item_plan)
+
+
+def get_mapping_version():
+    """Current generation of aliases and meta, shared by all processes through Redis"""
+    cache = frappe.cache()
+    key = cache.make_key(MAPPING_VERSION_KEY)
+    version = cache.get(key)
+    if version is None:
+        cache.set(key, frappe.generate_hash(length=10), nx=True)
+        version = cache.get(key)
+    return frappe.safe_decode(version)
+
+
+def get_mapping_plan(doctype):
+    """Compiled mapping plan for a DocType"""
+    site = frappe.local.site
+    version = get_mapping_version()
+
+    with _plans_lock:
+        cached = _plans.get(site)
+        if not cached or cached[0] != version:
+            cached = _plans[site] = (version, {})
+
+    plan = cached[1].get(doctype)
+    if plan is None:
+        # Read the version before compiling so a concurrent change is never cached as current
+        plan = cached[1][doctype] = _compile_plan(doctype)
+    return plan
+
+
+def _bump_mapping_version():
+    cache = frappe.cache()
+    cache.set(cache.make_key(MAPPING_VERSION_KEY), frappe.generate_hash(length=10))
+
+
+def clear_mapping_plans(doc=None, method=None):
+    """Invalidate compiled plans in every process (alias and meta changes)"""
+    with _plans_lock:
+        _plans.pop(frappe.local.site, None)
+    _bump_mapping_version()
+    # Other workers may recompile before this transaction commits, so bump again afterwards
+    frappe.db.after_commit.add(_bump_mapping_version)
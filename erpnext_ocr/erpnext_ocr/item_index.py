@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""In-memory index resolving extracted line items to an Item.
+
+Each process keeps, per site, exact lookups for item codes, barcodes,
+supplier part numbers and OCR Item Alias records, plus a trigram index over
+item codes, names and descriptions for fuzzy matches. All line items of a
+document are resolved in one pass against one index, so the per-row cost is
+a few dictionary lookups for coded rows and a handful of scored candidates
+for the rest.
+
+OCR Item Alias records for a supplier are learned when a purchase document
+created from OCR is submitted with a row resolved to a different item than
+the index suggested. Master changes reach other processes through a change
+log in Redis, as in the party index (see trigram_index).
+
+A row only gets an item without review when the match is exact, or scores
+high with a clear margin over the best other item, as for party Links.
+Weaker matches are only suggestions.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import re
+from collections import defaultdict
+from frappe import _
+from frappe.utils import strip_html
+
+from erpnext_ocr.erpnext_ocr.trigram_index import (
+    MIN_SCORE, ChangeLog, LiveIndex, TrigramIndex, is_confident
+)
+
+MAX_TEXT_LENGTH = 140
+SOURCES_TTL = 30 * 24 * 60 * 60
+
+SEQUENCE_KEY = "ocr_item_index_seq"
+CHANGES_KEY = "ocr_item_index_changes"
+SOURCES_KEY = "ocr_item_sources:{0}:{1}"
+
+# Extracted line item keys holding a code, and those holding a name, in order of preference
+ITEM_CODE_KEYS = ("item_code", "code", "sku", "barcode", "ean", "upc", "part_no", "part_number", "product_code")
+ITEM_TEXT_KEYS = ("name", "description", "item_name", "product", "item")
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_text(text):
+    return " ".join(_NON_ALNUM.sub(" ", (text or "").lower()).split())[:MAX_TEXT_LENGTH]
+
+
+def normalize_code(text):
+    return _NON_ALNUM.sub("", str(text or "").lower())
+
+
+def get_row_codes(row):
+    return [row[key] for key in ITEM_CODE_KEYS
+            if isinstance(row.get(key), (str, int)) and not isinstance(row.get(key), bool)]
+
+
+def get_row_text(row):
+    for key in ITEM_TEXT_KEYS:
+        if isinstance(row.get(key), str) and row[key].strip():
+            return row[key]
+    return ""
+
+
+class ItemIndex(TrigramIndex):
+    def __init__(self):
+        super(ItemIndex, self).__init__()
+        self.codes = {}             # normalized item code -> item
+        self.barcodes = {}
+        self.part_numbers = {}      # normalized supplier part number -> item, for any supplier
+        self.supplier_parts = {}    # (supplier, normalized part number) -> item
+        self.aliases = {}           # (supplier or "", normalized alias) -> item
+
+    def add(self, item, texts=(), barcodes=(), supplier_parts=(), aliases=()):
+        """Index an item; ``supplier_parts`` and ``aliases`` are ``(supplier, text)`` pairs"""
+        self.add_key(item, self.codes, normalize_code(item))
+        for normalized in {normalize_text(text) for text in texts if text}:
+            if normalized:
+                self.add_text(item, normalized)
+        for barcode in barcodes:
+            self.add_key(item, self.barcodes, normalize_code(barcode))
+        for supplier, part_no in supplier_parts:
+            part_no = normalize_code(part_no)
+            self.add_key(item, self.supplier_parts, part_no and (supplier, part_no))
+            self.add_key(item, self.part_numbers, part_no)
+        for supplier, alias in aliases:
+            alias = normalize_text(alias)
+            self.add_key(item, self.aliases, alias and (supplier or "", alias))
+
+    def resolve(self, codes, text, supplier=None):
+        """``(item, score, matched_on, runner-up score)`` for a line item's codes and text, or None
+
+        The runner-up is the best score of any other item.
+        """
+        for code in codes:
+            key = normalize_code(code)
+            if not key:
+                continue
+            if key in self.barcodes:
+                return self.barcodes[key], 1.0, "barcode", 0.0
+            if supplier and (supplier, key) in self.supplier_parts:
+                return self.supplier_parts[(supplier, key)], 1.0, "supplier_part_no", 0.0
+            if key in self.codes:
+                return self.codes[key], 1.0, "item_code", 0.0
+            if key in self.part_numbers:
+                return self.part_numbers[key], 1.0, "supplier_part_no", 0.0
+
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+
+        item = (supplier and self.aliases.get((supplier, normalized))) or self.aliases.get(("", normalized))
+        if item:
+            return item, 1.0, "alias", 0.0
+        return self.match_text(normalized)
+
+
+def _load_items(index, names=None):
+    """Add items (all enabled ones, or the given names) to an index from the database"""
+    filters = {"disabled": 0, "has_variants": 0}
+    child_filters = {"parenttype": "Item"}
+    alias_filters = {}
+    if names is not None:
+        filters["name"] = ["in", names]
+        child_filters["parent"] = ["in", names]
+        alias_filters["item_code"] = ["in", names]
+
+    barcodes = defaultdict(list)
+    for row in frappe.get_all("Item Barcode", filters=child_filters, fields=["parent", "barcode"]):
+        barcodes[row.parent].append(row.barcode)
+
+    supplier_parts = defaultdict(list)
+    for row in frappe.get_all("Item Supplier", filters=child_filters,
+                              fields=["parent", "supplier", "supplier_part_no"]):
+        if row.supplier_part_no:
+            supplier_parts[row.parent].append((row.supplier, row.supplier_part_no))
+
+    aliases = defaultdict(list)
+    for row in frappe.get_all("OCR Item Alias", filters=alias_filters, fields=["item_code", "supplier", "alias"]):
+        aliases[row.item_code].append((row.supplier, row.alias))
+
+    for row in frappe.get_all("Item", filters=filters, fields=["name", "item_name", "description"]):
+        description = strip_html(row.description or "")[:MAX_TEXT_LENGTH * 2]
+        index.add(row.name,
+                  texts=[row.name, row.item_name, description],
+                  barcodes=barcodes.get(row.name, ()),
+                  supplier_parts=supplier_parts.get(row.name, ()),
+                  aliases=aliases.get(row.name, ()))
+
+
+_change_log = ChangeLog(SEQUENCE_KEY, CHANGES_KEY)
+_live_index = LiveIndex(_change_log, ItemIndex, _load_items)
+
+
+def get_item_index():
+    """The up-to-date item index for the current site"""
+    return _live_index.get()
+
+
+def get_index_sequence():
+    """Changes whenever an item or an item alias changes"""
+    return _change_log.get_sequence()
+
+
+def resolve_items(rows, supplier=None, min_score=MIN_SCORE):
+    """Matches for extracted line items, aligned with ``rows``, or None below ``min_score``
+
+    Each match is ``{"item", "score", "matched_on", "runner_up", "confident"}``;
+    only ``confident`` matches belong in a row unreviewed. The index is checked
+    once for the whole document and repeated rows are resolved once.
+    """
+    index = get_item_index()
+    resolved = {}
+    matches = []
+    for row in rows:
+        codes = tuple(get_row_codes(row)) if isinstance(row, dict) else ()
+        text = get_row_text(row) if isinstance(row, dict) else ""
+        key = (codes, text)
+        if key not in resolved:
+            match = index.resolve(codes, text, supplier)
+            resolved[key] = {
+                "item": match[0],
+                "score": round(match[1], 3),
+                "matched_on": match[2],
+                "runner_up": round(match[3], 3),
+                "confident": is_confident(match[1], match[3])
+            } if match and match[1] >= min_score else None
+        matches.append(resolved[key])
+    return matches
+
+
+@frappe.whitelist()
+def find_items(items, supplier=None):
+    """Best matching Item for each extracted line item (a list of dicts or a JSON string)"""
+    frappe.has_permission("Item", "read", throw=True)
+    items = frappe.parse_json(items) if isinstance(items, str) else items
+    if not isinstance(items, list):
+        frappe.throw(_("Items must be a list"))
+    return resolve_items(items, supplier)
+
+
+def remember_item_sources(doc):
+    """Keep the text each row of a document created from OCR was read from, for learning on submit"""
+    sources = {row.name: row.description for row in doc.get("items") or [] if row.get("description")}
+    if sources:
+        frappe.cache().set_value(SOURCES_KEY.format(doc.doctype, doc.name), sources,
+                                 expires_in_sec=SOURCES_TTL)
+
+
+def learn_from_document(doc, method=None):
+    """Purchase document on_submit: learn supplier aliases for rows that were resolved by hand"""
+    cache_key = SOURCES_KEY.format(doc.doctype, doc.name)
+    sources = frappe.cache().get_value(cache_key)
+    supplier = doc.get("supplier")
+    if not sources or not supplier:
+        return
+
+    rows = [row for row in doc.get("items") or [] if row.item_code and sources.get(row.name)]
+    texts = [strip_html(sources[row.name])[:MAX_TEXT_LENGTH] for row in rows]
+    matches = resolve_items([{"name": text} for text in texts], supplier)
+
+    for row, text, match in zip(rows, texts, matches):
+        # A row confirmed against a weak suggestion is learned too, so it resolves confidently next time
+        if not normalize_text(text) or (match and match["confident"] and match["item"] == row.item_code):
+            continue
+        if frappe.db.exists("OCR Item Alias", {"supplier": supplier, "alias": text}):
+            continue
+        frappe.get_doc({
+            "doctype": "OCR Item Alias",
+            "supplier": supplier,
+            "alias": text,
+            "item_code": row.item_code
+        }).insert(ignore_permissions=True)
+
+    frappe.cache().delete_value(cache_key)
+
+
+def on_item_change(doc, method=None, *args):
+    """Item on_update, on_trash and after_rename (old and new names)"""
+    _change_log.queue(doc.name, *[arg for arg in args[:2] if isinstance(arg, str)])
+
+
+def on_alias_change(doc, method=None):
+    """OCR Item Alias on_update and on_trash"""
+    _change_log.queue(doc.item_code)
+    before = doc.get_doc_before_save()
+    if before and before.item_code != doc.item_code:
+        _change_log.queue(before.item_code)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Compiled keyword rules for quick classification and parsing AI replies.
+
+The keyword rules (Keyword Rules on OCR Classification Settings, or the
+built-in defaults for any rule type without rows) are compiled once into a
+matcher holding the distinct keywords of all rules. A text is scanned once for
+that keyword set and every rule is evaluated against the result, instead of
+rebuilding keyword tables and repeating searches per rule on every call. The
+compiled matcher is kept per process and rebuilt when the settings change.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from frappe.utils import flt
+
+DOCUMENT_TYPE = "Document Type"
+DOCTYPE_NAME = "DocType Name"
+REPLY_HINT = "Reply Hint"
+KEY_FIELD = "Key Field"
+
+Rule = namedtuple("Rule", ["rule_type", "target", "keywords", "requires", "confidence"])
+
+# (rule type, target, keywords, keywords of which one must also occur, confidence)
+DEFAULT_RULES = [
+    # Quick suggestion from extracted text; confidence scales with the share of keywords found
+    (DOCUMENT_TYPE, "Purchase Order", ["purchase order", "po number", "po no", "vendor", "supplier", "order date"], [], 0.7),
+    (DOCUMENT_TYPE, "Sales Invoice", ["invoice", "bill to", "customer", "invoice number", "due date", "payment"], [], 0.7),
+    (DOCUMENT_TYPE, "Purchase Invoice", ["invoice", "vendor", "supplier", "bill from", "payment due"], [], 0.7),
+    (DOCUMENT_TYPE, "Quotation", ["quotation", "quote", "proposal", "estimate", "valid until"], [], 0.6),
+    (DOCUMENT_TYPE, "Delivery Note", ["delivery", "shipped", "dispatch", "consignment", "delivery note"], [], 0.6),
+    (DOCUMENT_TYPE, "Sales Order", ["sales order", "order confirmation", "customer order", "so number"], [], 0.7),
+
+    # DocType names recognised in a free-text AI reply, in priority order
+    (DOCTYPE_NAME, "Purchase Order", ["purchase order"], [], 0.85),
+    (DOCTYPE_NAME, "Sales Order", ["sales order"], [], 0.85),
+    (DOCTYPE_NAME, "Sales Invoice", ["sales invoice"], [], 0.85),
+    (DOCTYPE_NAME, "Purchase Invoice", ["purchase invoice"], [], 0.85),
+    (DOCTYPE_NAME, "Quotation", ["quotation"], [], 0.85),
+    (DOCTYPE_NAME, "Delivery Note", ["delivery note"], [], 0.85),
+    (DOCTYPE_NAME, "Purchase Receipt", ["purchase receipt"], [], 0.85),
+    (DOCTYPE_NAME, "Payment Entry", ["payment entry"], [], 0.85),
+    (DOCTYPE_NAME, "Journal Entry", ["journal entry"], [], 0.85),
+    (DOCTYPE_NAME, "Expense Claim", ["expense claim"], [], 0.85),
+    (DOCTYPE_NAME, "Timesheet", ["timesheet"], [], 0.85),
+    (DOCTYPE_NAME, "Job Card", ["job card"], [], 0.85),
+    (DOCTYPE_NAME, "Work Order", ["work order"], [], 0.85),
+    (DOCTYPE_NAME, "Material Request", ["material request"], [], 0.85),
+    (DOCTYPE_NAME, "Stock Entry", ["stock entry"], [], 0.85),
+    (DOCTYPE_NAME, "Customer", ["customer"], [], 0.85),
+    (DOCTYPE_NAME, "Supplier", ["supplier"], [], 0.85),
+    (DOCTYPE_NAME, "Item", ["item"], [], 0.85),
+    (DOCTYPE_NAME, "Lead", ["lead"], [], 0.85),
+    (DOCTYPE_NAME, "Opportunity", ["opportunity"], [], 0.85),
+
+    # Field-level hints in a reply that names no DocType, in priority order
+    (REPLY_HINT, "Purchase Order", ["po_no", "purchase order number", "supplier details", "job work"], [], 0.8),
+    (REPLY_HINT, "Sales Order", ["so_no", "sales order", "customer order", "order confirmation"], [], 0.8),
+    (REPLY_HINT, "Purchase Invoice", ["invoice", "bill", "payment due", "invoice number"], ["purchase", "vendor", "supplier"], 0.75),
+    (REPLY_HINT, "Sales Invoice", ["invoice", "bill", "payment due", "invoice number"], [], 0.75),
+    (REPLY_HINT, "Quotation", ["quotation", "quote", "proposal", "estimate"], [], 0.75),
+
+    # Key fields mentioned in a reply
+    (KEY_FIELD, "po_no", ["po_no", "purchase order number", "po number"], [], 0),
+    (KEY_FIELD, "customer", ["customer", "client"], [], 0),
+    (KEY_FIELD, "supplier", ["supplier", "vendor", "supplier details"], [], 0),
+    (KEY_FIELD, "items", ["items", "products", "line items", "item details"], [], 0),
+    (KEY_FIELD, "total", ["total", "amount", "grand total"], [], 0),
+    (KEY_FIELD, "date", ["date", "order date", "required by date"], [], 0),
+    (KEY_FIELD, "taxes", ["tax", "gst", "vat", "hsn"], [], 0),
+    (KEY_FIELD, "terms", ["terms", "conditions", "payment terms"], [], 0),
+    (KEY_FIELD, "shipping", ["shipping", "delivery", "shipping details"], [], 0),
+    (KEY_FIELD, "company", ["company", "company details"], [], 0),
+]
+
+# site -> (settings modified, matcher)
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def split_keywords(value):
+    """Lower-case keywords from a comma or newline separated field"""
+    return [keyword.strip().lower() for keyword in re.split(r"[,\n]", value or "") if keyword.strip()]
+
+
+class KeywordMatcher(object):
+    def __init__(self, rules):
+        self.rules = OrderedDict()
+        for rule in rules:
+            self.rules.setdefault(rule.rule_type, []).append(rule)
+
+        keywords = set()
+        for rule in rules:
+            keywords.update(rule.keywords)
+            keywords.update(rule.requires)
+        self.keywords = tuple(sorted(keywords))
+
+    def scan(self, text):
+        """Set of keywords occurring in the text.
+
+        Each distinct keyword is searched once, however many rules use it;
+        the rules are then evaluated against this set.
+        """
+        if not text:
+            return set()
+        text = text.lower()
+        return {keyword for keyword in self.keywords if keyword in text}
+
+    def get_rules(self, rule_type):
+        return self.rules.get(rule_type, [])
+
+    def matching_rules(self, rule_type, found):
+        """``(rule, matched keywords)`` for each rule of a type whose keywords occur"""
+        for rule in self.get_rules(rule_type):
+            if rule.requires and found.isdisjoint(rule.requires):
+                continue
+            matched = [keyword for keyword in rule.keywords if keyword in found]
+            if matched:
+                yield rule, matched
+
+    def first_match(self, rule_type, found):
+        """The highest-priority rule of a type that matches, or None"""
+        for rule, _matched in self.matching_rules(rule_type, found):
+            return rule
+        return None
+
+    def match_name(self, phrase, rule_type=DOCTYPE_NAME):
+        """Target of the first name rule overlapping a short phrase, e.g. a captured DocType label"""
+        phrase = phrase.strip().lower()
+        if not phrase:
+            return None
+        for rule in self.get_rules(rule_type):
+            for keyword in rule.keywords:
+                if keyword in phrase or phrase in keyword:
+                    return rule
+        return None
+
+
+def _default_rules():
+    return [Rule(rule_type, target, keywords, requires, confidence)
+            for rule_type, target, keywords, requires, confidence in DEFAULT_RULES]
+
+
+def build_rules(rows):
+    """Configured rules, falling back to the defaults for each rule type without rows"""
+    rules = []
+    for row in rows or []:
+        keywords = split_keywords(row.keywords)
+        if row.rule_type and row.target and keywords:
+            rules.append(Rule(row.rule_type, row.target.strip(), keywords,
+                              split_keywords(row.requires), flt(row.confidence)))
+
+    configured = {rule.rule_type for rule in rules}
+    rules.extend(rule for rule in _default_rules() if rule.rule_type not in configured)
+    return rules
+
+
+def get_matcher():
+    """The compiled matcher for the current site"""
+    settings = frappe.get_cached_doc("OCR Classification Settings")
+    version = str(settings.modified)
+
+    site = frappe.local.site
+    cached = _matchers.get(site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with _matchers_lock:
+        cached = _matchers.get(site)
+        if cached and cached[0] == version:
+            return cached[1]
+        matcher = KeywordMatcher(build_rules(settings.get("keyword_rules")))
+        _matchers[site] = (version, matcher)
+    return matcher
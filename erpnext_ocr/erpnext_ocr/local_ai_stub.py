@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Lightweight OpenAI-compatible stub server for offline and load testing.
+
+Replays canned chat completions with configurable latency so the whole AI
+pipeline can be exercised without network access. Point an AI Integration
+Settings record with provider "Local Model" at it::
+
+    bench ocr-ai-stub --port 8765 --latency 0.8
+    # or: python -m erpnext_ocr.erpnext_ocr.local_ai_stub --port 8765
+
+    Base URL: http://127.0.0.1:8765/v1
+
+The ``/v1/files`` and ``/v1/batches`` endpoints of the Batch API are emulated
+in memory: a batch completes ``latency`` seconds after it is created, with one
+canned completion per input line.
+
+Canned responses can be supplied as a JSON list of
+``{"match": "<text in prompt>", "content": "<reply or JSON object>"}``; the
+first entry whose ``match`` occurs in the prompt wins. This module must not
+import frappe so that it can run outside a bench.
+"""
+
+from __future__ import unicode_literals
+import argparse
+import email
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSES = [
+    {
+        "match": "\"fields\"",
+        "content": {
+            "document_type": "Purchase Invoice",
+            "confidence": 0.92,
+            "suggested_doctype": "Purchase Invoice",
+            "key_fields": ["supplier_name", "invoice_no", "date", "total"],
+            "fields": {
+                "supplier_name": "Stub Supplies Ltd",
+                "invoice_no": "INV-0001",
+                "date": "2025-01-15",
+                "total": 1180.0,
+                "tax": 180.0,
+                "items": [{"name": "Stub Widget", "quantity": 10, "rate": 100.0, "amount": 1000.0}]
+            }
+        }
+    },
+    {
+        "match": "classify",
+        "content": {
+            "document_type": "Purchase Invoice",
+            "confidence": 0.9,
+            "suggested_doctype": "Purchase Invoice",
+            "key_fields": ["supplier_name", "invoice_no", "date", "total"],
+            "reasoning": "Canned response from the local AI stub"
+        }
+    },
+    {
+        "match": "",
+        "content": {
+            "supplier_name": "Stub Supplies Ltd",
+            "invoice_no": "INV-0001",
+            "date": "2025-01-15",
+            "total": 1180.0,
+            "tax": 180.0,
+            "items": [{"name": "Stub Widget", "quantity": 10, "rate": 100.0, "amount": 1000.0}]
+        }
+    }
+]
+
+
+class StubConfig(object):
+    def __init__(self, latency=0.5, jitter=0.0, chunk_delay=0.02, error_rate=0.0, responses=None, model="local-model"):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.responses = responses or DEFAULT_RESPONSES
+        self.model = model
+
+    def get_delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def get_content(self, prompt):
+        prompt_lower = (prompt or "").lower()
+        for response in self.responses:
+            if (response.get("match") or "").lower() in prompt_lower:
+                content = response.get("content")
+                return content if isinstance(content, str) else json.dumps(content)
+        return ""
+
+
+def _prompt_text(messages):
+    parts = []
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts.extend(part.get("text") or "" for part in content if part.get("type") == "text")
+        else:
+            parts.append(content or "")
+    return "\n".join(parts)
+
+
+def _usage(prompt, content):
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+def build_completion(config, body):
+    """Canned (non-streaming) chat completion for a request body"""
+    prompt = _prompt_text(body.get("messages"))
+    content = config.get_content(prompt)
+    return {
+        "id": "chatcmpl-" + uuid.uuid4().hex,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model") or config.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(prompt, content)
+    }
+
+
+def _parse_multipart(content_type, body):
+    """Form fields and file contents of a multipart/form-data body"""
+    message = email.message_from_bytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    fields = {}
+    for part in message.get_payload() or []:
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+class BatchStore(object):
+    """In-memory files and batches for the emulated Batch API"""
+
+    def __init__(self, config):
+        self.config = config
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content, purpose, filename="batch.jsonl"):
+        file_id = "file-" + uuid.uuid4().hex
+        with self.lock:
+            self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose
+        }
+
+    def create_batch(self, body):
+        input_file_id = body.get("input_file_id")
+        if input_file_id not in self.files:
+            return None
+
+        batch = {
+            "id": "batch_" + uuid.uuid4().hex,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": input_file_id,
+            "completion_window": body.get("completion_window"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata")
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+
+        timer = threading.Timer(self.config.get_delay(), self._complete, (batch["id"],))
+        timer.daemon = True
+        timer.start()
+        return dict(batch)
+
+    def _complete(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] != "in_progress":
+                return
+            lines = self.files[batch["input_file_id"]].decode("utf-8").splitlines()
+
+        output = []
+        counts = {"total": 0, "completed": 0, "failed": 0}
+        for line in lines:
+            if not line.strip():
+                continue
+            counts["total"] += 1
+            request = json.loads(line)
+            if self.config.error_rate and random.random() < self.config.error_rate:
+                counts["failed"] += 1
+                response = {"status_code": 500, "body": {"error": {"message": "Failed by stub"}}}
+            else:
+                counts["completed"] += 1
+                response = {"status_code": 200, "body": build_completion(self.config, request.get("body") or {})}
+            response["request_id"] = "req_" + uuid.uuid4().hex
+            output.append(json.dumps({
+                "id": "batch_req_" + uuid.uuid4().hex,
+                "custom_id": request.get("custom_id"),
+                "response": response,
+                "error": None
+            }))
+
+        output_file = self.add_file("\n".join(output).encode("utf-8"), "batch_output")
+        with self.lock:
+            batch.update({
+                "status": "completed",
+                "output_file_id": output_file["id"],
+                "completed_at": int(time.time()),
+                "request_counts": counts
+            })
+
+    def get_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            return dict(batch) if batch else None
+
+    def cancel_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch and batch["status"] == "in_progress":
+                batch["status"] = "cancelled"
+            return dict(batch) if batch else None
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ERPNextOCRAIStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.stub_config
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": "Not found: " + self.path}})
+
+    def _path_parts(self):
+        """Path segments after the ``/v1`` prefix"""
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        return parts[1:] if parts and parts[0] == "v1" else parts
+
+    def do_GET(self):
+        parts = self._path_parts()
+        store = self.server.batch_store
+        if parts == ["models"]:
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": self.config.model, "object": "model", "owned_by": "stub"}]
+            })
+        elif len(parts) == 2 and parts[0] == "batches" and store.get_batch(parts[1]):
+            self._send_json(200, store.get_batch(parts[1]))
+        elif len(parts) == 3 and parts[0] == "files" and parts[2] == "content" and parts[1] in store.files:
+            content = store.files[parts[1]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        raw = self._read_body()
+        parts = self._path_parts()
+        if parts == ["files"]:
+            self._upload_file(raw)
+            return
+        if parts and parts[0] == "batches":
+            self._batches(parts, raw)
+            return
+        if parts != ["chat", "completions"]:
+            self._not_found()
+            return
+
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self._send_json(429, {"error": {"message": "Rate limited by stub"}}, {"Retry-After": "1"})
+            return
+
+        completion = build_completion(self.config, body)
+        if body.get("stream"):
+            self._stream(completion)
+            return
+
+        time.sleep(self.config.get_delay())
+        self._send_json(200, completion)
+
+    def _upload_file(self, raw):
+        fields = _parse_multipart(self.headers.get("Content-Type") or "", raw)
+        if not fields.get("file"):
+            self._send_json(400, {"error": {"message": "Missing file"}})
+            return
+        purpose = (fields.get("purpose") or b"batch").decode("utf-8")
+        self._send_json(200, self.server.batch_store.add_file(fields["file"], purpose))
+
+    def _batches(self, parts, raw):
+        store = self.server.batch_store
+        if len(parts) == 3 and parts[2] == "cancel":
+            batch = store.cancel_batch(parts[1])
+            if batch:
+                self._send_json(200, batch)
+            else:
+                self._not_found()
+            return
+
+        try:
+            batch = store.create_batch(json.loads(raw or b"{}"))
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        if not batch:
+            self._send_json(400, {"error": {"message": "Unknown input_file_id"}})
+            return
+        self._send_json(200, batch)
+
+    def _stream(self, completion):
+        content = completion["choices"][0]["message"]["content"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send_event(payload):
+            self.wfile.write(("data: " + payload + "\n\n").encode("utf-8"))
+            self.wfile.flush()
+
+        # Time to first token is a fraction of the full latency
+        time.sleep(self.config.get_delay() / 5)
+        for start in range(0, len(content), 16):
+            send_event(json.dumps({
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "model": completion["model"],
+                "choices": [{"index": 0, "delta": {"content": content[start:start + 16]}, "finish_reason": None}]
+            }))
+            time.sleep(self.config.chunk_delay)
+
+        send_event(json.dumps({
+            "id": completion["id"],
+            "object": "chat.completion.chunk",
+            "model": completion["model"],
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": completion["usage"]
+        }))
+        send_event("[DONE]")
+
+
+def make_server(host="127.0.0.1", port=8765, config=None, verbose=False):
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    server.daemon_threads = True
+    server.stub_config = config or StubConfig()
+    server.batch_store = BatchStore(server.stub_config)
+    server.verbose = verbose
+    return server
+
+
+def start_in_thread(host="127.0.0.1", port=0, config=None):
+    """Start a stub server on a background thread; returns the server (``server_address`` has the port)"""
+    server = make_server(host, port, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def serve(host="127.0.0.1", port=8765, latency=0.5, jitter=0.0, chunk_delay=0.02,
+          error_rate=0.0, responses_file=None, model="local-model", verbose=True):
+    responses = None
+    if responses_file:
+        with open(responses_file) as f:
+            responses = json.load(f)
+
+    config = StubConfig(latency, jitter, chunk_delay, error_rate, responses, model)
+    server = make_server(host, port, config, verbose)
+    print("Local AI stub listening on http://{0}:{1}/v1".format(host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for ERPNext OCR")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to latency")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--responses", help="JSON file with canned responses")
+    parser.add_argument("--model", default="local-model")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.latency, args.jitter, args.chunk_delay,
+          args.error_rate, args.responses, args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Local document-type classifier trained on already classified OCR Reads.
+
+A multinomial naive Bayes model over binary word features is trained from the
+stored ``read_result`` / ``detected_document_type`` pairs (``bench
+ocr-train-classifier`` or the button on OCR Classification Settings) and saved
+as JSON in the site's private folder. It is loaded lazily, reloaded when the
+file changes, and classifies a document in well under a millisecond, so AI
+classification is only needed when it is not confident enough.
+
+Only labels from an AI classification or confirmed by a user are trained on.
+Labels the local model, the keyword rules or a reused template assigned are
+recorded with their ``classification_source`` and left out, so the model
+never learns from its own predictions.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from frappe import _
+from frappe.utils import cint, flt, now
+
+MODEL_FILENAME = "ocr_document_classifier.json"
+MODEL_VERSION = 1
+DEFAULT_CONFIDENCE_THRESHOLD = 0.85
+DEFAULT_MIN_LABEL_CONFIDENCE = 0.75
+DEFAULT_MAX_FEATURES = 20000
+MIN_DOCUMENT_FREQUENCY = 2
+MIN_SAMPLES_PER_LABEL = 5
+HOLDOUT_EVERY = 10
+SMOOTHING = 1.0
+
+# Classification depends on the start of a document; longer text only costs time
+MAX_PREDICT_CHARS = 4000
+
+# Where an OCR Read's classification came from (its classification_source)
+SOURCE_AI = "AI"
+SOURCE_LOCAL = "Local Classifier"
+SOURCE_KEYWORDS = "Keyword Rules"
+SOURCE_TEMPLATE = "Template"
+SOURCE_USER = "User"
+TRAINING_SOURCES = (SOURCE_AI, SOURCE_USER)
+
+_TOKEN = re.compile(r"[a-z][a-z0-9]{1,24}")
+
+# site -> (file mtime, model)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Distinct lower-case word tokens of a text"""
+    return set(_TOKEN.findall((text or "").lower()))
+
+
+class NaiveBayesClassifier(object):
+    def __init__(self, labels, log_priors, token_log_probs, doctypes=None, metadata=None):
+        self.labels = labels
+        self.log_priors = log_priors
+        self.token_log_probs = token_log_probs
+        self.doctypes = doctypes or {}
+        self.metadata = metadata or {}
+
+    @classmethod
+    def train(cls, samples, max_features=DEFAULT_MAX_FEATURES):
+        """Fit on ``(text, label)`` pairs"""
+        token_sets = [(tokenize(text), label) for text, label in samples]
+        labels = sorted({label for _tokens, label in token_sets})
+
+        document_frequency = Counter()
+        for tokens, _label in token_sets:
+            document_frequency.update(tokens)
+        vocabulary = [token for token, df in document_frequency.most_common(max_features)
+                      if df >= MIN_DOCUMENT_FREQUENCY]
+        vocabulary_set = set(vocabulary)
+
+        label_counts = Counter(label for _tokens, label in token_sets)
+        token_counts = {label: Counter() for label in labels}
+        for tokens, label in token_sets:
+            token_counts[label].update(tokens & vocabulary_set)
+
+        log_priors = [math.log(label_counts[label] / len(token_sets)) for label in labels]
+        denominators = [sum(token_counts[label].values()) + SMOOTHING * len(vocabulary) for label in labels]
+        token_log_probs = {
+            token: [round(math.log((token_counts[label][token] + SMOOTHING) / denominators[i]), 5)
+                    for i, label in enumerate(labels)]
+            for token in vocabulary
+        }
+        return cls(labels, log_priors, token_log_probs)
+
+    def predict(self, text):
+        """``(label, confidence)`` for a text, or None when no known token occurs"""
+        scores = list(self.log_priors)
+        matched = 0
+        for token in tokenize((text or "")[:MAX_PREDICT_CHARS]):
+            log_probs = self.token_log_probs.get(token)
+            if log_probs is None:
+                continue
+            matched += 1
+            for i, log_prob in enumerate(log_probs):
+                scores[i] += log_prob
+
+        if not matched:
+            return None
+
+        best = max(range(len(scores)), key=scores.__getitem__)
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.labels[best], 1.0 / total
+
+    def to_dict(self):
+        return {
+            "version": MODEL_VERSION,
+            "labels": self.labels,
+            "log_priors": self.log_priors,
+            "token_log_probs": self.token_log_probs,
+            "doctypes": self.doctypes,
+            "metadata": self.metadata
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["labels"], data["log_priors"], data["token_log_probs"],
+                   data.get("doctypes"), data.get("metadata"))
+
+
+def get_model_path():
+    return frappe.get_site_path("private", MODEL_FILENAME)
+
+
+def get_model():
+    """The trained model for the current site, loaded on first use and when the file changes"""
+    path = get_model_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    site = frappe.local.site
+    cached = _models.get(site)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _models_lock:
+        cached = _models.get(site)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path) as f:
+                model = NaiveBayesClassifier.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            frappe.log_error(frappe.get_traceback(), "OCR Local Classifier Load Error")
+            model = None
+        _models[site] = (mtime, model)
+    return model
+
+
+def _get_classifier_settings():
+    return frappe.get_cached_doc("OCR Classification Settings")
+
+
+def predict(text):
+    """Local classification in the same shape as an AI classification, or None"""
+    model = get_model()
+    if not model or not text:
+        return None
+
+    prediction = model.predict(text)
+    if not prediction:
+        return None
+
+    label, confidence = prediction
+    return {
+        "document_type": label,
+        "confidence": round(confidence, 3),
+        "suggested_doctype": model.doctypes.get(label) or label,
+        "key_fields": [],
+        "reasoning": "Local classifier trained on {0} documents".format(model.metadata.get("samples", 0)),
+        "source": SOURCE_LOCAL
+    }
+
+
+def classify_locally(text):
+    """Local classification when it clears the configured confidence threshold, else None"""
+    settings = _get_classifier_settings()
+    if settings.disable_local_classifier:
+        return None
+
+    classification = predict(text)
+    threshold = flt(settings.confidence_threshold) or DEFAULT_CONFIDENCE_THRESHOLD
+    if classification and classification["confidence"] >= threshold:
+        return classification
+    return None
+
+
+def _get_training_samples(min_label_confidence):
+    """``(text, label, suggested_doctype)`` for OCR Reads confirmed by a user or classified by AI with enough confidence"""
+    rows = frappe.get_all(
+        "OCR Read",
+        filters={
+            "read_result": ["is", "set"],
+            "detected_document_type": ["not in", ["", "Unknown", "unknown"]],
+            "classification_source": ["in", TRAINING_SOURCES]
+        },
+        or_filters={
+            "classification_source": SOURCE_USER,
+            "confidence_score": [">=", min_label_confidence]
+        },
+        fields=["read_result", "detected_document_type", "suggested_doctype"],
+        order_by="creation asc",
+        limit_page_length=0
+    )
+    return [(row.read_result, row.detected_document_type, row.suggested_doctype) for row in rows]
+
+
+def _evaluate(samples, max_features, threshold):
+    """Accuracy and coverage at the threshold on every HOLDOUT_EVERY-th sample"""
+    train = [(text, label) for i, (text, label) in enumerate(samples) if i % HOLDOUT_EVERY]
+    holdout = [(text, label) for i, (text, label) in enumerate(samples) if not i % HOLDOUT_EVERY]
+    if not holdout or len({label for _text, label in train}) < 2:
+        return {}
+
+    model = NaiveBayesClassifier.train(train, max_features)
+    correct = confident = confident_correct = 0
+    for text, label in holdout:
+        prediction = model.predict(text)
+        if not prediction:
+            continue
+        correct += prediction[0] == label
+        if prediction[1] >= threshold:
+            confident += 1
+            confident_correct += prediction[0] == label
+
+    return {
+        "holdout_samples": len(holdout),
+        "accuracy": flt(correct / len(holdout), 4),
+        "coverage": flt(confident / len(holdout), 4),
+        "precision_at_threshold": flt(confident_correct / confident, 4) if confident else 0.0
+    }
+
+
+def train_and_save():
+    """Train on the stored classifications, write the model file and record its stats"""
+    settings = frappe.get_single("OCR Classification Settings")
+    min_label_confidence = flt(settings.min_label_confidence) or DEFAULT_MIN_LABEL_CONFIDENCE
+    max_features = cint(settings.max_features) or DEFAULT_MAX_FEATURES
+    threshold = flt(settings.confidence_threshold) or DEFAULT_CONFIDENCE_THRESHOLD
+
+    rows = _get_training_samples(min_label_confidence)
+    label_counts = Counter(label for _text, label, _doctype in rows)
+    rows = [row for row in rows if label_counts[row[1]] >= MIN_SAMPLES_PER_LABEL]
+    if len({label for _text, label, _doctype in rows}) < 2:
+        frappe.throw(_("At least two document types with {0} AI-classified or confirmed OCR Reads each are needed to train").format(
+            MIN_SAMPLES_PER_LABEL))
+
+    samples = [(text, label) for text, label, _doctype in rows]
+    evaluation = _evaluate(samples, max_features, threshold)
+
+    # Map each label to the DocType most often suggested for it
+    doctype_counts = defaultdict(Counter)
+    for _text, label, doctype in rows:
+        if doctype:
+            doctype_counts[label][doctype] += 1
+
+    model = NaiveBayesClassifier.train(samples, max_features)
+    model.doctypes = {label: counts.most_common(1)[0][0] for label, counts in doctype_counts.items()}
+    model.metadata = dict(evaluation, samples=len(samples), trained_on=now())
+
+    path = get_model_path()
+    with open(path + ".tmp", "w") as f:
+        json.dump(model.to_dict(), f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+    settings.db_set({
+        "model_trained_on": model.metadata["trained_on"],
+        "training_samples": len(samples),
+        "model_labels": "\n".join("{0}: {1}".format(label, label_counts[label]) for label in model.labels),
+        "holdout_accuracy": flt(evaluation.get("accuracy")) * 100,
+        "holdout_coverage": flt(evaluation.get("coverage")) * 100,
+        "holdout_precision": flt(evaluation.get("precision_at_threshold")) * 100
+    })
+    frappe.db.commit()
+    return model.metadata
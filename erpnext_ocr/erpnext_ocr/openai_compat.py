@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Client for OpenAI-compatible ``/chat/completions`` endpoints.
+
+Used for the "Local Model" provider (vLLM, llama.cpp server, Ollama, LM Studio
+and the bundled ``local_ai_stub``), with optional server-sent-event streaming,
+and for the ``/files`` + ``/batches`` endpoints used by AI Batch Job.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import json
+from frappe import _
+from erpnext_ocr.erpnext_ocr.rate_limiter import post_with_retry, get_session
+
+DEFAULT_LOCAL_BASE_URL = "http://localhost:8000/v1"
+DEFAULT_LOCAL_MODEL = "local-model"
+
+
+def get_endpoint(settings, path, default_base_url=DEFAULT_LOCAL_BASE_URL):
+    """Endpoint URL under the configured base URL, e.g. ``/chat/completions``"""
+    base_url = (settings.base_url or default_base_url).rstrip("/")
+    for suffix in ("/chat/completions", "/models", "/batches", "/files"):
+        if base_url.endswith(suffix):
+            base_url = base_url[:-len(suffix)]
+    return base_url + path
+
+
+def get_headers(settings):
+    headers = {"Content-Type": "application/json"}
+    api_key = settings.get_api_key()
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def build_messages(prompt, image_data=None):
+    """Single user message with an optional inline JPEG image"""
+    if not image_data:
+        return [{"role": "user", "content": prompt}]
+
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt},
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
+            }
+        ]
+    }]
+
+
+def iter_sse_events(response):
+    """Yield decoded JSON events from a server-sent-event stream until ``[DONE]``"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            yield json.loads(payload)
+        except ValueError:
+            continue
+
+
+def _rejects_response_format(response):
+    """True when the provider refused the request because of ``response_format``"""
+    return response.status_code in (400, 422) and (
+        "response_format" in response.text or "json_schema" in response.text
+    )
+
+
+def chat_completion(settings, url, headers, messages, max_tokens=None, model=None,
+                    stream=False, on_delta=None, provider_label="Local Model", response_format=None):
+    """Call a chat completions endpoint and return the normalised result dict.
+
+    With ``stream`` the reply is read incrementally and ``on_delta(text)`` is
+    called for every content fragment as it arrives. ``response_format`` asks
+    for structured JSON; models that do not support it are retried without.
+    """
+    data = {
+        "model": model or settings.model_name or DEFAULT_LOCAL_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens or settings.max_tokens or 4000,
+        "temperature": settings.temperature or 0.1
+    }
+    if stream:
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+    if response_format:
+        data["response_format"] = response_format
+
+    response = post_with_retry(settings, url, headers=headers, json=data, stream=stream)
+
+    if response_format and _rejects_response_format(response):
+        data.pop("response_format")
+        response.close()
+        response = post_with_retry(settings, url, headers=headers, json=data, stream=stream)
+
+    if response.status_code != 200:
+        frappe.throw(_("{0} API Error: {1}").format(provider_label, response.text))
+
+    if not stream:
+        result = response.json()
+        return {
+            "status": "success",
+            "content": result["choices"][0]["message"]["content"],
+            "usage": result.get("usage", {}),
+            "model": result.get("model", ""),
+            "finish_reason": result["choices"][0].get("finish_reason")
+        }
+
+    parts = []
+    usage = {}
+    model_name = ""
+    finish_reason = None
+    try:
+        for event in iter_sse_events(response):
+            model_name = model_name or event.get("model", "")
+            usage = event.get("usage") or usage
+            for choice in event.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+                finish_reason = choice.get("finish_reason") or finish_reason
+    finally:
+        response.close()
+
+    return {
+        "status": "success",
+        "content": "".join(parts),
+        "usage": usage,
+        "model": model_name,
+        "finish_reason": finish_reason
+    }
+
+
+def list_models(settings):
+    """Model ids served by an OpenAI-compatible endpoint"""
+    url = get_endpoint(settings, "/models")
+    response = get_session(url).get(url, headers=get_headers(settings), timeout=settings.timeout or 30)
+    if response.status_code != 200:
+        frappe.throw(_("Local Model API Error: {0}").format(response.text))
+    return [model.get("id") for model in response.json().get("data") or []]
+
+
+def _request(settings, method, path, default_base_url, **kwargs):
+    url = get_endpoint(settings, path, default_base_url)
+    headers = get_headers(settings)
+    if "files" in kwargs:
+        # Let requests set the multipart boundary
+        headers.pop("Content-Type")
+
+    response = get_session(url).request(method, url, headers=headers, timeout=settings.timeout or 30, **kwargs)
+    if response.status_code != 200:
+        frappe.throw(_("{0} Batch API Error: {1}").format(settings.ai_provider, response.text))
+    return response
+
+
+def upload_batch_file(settings, content, default_base_url=DEFAULT_LOCAL_BASE_URL, filename="batch.jsonl"):
+    """Upload JSONL batch input and return the provider file id"""
+    response = _request(settings, "POST", "/files", default_base_url,
+                        data={"purpose": "batch"},
+                        files={"file": (filename, content, "application/jsonl")})
+    return response.json()["id"]
+
+
+def create_batch(settings, input_file_id, default_base_url=DEFAULT_LOCAL_BASE_URL,
+                 endpoint="/v1/chat/completions", completion_window="24h", metadata=None):
+    """Start a provider batch over an uploaded input file"""
+    data = {
+        "input_file_id": input_file_id,
+        "endpoint": endpoint,
+        "completion_window": completion_window
+    }
+    if metadata:
+        data["metadata"] = metadata
+    return _request(settings, "POST", "/batches", default_base_url, json=data).json()
+
+
+def retrieve_batch(settings, batch_id, default_base_url=DEFAULT_LOCAL_BASE_URL):
+    return _request(settings, "GET", f"/batches/{batch_id}", default_base_url).json()
+
+
+def cancel_batch(settings, batch_id, default_base_url=DEFAULT_LOCAL_BASE_URL):
+    return _request(settings, "POST", f"/batches/{batch_id}/cancel", default_base_url).json()
+
+
+def get_file_content(settings, file_id, default_base_url=DEFAULT_LOCAL_BASE_URL):
+    """Raw text of a provider file, e.g. batch output JSONL"""
+    response = _request(settings, "GET", f"/files/{file_id}/content", default_base_url)
+    return response.content.decode("utf-8")
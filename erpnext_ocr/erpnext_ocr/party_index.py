@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""In-memory fuzzy index resolving extracted party text to a Supplier or Customer.
+
+Each process keeps, per site and party type, exact lookups for normalized
+names, OCR Party Alias records, tax IDs and phone numbers, plus a trigram
+index for fuzzy name matches (see trigram_index).
+
+A match is only confident enough to fill a Link field unreviewed when it is
+exact (name, alias, tax ID or phone, and unique) or scores high with a clear
+margin over the best other party. Weaker matches are only suggestions.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import functools
+import re
+from frappe import _
+
+from erpnext_ocr.erpnext_ocr.trigram_index import (
+    MIN_SCORE, ChangeLog, LiveIndex, TrigramIndex, is_confident
+)
+
+PARTY_TYPES = ("Supplier", "Customer")
+
+SEQUENCE_KEY = "ocr_party_index_seq:{0}"
+CHANGES_KEY = "ocr_party_index_changes:{0}"
+
+# Legal forms that do not tell parties apart
+_LEGAL_SUFFIXES = re.compile(
+    r"\b(?:pvt|private|ltd|limited|llc|llp|inc|incorporated|corp|corporation|co|company|"
+    r"gmbh|ag|sa|srl|bv|plc|pte|pty|the)\b"
+)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_NON_DIGIT = re.compile(r"\D+")
+_DIGIT = re.compile(r"\d")
+_LETTER = re.compile(r"[A-Za-z]")
+
+
+def normalize_name(text):
+    text = _NON_ALNUM.sub(" ", (text or "").lower())
+    stripped = _LEGAL_SUFFIXES.sub(" ", text).split()
+    return " ".join(stripped or text.split())
+
+
+def normalize_tax_id(text):
+    return _NON_ALNUM.sub("", (text or "").lower())
+
+
+def normalize_phone(text):
+    digits = _NON_DIGIT.sub("", text or "")
+    # Compare without country or trunk prefixes
+    return digits[-10:] if len(digits) >= 7 else ""
+
+
+class PartyIndex(TrigramIndex):
+    def __init__(self, party_type):
+        super(PartyIndex, self).__init__()
+        self.party_type = party_type
+        self.tax_ids = {}
+        self.phones = {}
+
+    def add(self, party, names=(), tax_id=None, phones=()):
+        for normalized in {normalize_name(text) for text in names if text}:
+            if normalized:
+                self.add_text(party, normalized)
+        self.add_key(party, self.tax_ids, normalize_tax_id(tax_id))
+        for phone in phones:
+            self.add_key(party, self.phones, normalize_phone(phone))
+
+    def resolve(self, text):
+        """``(party, score, matched_on, runner-up score)`` for extracted text, or None
+
+        The runner-up is the best score of any other party.
+        """
+        text = (text or "").strip()
+        if not text:
+            return None
+
+        has_digits = _DIGIT.search(text)
+        party = has_digits and self.tax_ids.get(normalize_tax_id(text))
+        if party:
+            return party, 1.0, "tax_id", 0.0
+
+        if has_digits and not _LETTER.search(text):
+            party = self.phones.get(normalize_phone(text))
+            if party:
+                return party, 1.0, "phone", 0.0
+
+        return self.match_text(normalize_name(text))
+
+
+def _get_party_fields(party_type):
+    meta = frappe.get_meta(party_type)
+    name_field = "supplier_name" if party_type == "Supplier" else "customer_name"
+    phone_fields = [field for field in ("mobile_no", "phone") if meta.has_field(field)]
+    tax_fields = ["tax_id"] if meta.has_field("tax_id") else []
+    return name_field, tax_fields, phone_fields
+
+
+def _load_parties(index, names=None):
+    """Add parties (all, or the given names) to an index from the database"""
+    name_field, tax_fields, phone_fields = _get_party_fields(index.party_type)
+    filters = {"name": ["in", names]} if names is not None else {}
+
+    alias_filters = {"party_type": index.party_type}
+    if names is not None:
+        alias_filters["party"] = ["in", names]
+    aliases = {}
+    for row in frappe.get_all("OCR Party Alias", filters=alias_filters, fields=["party", "alias"]):
+        aliases.setdefault(row.party, []).append(row.alias)
+
+    rows = frappe.get_all(index.party_type, filters=filters,
+                          fields=["name", name_field] + tax_fields + phone_fields)
+    for row in rows:
+        index.add(row.name,
+                  names=[row.name, row.get(name_field)] + aliases.get(row.name, []),
+                  tax_id=row.get("tax_id"),
+                  phones=[row.get(field) for field in phone_fields])
+
+
+_change_logs = {party_type: ChangeLog(SEQUENCE_KEY.format(party_type), CHANGES_KEY.format(party_type))
+                for party_type in PARTY_TYPES}
+_live_indexes = {party_type: LiveIndex(_change_logs[party_type],
+                                       functools.partial(PartyIndex, party_type), _load_parties)
+                 for party_type in PARTY_TYPES}
+
+
+def get_party_index(party_type):
+    """The up-to-date index for a party type on the current site"""
+    return _live_indexes[party_type].get()
+
+
+def get_index_sequence(party_type):
+    """Changes whenever a party of the type or one of its aliases changes"""
+    return _change_logs[party_type].get_sequence()
+
+
+def resolve_party(party_type, text, min_score=MIN_SCORE):
+    """``{"party", "score", "matched_on", "runner_up", "confident"}`` for extracted party text
+
+    None below ``min_score``. Only ``confident`` matches belong in a Link field.
+    """
+    if party_type not in PARTY_TYPES or not text:
+        return None
+    match = get_party_index(party_type).resolve(text)
+    if not match or match[1] < min_score:
+        return None
+    party, score, matched_on, runner_up = match
+    return {
+        "party": party,
+        "score": round(score, 3),
+        "matched_on": matched_on,
+        "runner_up": round(runner_up, 3),
+        "confident": is_confident(score, runner_up)
+    }
+
+
+@frappe.whitelist()
+def find_party(party_type, text):
+    """Best matching Supplier or Customer for text read from a document"""
+    if party_type not in PARTY_TYPES:
+        frappe.throw(_("Party Type must be Supplier or Customer"))
+    frappe.has_permission(party_type, "read", throw=True)
+    return resolve_party(party_type, text)
+
+
+def _queue_change(party_type, *parties):
+    if party_type in PARTY_TYPES:
+        _change_logs[party_type].queue(*parties)
+
+
+def on_party_change(doc, method=None, *args):
+    """Supplier/Customer on_update, on_trash and after_rename (old and new names)"""
+    _queue_change(doc.doctype, doc.name, *[arg for arg in args[:2] if isinstance(arg, str)])
+
+
+def on_alias_change(doc, method=None):
+    """OCR Party Alias on_update and on_trash"""
+    _queue_change(doc.party_type, doc.party)
+    before = doc.get_doc_before_save()
+    if before and (before.party_type, before.party) != (doc.party_type, doc.party):
+        _queue_change(before.party_type, before.party)
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Confidence-gated processing of an OCR Read, cheapest stage first.
+
+1. Text: the file's text layer (or Tesseract for images), classified by the
+   local model or the keyword rules, with fields picked out by patterns.
+2. Template: the extraction of the most similar earlier OCR Read, keeping
+   the values on lines that did not change and re-reading only the rest
+   (see extraction_reuse).
+3. AI Text: one combined classify-and-extract call on that text.
+4. AI Vision: one combined call on the image itself.
+
+A stage's result is accepted when its classification confidence and the
+share of the document type's required fields it found clear the thresholds
+for that document type (OCR Classification Settings); otherwise the next
+stage runs. Every stage is recorded in the OCR Read's processing log.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import json
+import os
+import re
+import time
+from frappe import _
+from frappe.utils import add_days, cint, flt, now_datetime
+
+from erpnext_ocr.erpnext_ocr.doctype.ai_integration_settings.ai_integration_settings import process_image_with_ai
+from erpnext_ocr.erpnext_ocr.extraction_reuse import reuse_extraction
+from erpnext_ocr.erpnext_ocr.local_classifier import (
+    classify_locally, SOURCE_AI, SOURCE_KEYWORDS, SOURCE_LOCAL, SOURCE_TEMPLATE
+)
+from erpnext_ocr.erpnext_ocr.structured_output import parse_json_reply
+from erpnext_ocr.erpnext_ocr.text_chunker import strip_page_breaks
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.gif')
+
+STAGE_TEXT = "Text"
+STAGE_TEMPLATE = "Template"
+STAGE_AI_TEXT = "AI Text"
+STAGE_AI_VISION = "AI Vision"
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+DEFAULT_MIN_FIELD_COVERAGE = 75
+
+# Extracted fields a document type needs before a stage counts as complete
+DEFAULT_REQUIRED_FIELDS = {
+    "Purchase Invoice": ["supplier_name", "invoice_no", "date", "total"],
+    "Sales Invoice": ["customer_name", "invoice_no", "date", "total"],
+    "Purchase Order": ["supplier_name", "date", "total"],
+    "Sales Order": ["customer_name", "date", "total"],
+    "Quotation": ["customer_name", "date", "total"],
+    "Delivery Note": ["customer_name", "date"],
+}
+FALLBACK_REQUIRED_FIELDS = ["date", "total"]
+
+# Field patterns for the text stage, tried in order
+TEXT_FIELD_PATTERNS = {
+    "total": [r'(?:grand\s+)?total[:\s]*([0-9,]+\.?[0-9]*)', r'amount[:\s]*([0-9,]+\.?[0-9]*)'],
+    "date": [r'date[:\s]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'],
+    "invoice_no": [r'invoice\s*(?:no|number|#)?[:.\s#]*([A-Za-z0-9][A-Za-z0-9/-]+)',
+                   r'bill\s*(?:no|number|#)?[:.\s#]*([A-Za-z0-9][A-Za-z0-9/-]+)'],
+    "customer_name": [r'(?:customer|client|bill to)[:\s]*([A-Za-z][A-Za-z .&]+)'],
+    "supplier_name": [r'(?:supplier|vendor|bill from)[:\s]*([A-Za-z][A-Za-z .&]+)'],
+}
+TEXT_FIELD_PATTERNS = {
+    field: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    for field, patterns in TEXT_FIELD_PATTERNS.items()
+}
+
+
+def extract_fields_from_text(text):
+    """Fields found by pattern in OCR text, keyed like an AI extraction"""
+    fields = {}
+    for field, patterns in TEXT_FIELD_PATTERNS.items():
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                value = match.group(1).strip()
+                if field in ("customer_name", "supplier_name"):
+                    value = value.split("\n")[0].strip().title()
+                fields[field] = value
+                break
+    return fields
+
+
+def get_thresholds(document_type):
+    """``(min confidence, min field coverage %, required fields)`` for a document type"""
+    settings = frappe.get_cached_doc("OCR Classification Settings")
+    min_confidence = flt(settings.cascade_min_confidence) or DEFAULT_MIN_CONFIDENCE
+    min_coverage = flt(settings.cascade_min_field_coverage) or DEFAULT_MIN_FIELD_COVERAGE
+    required_fields = DEFAULT_REQUIRED_FIELDS.get(document_type, FALLBACK_REQUIRED_FIELDS)
+
+    for row in settings.get("cascade_thresholds") or []:
+        if row.document_type == document_type:
+            min_confidence = flt(row.min_confidence) or min_confidence
+            min_coverage = flt(row.min_field_coverage) or min_coverage
+            if row.required_fields:
+                required_fields = [field.strip() for field in re.split(r"[,\n]", row.required_fields)
+                                   if field.strip()]
+            break
+
+    return min_confidence, min_coverage, required_fields
+
+
+def get_field_coverage(fields, required_fields):
+    """Percentage of required fields with a value"""
+    if not required_fields:
+        return 100.0
+    found = sum(1 for field in required_fields if fields.get(field) not in (None, "", [], {}))
+    return flt(found * 100.0 / len(required_fields), 1)
+
+
+class ProcessingCascade(object):
+    def __init__(self, doc):
+        self.doc = doc
+        self.file_ext = os.path.splitext(os.path.basename(doc.file_to_read))[1].lower()
+        self.is_image = self.file_ext in IMAGE_EXTENSIONS
+        settings = frappe.get_cached_doc("OCR Classification Settings")
+        self.allow_vision = not cint(settings.cascade_disable_vision)
+        self.allow_reuse = not cint(settings.cascade_disable_reuse)
+        self.text = ""
+        self.ai_calls = 0
+
+    def run(self):
+        """Run the stages until one is accepted; apply the last usable result"""
+        self.doc.set("processing_log", [])
+        result = None
+        accepted = False
+
+        for stage, handler in ((STAGE_TEXT, self._run_text_stage),
+                               (STAGE_TEMPLATE, self._run_template_stage),
+                               (STAGE_AI_TEXT, self._run_ai_text_stage),
+                               (STAGE_AI_VISION, self._run_ai_vision_stage)):
+            start = time.time()
+            try:
+                stage_result = handler(result)
+            except Exception as e:
+                self._log(stage, start, decision="Failed", reason=str(e)[:500])
+                continue
+
+            if stage_result is None:
+                continue
+
+            result = stage_result
+            accepted, reason = self._evaluate(result)
+            self._log(stage, start, result, "Accepted" if accepted else "Escalated", reason)
+            if accepted:
+                break
+
+        if not result:
+            frappe.throw(_("No stage could read this document. See the processing log for details."))
+
+        self._apply(result, accepted)
+        return {
+            "status": "success",
+            "stage": result["stage"],
+            "accepted": accepted,
+            "ai_calls": self.ai_calls,
+            "classification": result["classification"],
+            "data": self.doc.ai_result
+        }
+
+    def _run_text_stage(self, previous):
+        if self.is_image:
+            fullpath = frappe.get_site_path() + self.doc.file_to_read
+            self.text = (self.doc._extract_text_from_image(fullpath) or "").strip()
+            method = "Tesseract OCR"
+        else:
+            self.text = (self.doc._get_file_content_for_ai(self.file_ext) or "").strip()
+            method = "Text Layer"
+
+        if not self.text:
+            raise ValueError(_("No text found in file"))
+
+        classification = classify_locally(self.text)
+        source = SOURCE_LOCAL
+        if not classification:
+            classification = self.doc._quick_classify_text(self.text) or {}
+            source = SOURCE_KEYWORDS
+
+        return {
+            "stage": STAGE_TEXT,
+            "method": "{0} + {1}".format(method, source),
+            "classification": classification,
+            "classification_source": source,
+            "fields": extract_fields_from_text(self.text),
+            "ai_call": False
+        }
+
+    def _run_template_stage(self, previous):
+        if not self.text or not self.allow_reuse:
+            reason = _("Reuse is disabled") if self.text else _("No text to compare")
+            self._log(STAGE_TEMPLATE, time.time(), decision="Skipped", reason=reason)
+            return None
+
+        start = time.time()
+        # Earlier reads are stored without page breaks, so compare the text the same way
+        reuse, reason = reuse_extraction(self.doc, strip_page_breaks(self.text))
+        if not reuse:
+            self._log(STAGE_TEMPLATE, start, decision="Skipped", reason=reason)
+            return None
+
+        self.ai_calls += 1 if reuse["ai_call"] else 0
+        return {
+            "stage": STAGE_TEMPLATE,
+            "method": _("{0} ({1}% alike), {2} of {3} fields re-read").format(
+                reuse["source"], int(reuse["similarity"] * 100), len(reuse["reread"]),
+                len(reuse["reread"]) + len(reuse["kept"])),
+            "classification": reuse["classification"],
+            "classification_source": SOURCE_TEMPLATE,
+            "fields": reuse["fields"],
+            "ai_call": 1 if reuse["ai_call"] else 0
+        }
+
+    def _run_ai_text_stage(self, previous):
+        if not self.text:
+            self._log(STAGE_AI_TEXT, time.time(), decision="Skipped", reason=_("No text to send"))
+            return None
+
+        self.ai_calls += 1
+        result = self.doc._process_text_with_ai(self.text, "combined")
+        # A long text is read in chunks, one call each
+        calls = cint(result.get("chunks")) or 1
+        self.ai_calls += calls - 1
+        return dict(self._combined_result(STAGE_AI_TEXT, result, previous), ai_call=calls)
+
+    def _run_ai_vision_stage(self, previous):
+        if not self.is_image or not self.allow_vision:
+            reason = _("Vision is disabled") if self.is_image else _("Not an image file")
+            self._log(STAGE_AI_VISION, time.time(), decision="Skipped", reason=reason)
+            return None
+
+        self.ai_calls += 1
+        result = process_image_with_ai(self.doc.file_to_read, "combined",
+                                       reference=(self.doc.doctype, self.doc.name))
+        return self._combined_result(STAGE_AI_VISION, result, previous)
+
+    def _combined_result(self, stage, result, previous):
+        if result["status"] != "success":
+            raise Exception(result.get("message", "Unknown error"))
+
+        content = result["content"]
+        combined_data, partial = parse_json_reply(content)
+        if combined_data is not None:
+            classification, fields = self.doc._split_combined_result(combined_data)
+        else:
+            classification = self.doc._parse_classification_text(content)
+            fields = {"extracted_text": content}
+
+        # Keep what earlier stages found for fields this reply left empty
+        for field, value in ((previous or {}).get("fields") or {}).items():
+            if fields.get(field) in (None, "", [], {}):
+                fields[field] = value
+
+        return {
+            "stage": stage,
+            "method": result.get("model") or stage,
+            "classification": classification,
+            "classification_source": SOURCE_AI,
+            "fields": fields,
+            "partial": partial or result.get("partial", False)
+        }
+
+    def _evaluate(self, result):
+        classification = result["classification"]
+        document_type = classification.get("suggested_doctype") or classification.get("document_type")
+        if not document_type:
+            result["coverage"] = 0.0
+            return False, _("No document type detected")
+
+        min_confidence, min_coverage, required_fields = get_thresholds(document_type)
+        confidence = flt(classification.get("confidence"))
+        result["coverage"] = coverage = get_field_coverage(result["fields"], required_fields)
+        if result.get("partial"):
+            # Fields after the cut are missing; a later stage reads the document again
+            return False, _("The reply was cut off")
+
+        missing = [field for field in required_fields if result["fields"].get(field) in (None, "", [], {})]
+        if confidence < min_confidence:
+            return False, _("Confidence {0} below {1}").format(confidence, min_confidence)
+        if coverage < min_coverage:
+            return False, _("Field coverage {0}% below {1}% (missing: {2})").format(
+                coverage, min_coverage, ", ".join(missing))
+        return True, _("Confidence {0} and field coverage {1}% meet the thresholds").format(confidence, coverage)
+
+    def _log(self, stage, start, result=None, decision="Escalated", reason=None):
+        classification = (result or {}).get("classification") or {}
+        ai_call = (result or {}).get("ai_call", 0 if stage == STAGE_TEXT else 1)
+        self.doc.append("processing_log", {
+            "stage": stage,
+            "method": (result or {}).get("method"),
+            "document_type": classification.get("suggested_doctype") or classification.get("document_type"),
+            "confidence": flt(classification.get("confidence")),
+            "field_coverage": flt((result or {}).get("coverage")),
+            "decision": decision,
+            "reason": reason,
+            "duration": flt(time.time() - start, 3),
+            "ai_call": cint(ai_call) if decision != "Skipped" else 0,
+            "processed_on": now_datetime()
+        })
+
+    def _apply(self, result, accepted):
+        if self.text:
+            # Page breaks were only needed to chunk the text
+            self.doc.read_result = strip_page_breaks(self.text)
+        if result["classification"]:
+            self.doc._set_classification(result["classification"], result["classification_source"])
+        self.doc.ai_result = json.dumps(result["fields"], indent=2)
+        self.doc.processing_stage = result["stage"] if accepted else _("{0} (below threshold)").format(result["stage"])
+        self.doc.save()
+
+
+def run_cascade(doc):
+    return ProcessingCascade(doc).run()
+
+
+@frappe.whitelist()
+def get_cascade_summary(from_date=None, to_date=None):
+    """How far documents went through the cascade and the AI calls it avoided"""
+    frappe.only_for("System Manager")
+
+    to_date = to_date or now_datetime()
+    from_date = from_date or add_days(to_date, -30)
+
+    # Child rows take their parent's creation, so filter on when each stage ran;
+    # rows logged before stages were timestamped fall back to the read's last change
+    rows = frappe.db.sql("""
+        SELECT stage.parent, stage.stage, stage.decision, stage.ai_call
+        FROM `tabOCR Processing Stage` stage
+        INNER JOIN `tabOCR Read` ocr ON ocr.name = stage.parent
+        WHERE stage.parenttype = 'OCR Read'
+            AND IFNULL(stage.processed_on, ocr.modified) BETWEEN %s AND %s
+    """, (from_date, to_date), as_dict=True)
+
+    documents = {}
+    for row in rows:
+        document = documents.setdefault(row.parent, {"resolved_by": None, "ai_calls": 0})
+        document["ai_calls"] += cint(row.ai_call)
+        if row.decision == "Accepted":
+            document["resolved_by"] = row.stage
+
+    resolved_by = {}
+    for document in documents.values():
+        key = document["resolved_by"] or _("Unresolved")
+        resolved_by[key] = resolved_by.get(key, 0) + 1
+
+    ai_calls = sum(document["ai_calls"] for document in documents.values())
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "documents": len(documents),
+        "resolved_by": resolved_by,
+        "ai_calls": ai_calls,
+        "ai_calls_per_document": flt(ai_calls / len(documents), 2) if documents else 0.0,
+        # Reading with AI directly costs at least one call per document
+        "ai_calls_avoided": sum(1 for document in documents.values()
+                                if document["resolved_by"] in (STAGE_TEXT, STAGE_TEMPLATE) and not document["ai_calls"])
+    }
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Provider-aware rate limiting and retry handling for AI API calls.
+
+Each AI Integration Settings record gets two token buckets in Redis (requests
+per minute and tokens per minute) so that every worker on the site draws from
+the same quota. Requests that come back with 429 or a transient 5xx are
+retried with jittered exponential backoff, honouring ``Retry-After`` when the
+provider sends it.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from json import dumps
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from frappe.utils import cint, flt
+from erpnext_ocr.erpnext_ocr.ai_usage import add_bytes_sent, log_request_attempt
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+MAX_BACKOFF_SECONDS = 60
+DEFAULT_IMAGE_TOKENS = 1000
+POOL_SIZE = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Atomically refill and draw from any number of buckets. ARGV holds
+# ``now`` followed by (capacity, refill_per_second, cost) per key. Either every
+# bucket is debited or none is, and the longest wait is returned.
+_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[(i - 1) * 3 + 2])
+    local rate = tonumber(ARGV[(i - 1) * 3 + 3])
+    local cost = math.min(tonumber(ARGV[(i - 1) * 3 + 4]), capacity)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens - cost
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', levels[i], 'ts', now)
+    redis.call('EXPIRE', key, 120)
+end
+return '0'
+"""
+
+# Give back (or charge) ARGV[1] tokens, capped at ARGV[2]. An expired bucket is
+# left alone: the next draw starts it full anyway.
+_RECONCILE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local capacity = tonumber(ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or capacity
+redis.call('HSET', KEYS[1], 'tokens', math.min(capacity, tokens + tonumber(ARGV[1])))
+redis.call('EXPIRE', KEYS[1], 120)
+return 1
+"""
+
+
+class RateLimiter(object):
+    """Shared requests/min and tokens/min buckets for one AI settings record"""
+
+    def __init__(self, settings):
+        self.name = settings.name
+        self.requests_per_minute = cint(settings.get("requests_per_minute"))
+        self.tokens_per_minute = cint(settings.get("tokens_per_minute"))
+
+    @property
+    def enabled(self):
+        return bool(self.requests_per_minute or self.tokens_per_minute)
+
+    def _bucket_key(self, kind):
+        return frappe.cache().make_key("ai_rate_limit:{0}:{1}".format(self.name, kind))
+
+    def _buckets(self, tokens):
+        buckets = []
+        if self.requests_per_minute:
+            buckets.append((self._bucket_key("requests"), self.requests_per_minute, 1))
+        if self.tokens_per_minute:
+            buckets.append((self._bucket_key("tokens"), self.tokens_per_minute, tokens))
+        return buckets
+
+    def try_acquire(self, tokens=0):
+        """Draw from the buckets. Returns 0 on success, else seconds to wait"""
+        buckets = self._buckets(tokens)
+        if not buckets:
+            return 0
+
+        keys = [key for key, capacity, cost in buckets]
+        args = [time.time()]
+        for key, capacity, cost in buckets:
+            args.extend([capacity, capacity / 60.0, cost])
+
+        try:
+            wait = frappe.cache().eval(_TOKEN_BUCKET_SCRIPT, len(keys), *(keys + args))
+        except Exception:
+            # Never let a Redis hiccup block AI processing altogether
+            frappe.log_error(frappe.get_traceback(), "AI Rate Limiter Error")
+            return 0
+
+        return flt(frappe.safe_decode(wait))
+
+    def acquire(self, tokens=0):
+        """Block until the buckets have room for one request of ``tokens``"""
+        if not self.enabled:
+            return
+
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(min(wait, MAX_BACKOFF_SECONDS) + random.uniform(0, 0.05))
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """Return over-reserved tokens (or charge the shortfall) once usage is known"""
+        if not self.tokens_per_minute or not actual_tokens:
+            return
+
+        try:
+            frappe.cache().eval(_RECONCILE_SCRIPT, 1, self._bucket_key("tokens"),
+                                flt(estimated_tokens) - flt(actual_tokens), self.tokens_per_minute)
+        except Exception:
+            pass
+
+
+def estimate_request_tokens(data):
+    """Rough token cost of a chat completion payload, including the reply budget"""
+    chars = 0
+    images = 0
+    for message in data.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text") or "")
+                else:
+                    images += 1
+        else:
+            chars += len(content or "")
+
+    return chars // 4 + images * DEFAULT_IMAGE_TOKENS + cint(data.get("max_tokens"))
+
+
+def get_retry_after(response):
+    """Seconds the provider asked us to wait, or None"""
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        return flt(retry_after_ms) / 1000.0
+
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff(attempt, base):
+    """Full-jitter exponential backoff for the given (zero-based) attempt"""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, base * (2 ** attempt)))
+
+
+def get_session(url):
+    """Pooled keep-alive session per scheme and host, shared by all threads in the process"""
+    parts = urlsplit(url)
+    origin = "{0}://{1}".format(parts.scheme, parts.netloc)
+
+    session = _sessions.get(origin)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount(origin, adapter)
+                _sessions[origin] = session
+    return session
+
+
+def post_with_retry(settings, url, headers=None, json=None, stream=False):
+    """POST to an AI endpoint through the rate limiter, retrying transient failures.
+
+    The final response is returned as-is so callers keep their existing
+    status-code handling; connection errors are re-raised after the last try.
+    Connections are pooled per host and reused across calls.
+    """
+    limiter = RateLimiter(settings)
+    max_retries = cint(settings.get("max_retries"))
+    backoff_base = flt(settings.get("retry_backoff")) or 1.0
+    timeout = settings.timeout or 30
+    estimated_tokens = estimate_request_tokens(json or {})
+
+    # Serialise once so the size can be recorded and retries reuse the body
+    body = dumps(json or {}).encode("utf-8")
+    headers = dict(headers or {})
+    headers.setdefault("Content-Type", "application/json")
+
+    attempt = 0
+    while True:
+        limiter.acquire(estimated_tokens)
+
+        try:
+            add_bytes_sent(len(body))
+            response = get_session(url).post(url, headers=headers, data=body, timeout=timeout, stream=stream)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            log_request_attempt(status="Error", error=str(e))
+            time.sleep(get_backoff(attempt, backoff_base))
+            attempt += 1
+            continue
+
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            break
+
+        log_request_attempt(status="Error", error="HTTP {0}".format(response.status_code))
+        retry_after = get_retry_after(response)
+        # Release the pooled connection; an unread streamed body would keep it checked out
+        response.close()
+        if retry_after is not None:
+            time.sleep(min(retry_after, MAX_BACKOFF_SECONDS) + random.uniform(0, backoff_base))
+        else:
+            time.sleep(get_backoff(attempt, backoff_base))
+        attempt += 1
+
+    if response.status_code == 200 and not stream:
+        try:
+            usage = response.json().get("usage") or {}
+            limiter.reconcile(estimated_tokens, usage.get("total_tokens"))
+        except ValueError:
+            pass
+
+    return response
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Relay streamed AI output to the browser through ``frappe.publish_realtime``.
+
+Provider deltas arrive every few characters; they are buffered and pushed to
+the document's realtime room at most every ``FLUSH_INTERVAL`` seconds (the
+first delta goes out immediately) so the form can show text as it is
+generated without flooding socket.io.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import time
+
+STREAM_EVENT = "ocr_ai_stream"
+FLUSH_INTERVAL = 0.25
+FLUSH_CHARS = 512
+
+
+class RealtimeStream(object):
+    """Streamed output of one AI call (or one chunk of a chunked call) for a document"""
+
+    def __init__(self, doctype, docname, part=1, total_parts=1):
+        self.doctype = doctype
+        self.docname = docname
+        self.part = part
+        self.total_parts = total_parts
+        self.buffer = []
+        self.buffered_chars = 0
+        self.last_flush = 0
+
+    def for_part(self, part, total_parts):
+        """Stream for one chunk of a document processed in parts"""
+        return RealtimeStream(self.doctype, self.docname, part, total_parts)
+
+    def _publish(self, **message):
+        message.update({"name": self.docname, "part": self.part, "total_parts": self.total_parts})
+        frappe.publish_realtime(STREAM_EVENT, message, doctype=self.doctype, docname=self.docname)
+
+    def restart(self):
+        """Discard output of a previous attempt (retry at a larger budget or failover)"""
+        self.buffer = []
+        self.buffered_chars = 0
+        self._publish(restart=True)
+
+    def send(self, text):
+        self.buffer.append(text)
+        self.buffered_chars += len(text)
+        if self.buffered_chars >= FLUSH_CHARS or time.time() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._publish(delta="".join(self.buffer))
+            self.buffer = []
+            self.buffered_chars = 0
+        self.last_flush = time.time()
+
+    def finish(self, status="success"):
+        """Flush what is left and tell the client the call is over"""
+        self.flush()
+        self._publish(done=True, status=status)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Schema-constrained JSON replies and a tolerant parser for the rest.
+
+OpenAI-compatible providers are asked for ``response_format`` JSON (a JSON
+schema where the model supports it) so classification and extraction come
+back as parseable objects. ``parse_json_object`` recovers the object from
+replies that are still wrapped in prose or markdown fences, or that were cut
+off mid-way, before anyone falls back to free-text heuristics.
+``parse_json_reply`` also tells whether the object was repaired from a
+cut-off reply and so is only partial.
+"""
+
+from __future__ import unicode_literals
+import json
+import re
+
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "document_type": {"type": "string"},
+        "confidence": {"type": "number"},
+        "suggested_doctype": {"type": "string"},
+        "key_fields": {"type": "array", "items": {"type": "string"}},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["document_type", "confidence", "suggested_doctype", "key_fields", "reasoning"],
+    "additionalProperties": False
+}
+
+_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "quantity": {"type": "number"},
+        "rate": {"type": "number"},
+        "amount": {"type": "number"}
+    }
+}
+
+# Extracted fields vary per document, so this schema guides rather than constrains
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "supplier_name": {"type": "string"},
+        "customer_name": {"type": "string"},
+        "invoice_no": {"type": "string"},
+        "date": {"type": "string"},
+        "due_date": {"type": "string"},
+        "total": {"type": "number"},
+        "tax": {"type": "number"},
+        "subtotal": {"type": "number"},
+        "currency": {"type": "string"},
+        "items": {"type": "array", "items": _ITEM_SCHEMA}
+    }
+}
+
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": dict(CLASSIFICATION_SCHEMA["properties"], fields=EXTRACTION_SCHEMA),
+    "required": ["document_type", "confidence", "suggested_doctype", "fields"]
+}
+
+# prompt type -> (schema name, schema, strict)
+RESPONSE_SCHEMAS = {
+    "classification": ("document_classification", CLASSIFICATION_SCHEMA, True),
+    "extraction": ("document_extraction", EXTRACTION_SCHEMA, False),
+    "combined": ("document_classification_and_extraction", COMBINED_SCHEMA, False),
+}
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# A number, true, false or null running into the end of a cut-off reply
+_TRAILING_SCALAR = re.compile(r"[-+.\w]+$")
+
+
+def get_response_format(settings, prompt_type):
+    """``response_format`` for a chat completion, or None for free text (e.g. OCR)"""
+    mode = settings.get("structured_output") or "JSON Schema"
+    if mode == "Off" or prompt_type not in RESPONSE_SCHEMAS:
+        return None
+    if mode == "JSON Object":
+        return {"type": "json_object"}
+
+    name, schema, strict = RESPONSE_SCHEMAS[prompt_type]
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": strict}}
+
+
+def _loads_object(text):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            data = json.loads(_TRAILING_COMMA.sub(r"\1", text))
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def _scan_object(text, start):
+    """End index of the balanced object at ``start``, the closers still open at the end
+    and where the string open at the end started, if any"""
+    stack = []
+    string_start = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if string_start is not None:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                string_start = None
+        elif char == '"':
+            string_start = index
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return index + 1, [], None
+    return None, stack, string_start
+
+
+def _repair_truncated(fragment, closers, string_start):
+    """Close a reply that was cut off, dropping the incomplete trailing member
+
+    A string still open at the end, or a number or literal running into the
+    end, may be cut short, so it is dropped with its key rather than kept with
+    a wrong value.
+    """
+    if string_start is not None:
+        fragment = fragment[:string_start]
+    else:
+        fragment = _TRAILING_SCALAR.sub("", fragment)
+
+    candidates = [fragment]
+    # Drop a dangling key, a key without value or a trailing comma
+    trimmed = re.sub(r',?\s*"[^"]*"\s*:?\s*$', "", fragment)
+    trimmed = re.sub(r",\s*$", "", trimmed)
+    candidates.append(trimmed)
+    # Or cut back to the last complete member
+    last_comma = fragment.rfind(",")
+    if last_comma > 0:
+        candidates.append(fragment[:last_comma])
+
+    suffix = "".join(reversed(closers))
+    for candidate in candidates:
+        data = _loads_object(candidate + suffix)
+        if data is not None:
+            return data
+    return None
+
+
+def parse_json_reply(content):
+    """``(object, partial)`` from a model reply; the object is None when none is found
+
+    Tries, in order: the whole reply, fenced code blocks, the first balanced
+    ``{...}`` in the text, and finally a repair of a truncated object. A
+    repaired object is ``partial``: members after the cut are missing, so
+    callers should re-request or reject it rather than take it as complete.
+    """
+    if not content:
+        return None, False
+    if isinstance(content, dict):
+        return content, False
+
+    text = content.strip()
+    data = _loads_object(text)
+    if data is not None:
+        return data, False
+
+    for block in _FENCE.findall(text):
+        data = _loads_object(block.strip())
+        if data is not None:
+            return data, False
+
+    start = text.find("{")
+    while start != -1:
+        end, closers, string_start = _scan_object(text, start)
+        if end is None:
+            string_start = string_start - start if string_start is not None else None
+            data = _repair_truncated(text[start:], closers, string_start)
+            return data, data is not None
+        data = _loads_object(text[start:end])
+        if data is not None:
+            return data, False
+        start = text.find("{", start + 1)
+    return None, False
+
+
+def parse_json_object(content):
+    """Best-effort JSON object from a model reply, or None; see ``parse_json_reply``
+
+    A repaired truncated object is returned as is.
+    """
+    return parse_json_reply(content)[0]
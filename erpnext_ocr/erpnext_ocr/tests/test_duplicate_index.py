@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.duplicate_index import get_invoice_keys
+
+
+class TestInvoiceKeys(unittest.TestCase):
+	def test_unmatched_supplier_is_keyed_by_name(self):
+		existing = get_invoice_keys("Purchase Invoice", {
+			"supplier": "SUP-0001", "supplier_name": "Acme Traders", "bill_no": "INV-001"})
+		extracted = get_invoice_keys("Purchase Invoice", {
+			"supplier": "", "supplier_name": "ACME Traders Pvt. Ltd.", "bill_no": "inv 001"})
+		self.assertEqual(extracted, ["bill|acme traders|inv001"])
+		self.assertIn(extracted[0], existing)
+		self.assertIn("bill|sup 0001|inv001", existing)
+
+	def test_same_link_and_name_give_one_key(self):
+		keys = get_invoice_keys("Purchase Invoice", {
+			"supplier": "Acme Traders", "supplier_name": "Acme Traders", "bill_no": "INV-001"})
+		self.assertEqual(keys, ["bill|acme traders|inv001"])
+
+	def test_no_party_gives_no_keys(self):
+		self.assertEqual(get_invoice_keys("Purchase Invoice", {"bill_no": "INV-001"}), [])
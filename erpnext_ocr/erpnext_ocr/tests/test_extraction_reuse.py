@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.extraction_reuse import plan_reuse
+
+HEADER = [
+	"ACME Industrial Supplies Pvt Ltd",
+	"42 Harbour Road, Industrial Estate, Pune 411001",
+	"GSTIN 27AABCA1234F1Z5  Phone +91 20 5555 1234",
+	"TAX INVOICE",
+	"Bill To: Globex Corporation",
+	"Plot 7, MIDC Andheri East, Mumbai",
+]
+FOOTER = [
+	"Bank: HDFC Bank, A/c 50200012345678, IFSC HDFC0000123",
+	"Terms and conditions: Goods once sold will not be taken back.",
+	"Subject to Pune jurisdiction. This is a computer generated invoice.",
+	"For ACME Industrial Supplies Pvt Ltd",
+	"Authorised Signatory",
+]
+
+
+def invoice(number, date, rows, terms="Net 30"):
+	total = sum(quantity * rate for _name, quantity, rate in rows)
+	lines = HEADER + [
+		"Invoice No: {0}".format(number),
+		"Invoice Date: {0}".format(date),
+		"Payment Terms: {0}".format(terms),
+		"Item Description Qty Rate Amount",
+	]
+	lines += ["{0} {1} {2:.2f} {3:.2f}".format(name, quantity, rate, quantity * rate) for name, quantity, rate in rows]
+	lines += ["Grand Total {0:.2f}".format(total)] + FOOTER
+	return "\n".join(lines)
+
+
+ROWS = [("Widget A", 2, 5.0), ("Widget B", 1, 15.0)]
+EARLIER_FIELDS = {
+	"supplier_name": "ACME Industrial Supplies Pvt Ltd",
+	"invoice_no": "INV-2001",
+	"date": "01/05/2025",
+	"total": 25.0,
+	"items": [{"name": name, "quantity": quantity, "rate": rate, "amount": quantity * rate}
+		for name, quantity, rate in ROWS]
+}
+EARLIER_TEXT = invoice("INV-2001", "01/05/2025", ROWS)
+
+
+class TestExtractionReuse(unittest.TestCase):
+	def test_unchanged_fields_are_kept(self):
+		plan = plan_reuse(EARLIER_TEXT, EARLIER_FIELDS, invoice("INV-2002", "01/06/2025", ROWS))
+		self.assertEqual(sorted(plan["kept"]), ["items", "supplier_name", "total"])
+		self.assertEqual(sorted(plan["changed"]), ["date", "invoice_no"])
+		self.assertNotIn("Widget A", plan["excerpt"])
+
+	def test_added_row_rereads_items(self):
+		rows = ROWS + [("Gadget C", 3, 7.0)]
+		plan = plan_reuse(EARLIER_TEXT, EARLIER_FIELDS, invoice("INV-2002", "01/06/2025", rows))
+		self.assertIn("items", plan["changed"])
+		self.assertIn("total", plan["changed"])
+		self.assertIn("Widget A 2 5.00 10.00", plan["excerpt"])
+		self.assertIn("Gadget C 3 7.00 21.00", plan["excerpt"])
+
+	def test_added_row_alone_is_not_kept(self):
+		text = EARLIER_TEXT.replace("Widget B 1 15.00 15.00", "Widget B 1 15.00 15.00\nGadget C 3 7.00 21.00")
+		plan = plan_reuse(EARLIER_TEXT, EARLIER_FIELDS, text)
+		self.assertEqual(plan["changed"], ["items"])
+
+	def test_change_outside_any_field_needs_full_extraction(self):
+		text = invoice("INV-2001", "01/05/2025", ROWS, terms="Net 45")
+		self.assertIsNone(plan_reuse(EARLIER_TEXT, EARLIER_FIELDS, text))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.item_index import ItemIndex, is_confident
+
+
+def confident(match):
+	return bool(match) and is_confident(match[1], match[3])
+
+
+class TestItemIndex(unittest.TestCase):
+	def setUp(self):
+		self.index = ItemIndex()
+		self.index.add("BOLT-M8", texts=["BOLT-M8", "Hex Bolt M8 x 40"], barcodes=["4006381333931"],
+					   supplier_parts=[("SUP-1", "HB-840")])
+		self.index.add("BOLT-M10", texts=["BOLT-M10", "Hex Bolt M10 x 40"])
+		self.index.add("WASHER-M8", texts=["WASHER-M8", "Flat Washer M8 Zinc Plated"],
+					   aliases=[("SUP-1", "Washer 8mm ZP")])
+
+	def test_codes_and_aliases_are_confident(self):
+		self.assertEqual(self.index.resolve(["4006381333931"], "")[:3], ("BOLT-M8", 1.0, "barcode"))
+		self.assertEqual(self.index.resolve(["HB-840"], "", "SUP-1")[:3], ("BOLT-M8", 1.0, "supplier_part_no"))
+		self.assertEqual(self.index.resolve(["bolt m10"], "")[:3], ("BOLT-M10", 1.0, "item_code"))
+		self.assertTrue(confident(self.index.resolve([], "Washer 8mm ZP", "SUP-1")))
+		self.assertFalse(confident(self.index.resolve([], "Washer 8mm ZP", "SUP-2")))
+
+	def test_close_match_with_margin_is_confident(self):
+		match = self.index.resolve([], "Flat Washer M8 Zlnc Plated")
+		self.assertEqual(match[0], "WASHER-M8")
+		self.assertTrue(confident(match))
+
+	def test_close_match_without_margin_is_not_confident(self):
+		match = self.index.resolve([], "Hex Bolt M9 x 40")
+		self.assertIn(match[0], ("BOLT-M8", "BOLT-M10"))
+		self.assertFalse(confident(match))
+
+	def test_removed_item_no_longer_matches(self):
+		self.index.remove("BOLT-M8")
+		self.assertIsNone(self.index.resolve(["4006381333931"], ""))
+		self.assertTrue(confident(self.index.resolve([], "Hex Bolt M10 x 40")))
+		self.assertTrue(self.index.needs_rebuild())
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.party_index import PartyIndex, is_confident
+
+
+def confident(match):
+	return bool(match) and is_confident(match[1], match[3])
+
+
+class TestPartyIndex(unittest.TestCase):
+	def setUp(self):
+		self.index = PartyIndex("Supplier")
+		self.index.add("SUP-1", names=["ABC Traders"], tax_id="27AABCA1234F1Z5")
+		self.index.add("SUP-2", names=["ABD Traders"], phones=["+91 20 5555 1234"])
+		self.index.add("SUP-3", names=["Globex Industrial Solutions"])
+
+	def test_exact_matches_are_confident(self):
+		self.assertEqual(self.index.resolve("ABC Traders Pvt Ltd")[:3], ("SUP-1", 1.0, "name"))
+		self.assertTrue(confident(self.index.resolve("27AABCA1234F1Z5")))
+		self.assertTrue(confident(self.index.resolve("020 5555 1234")))
+
+	def test_close_match_with_margin_is_confident(self):
+		match = self.index.resolve("Globex Industrial Solutlons")
+		self.assertEqual(match[0], "SUP-3")
+		self.assertTrue(confident(match))
+
+	def test_weak_or_ambiguous_matches_are_not_confident(self):
+		self.assertFalse(confident(self.index.resolve("Traders")))
+		self.assertFalse(confident(self.index.resolve("ABX Traders")))
+
+	def test_same_name_for_two_parties_is_a_tie(self):
+		self.index.add("SUP-4", names=["ABC Traders Ltd"])
+		self.assertFalse(confident(self.index.resolve("ABC Traders")))
+		self.index.remove("SUP-4")
+		self.assertTrue(confident(self.index.resolve("ABC Traders")))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.structured_output import parse_json_object, parse_json_reply
+
+
+class TestStructuredOutput(unittest.TestCase):
+	def test_complete_replies_are_not_partial(self):
+		self.assertEqual(parse_json_reply('{"total": 12.5}'), ({"total": 12.5}, False))
+		self.assertEqual(parse_json_reply('Here you go:\n```json\n{"a": 1,}\n```'), ({"a": 1}, False))
+		self.assertEqual(parse_json_reply("no json here"), (None, False))
+
+	def test_cut_off_string_is_dropped(self):
+		self.assertEqual(parse_json_reply('{"invoice_no": "INV-1", "supplier_name": "Acme Tra'),
+						 ({"invoice_no": "INV-1"}, True))
+		self.assertEqual(parse_json_reply('{"note": "said \\"hi'), ({}, True))
+
+	def test_trailing_number_is_dropped(self):
+		self.assertEqual(parse_json_reply('{"invoice_no": "INV-1", "total": 12'), ({"invoice_no": "INV-1"}, True))
+		self.assertEqual(parse_json_reply('{"items": [{"name": "Bolt", "qty": 4'),
+						 ({"items": [{"name": "Bolt"}]}, True))
+
+	def test_complete_trailing_members_are_kept(self):
+		self.assertEqual(parse_json_reply('{"items": [{"name": "Bolt", "qty": 4}'),
+						 ({"items": [{"name": "Bolt", "qty": 4}]}, True))
+		self.assertEqual(parse_json_object('{"a": "b", "c"'), {"a": "b"})
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import unittest
+
+from erpnext_ocr.erpnext_ocr.text_chunker import merge_extractions, strip_page_breaks
+
+
+class TestTextChunker(unittest.TestCase):
+	def test_strip_page_breaks(self):
+		self.assertEqual(strip_page_breaks("Page one\n\fPage two\n\f"), "Page one\nPage two\n")
+		self.assertEqual(strip_page_breaks("a\fb"), "a\nb")
+
+	def test_rows_are_concatenated(self):
+		merged = merge_extractions([
+			{"items": [{"name": "Bolt", "qty": 1}]},
+			{"items": [{"name": "Bolt", "qty": 1}, {"name": "Nut", "qty": 2}]}
+		])
+		self.assertEqual(len(merged["items"]), 3)
+
+	def test_scalar_lists_are_merged_once(self):
+		merged = merge_extractions([
+			{"key_fields": ["invoice_no", "date"], "supplier_name": "Acme", "total": 10},
+			{"key_fields": ["date", "total"], "supplier_name": "Other", "total": 12}
+		])
+		self.assertEqual(merged["key_fields"], ["invoice_no", "date", "total"])
+		self.assertEqual(merged["supplier_name"], "Acme")
+		self.assertEqual(merged["total"], 12)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import datetime
+import unittest
+
+from erpnext_ocr.erpnext_ocr.value_formats import (
+	DAY_FIRST, DECIMAL_COMMA, DECIMAL_POINT, MONTH_FIRST, ValueFormats, decimal_separator_of, detect_formats
+)
+
+
+class TestDecimalSeparator(unittest.TestCase):
+	def test_unambiguous_numbers(self):
+		self.assertEqual(decimal_separator_of("1.234,56"), DECIMAL_COMMA)
+		self.assertEqual(decimal_separator_of("1,234.56"), DECIMAL_POINT)
+		self.assertEqual(decimal_separator_of("1.234.567"), DECIMAL_COMMA)
+		self.assertEqual(decimal_separator_of("12,5"), DECIMAL_COMMA)
+
+	def test_leading_zero_group_is_decimal(self):
+		self.assertEqual(decimal_separator_of("0.125"), DECIMAL_POINT)
+		self.assertEqual(decimal_separator_of("0,125"), DECIMAL_COMMA)
+
+	def test_three_digit_group_is_ambiguous(self):
+		self.assertIsNone(decimal_separator_of("1.234"))
+		self.assertIsNone(decimal_separator_of("1,234"))
+
+
+class TestParseAmount(unittest.TestCase):
+	def test_grouped_amounts(self):
+		formats = ValueFormats()
+		self.assertEqual(formats.parse_amount("1.234,56"), 1234.56)
+		self.assertEqual(formats.parse_amount("USD 1,234.56"), 1234.56)
+		self.assertEqual(formats.parse_amount("0.125"), 0.125)
+		self.assertEqual(formats.parse_amount("(1,234.50)"), -1234.5)
+		self.assertEqual(formats.parse_amount("12-"), -12.0)
+		self.assertEqual(formats.parse_amount(""), 0.0)
+
+	def test_ambiguous_amount_follows_document_format(self):
+		self.assertEqual(ValueFormats(decimal_separator=DECIMAL_COMMA).parse_amount("1.234"), 1234.0)
+		self.assertEqual(ValueFormats(decimal_separator=DECIMAL_POINT).parse_amount("1,234"), 1234.0)
+		self.assertEqual(ValueFormats(decimal_separator=DECIMAL_COMMA).parse_amount("1,234"), 1.234)
+
+
+class TestParseDate(unittest.TestCase):
+	def test_dates(self):
+		formats = ValueFormats(date_order=MONTH_FIRST)
+		self.assertEqual(formats.parse_date("2025-03-04"), datetime.date(2025, 3, 4))
+		self.assertEqual(formats.parse_date("03/04/2025"), datetime.date(2025, 3, 4))
+		self.assertEqual(formats.parse_date("25/03/2025"), datetime.date(2025, 3, 25))
+		self.assertEqual(formats.parse_date("4th March 2025"), datetime.date(2025, 3, 4))
+		self.assertEqual(formats.parse_date("Mar 4, 2025"), datetime.date(2025, 3, 4))
+		self.assertEqual(ValueFormats(date_order=DAY_FIRST).parse_date("03/04/25"), datetime.date(2025, 4, 3))
+
+
+class TestDetectFormats(unittest.TestCase):
+	def test_votes(self):
+		self.assertEqual(detect_formats(["25/03/2025", "01/04/2025"], ["1.234,56", "0,125"]),
+						 (DAY_FIRST, DECIMAL_COMMA))
+		self.assertEqual(detect_formats(["03/25/2025"], ["1,234.56"]), (MONTH_FIRST, DECIMAL_POINT))
+		self.assertEqual(detect_formats(["01/04/2025"], ["1,234"]), (None, None))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Split long document text into prompt-sized chunks and merge the per-chunk
+extraction results back into one record.
+
+Chunks are cut on page boundaries (form feeds) first, then on blank-line
+separated sections, then on lines, so a table row is never split in half
+unless a single line is larger than the whole budget. Page breaks are only
+kept for chunking; stored text goes through ``strip_page_breaks``.
+"""
+
+from __future__ import unicode_literals
+import re
+from erpnext_ocr.erpnext_ocr.token_budget import count_tokens
+
+DEFAULT_CHUNK_TOKENS = 1000
+PAGE_BREAK = "\f"
+
+_SECTION_BREAK = re.compile(r"\n\s*\n")
+
+# Totals appear at the end of a document, so later chunks win for these keys
+_LAST_VALUE_WINS = re.compile(r"total|balance|amount_due|grand", re.IGNORECASE)
+
+
+def _split_units(text, max_tokens, model=None):
+    """Break text into units no larger than max_tokens, largest boundaries first"""
+    units = []
+    for page in text.split(PAGE_BREAK):
+        if not page.strip():
+            continue
+        if count_tokens(page, model) <= max_tokens:
+            units.append(page)
+            continue
+
+        for section in _SECTION_BREAK.split(page):
+            if not section.strip():
+                continue
+            if count_tokens(section, model) <= max_tokens:
+                units.append(section)
+                continue
+
+            for line in section.split("\n"):
+                if count_tokens(line, model) <= max_tokens:
+                    units.append(line)
+                else:
+                    size = max_tokens * 4
+                    units.extend(line[i:i + size] for i in range(0, len(line), size))
+    return units
+
+
+def strip_page_breaks(text):
+    """Text without the page break markers added for chunking, pages separated by a line break"""
+    return (text or "").replace("\n" + PAGE_BREAK, "\n").replace(PAGE_BREAK, "\n")
+
+
+def split_into_chunks(text, max_tokens=DEFAULT_CHUNK_TOKENS, model=None):
+    """Greedily pack page/section/line units into chunks of at most max_tokens"""
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in _split_units(text, max_tokens, model):
+        unit_tokens = count_tokens(unit, model)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(unit)
+        current_tokens += unit_tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _merge_lists(existing, value):
+    """Rows (lists of dicts, such as line items) in chunk order; other lists (such as key_fields) once each"""
+    existing = existing if isinstance(existing, list) else []
+    if any(isinstance(entry, dict) for entry in existing + value):
+        return existing + value
+    merged = list(existing)
+    for entry in value:
+        if entry not in merged:
+            merged.append(entry)
+    return merged
+
+
+def merge_extractions(results):
+    """Merge per-chunk extraction dicts into one.
+
+    Lists of rows (line items) are concatenated in chunk order and lists of
+    scalars are merged without repeats. Nested dicts are merged recursively,
+    and for scalars the first non-empty value wins except for totals, where
+    the last one does.
+    """
+    merged = {}
+    for result in results:
+        for key, value in (result or {}).items():
+            if _is_empty(value):
+                merged.setdefault(key, value)
+                continue
+
+            existing = merged.get(key)
+            if isinstance(value, list):
+                merged[key] = _merge_lists(existing, value)
+            elif isinstance(value, dict):
+                merged[key] = merge_extractions([existing if isinstance(existing, dict) else {}, value])
+            elif _is_empty(existing) or _LAST_VALUE_WINS.search(key):
+                merged[key] = value
+    return merged
+
+
+def merge_usage(usages):
+    """Sum the numeric token counters of several provider usage dicts"""
+    total = {}
+    for usage in usages:
+        for key, value in (usage or {}).items():
+            if isinstance(value, (int, float)):
+                total[key] = total.get(key, 0) + value
+    return total
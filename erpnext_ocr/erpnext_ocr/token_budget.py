@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Token budgets for AI requests.
+
+Instead of reserving ``settings.max_tokens`` for every call, the reply budget
+is sized per task: a classification needs a couple of hundred tokens, while an
+extraction grows with the amount of text sent. ``settings.max_tokens`` stays
+the upper bound. Predicted and actual usage are aggregated in Redis per model
+and task so the profiles can be tuned from real traffic.
+"""
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint, flt
+from erpnext_ocr.erpnext_ocr.ai_usage import log_request_attempt
+
+DEFAULT_MAX_TOKENS = 4000
+PROMPT_OVERHEAD_TOKENS = 200
+
+# min/max output tokens and output tokens expected per input token
+TASK_PROFILES = {
+    "classification": {"min_output": 150, "max_output": 400, "ratio": 0.0, "max_input": 1000, "image_output": 300},
+    "extraction": {"min_output": 500, "max_output": None, "ratio": 0.6, "max_input": None, "image_output": 2000},
+    "combined": {"min_output": 700, "max_output": None, "ratio": 0.6, "max_input": None, "image_output": 2200},
+    "ocr": {"min_output": 500, "max_output": None, "ratio": 1.2, "max_input": None, "image_output": 3000},
+}
+
+# Context windows by model name prefix (the longest matching prefix wins)
+CONTEXT_WINDOWS = (
+    ("gpt-4o", 128000),
+    ("gpt-4-turbo", 128000),
+    ("gpt-4-vision", 128000),
+    ("gpt-4.1", 1000000),
+    ("gpt-4", 8192),
+    ("gpt-3.5", 16385),
+    ("sonar", 127000),
+    ("claude", 200000),
+    ("gemini", 1000000),
+    ("google/gemini", 1000000),
+    ("anthropic/claude", 200000),
+    ("openai/gpt-4o", 128000),
+)
+DEFAULT_CONTEXT_WINDOW = 8192
+
+_encoders = {}
+
+
+def _get_encoder(model):
+    """tiktoken encoder for the model, or None when tiktoken is not installed"""
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoders[model] = None
+    return _encoders[model]
+
+
+def count_tokens(text, model=None):
+    """Token count using the model's tokenizer when available, else ~4 chars per token"""
+    if not text:
+        return 0
+    encoder = _get_encoder(model)
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def get_context_window(model_name):
+    model_name = (model_name or "").lower()
+    for prefix, window in sorted(CONTEXT_WINDOWS, key=lambda x: len(x[0]), reverse=True):
+        if model_name.startswith(prefix):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def _get_profile(task):
+    return TASK_PROFILES.get(task) or TASK_PROFILES["extraction"]
+
+
+def get_output_budget(settings, task, input_tokens=0, has_image=False):
+    """max_tokens to request for a call of the given task type"""
+    cap = cint(settings.max_tokens) or DEFAULT_MAX_TOKENS
+    profile = _get_profile(task)
+
+    if has_image:
+        budget = profile["image_output"]
+    else:
+        budget = profile["min_output"] + int(input_tokens * profile["ratio"])
+
+    if profile["max_output"]:
+        budget = min(budget, profile["max_output"])
+    return max(1, min(budget, cap))
+
+
+def get_input_budget(settings, task):
+    """Largest document chunk (in tokens) worth sending for the given task"""
+    cap = cint(settings.max_tokens) or DEFAULT_MAX_TOKENS
+    profile = _get_profile(task)
+
+    if profile["max_input"]:
+        budget = profile["max_input"]
+    else:
+        # Keep the expected reply within the configured max_tokens
+        budget = int((cap - profile["min_output"]) / profile["ratio"])
+
+    room = get_context_window(settings.model_name) - cap - PROMPT_OVERHEAD_TOKENS
+    return max(256, min(budget, room))
+
+
+def call_with_budget(settings, task, prompt_tokens, call, has_image=False):
+    """Run ``call(max_tokens)`` with a sized budget, retrying once at the cap if the reply was cut off"""
+    predicted = get_output_budget(settings, task, prompt_tokens, has_image)
+    result = call(predicted)
+
+    cap = cint(settings.max_tokens) or DEFAULT_MAX_TOKENS
+    truncated = result.get("finish_reason") == "length"
+    record_usage(settings, task, prompt_tokens, predicted, result.get("usage"), truncated)
+
+    if truncated and predicted < cap:
+        # The cut-off reply was billed too
+        log_request_attempt(result)
+        result = call(cap)
+        record_usage(settings, task, prompt_tokens, cap, result.get("usage"),
+                     result.get("finish_reason") == "length")
+    return result
+
+
+# Add ARGV[2..] counters to the fields prefixed by ARGV[1] and keep a running
+# maximum of the reply size for suggesting a tighter cap
+_RECORD_USAGE_SCRIPT = """
+local prefix = ARGV[1]
+local names = {'calls', 'predicted_input', 'actual_input', 'predicted_output', 'actual_output', 'truncated'}
+for i, name in ipairs(names) do
+    redis.call('HINCRBY', KEYS[1], prefix .. name, ARGV[i + 1])
+end
+local actual_output = tonumber(ARGV[6])
+local current = tonumber(redis.call('HGET', KEYS[1], prefix .. 'max_output') or '0')
+if actual_output > current then
+    redis.call('HSET', KEYS[1], prefix .. 'max_output', actual_output)
+end
+return 1
+"""
+
+
+def _stats_key():
+    return frappe.cache().make_key("ai_token_budget_stats")
+
+
+def record_usage(settings, task, prompt_tokens, predicted_output, usage, truncated=False):
+    """Aggregate predicted vs actual token usage per model and task"""
+    usage = usage or {}
+    actual_input = cint(usage.get("prompt_tokens") or usage.get("input_tokens"))
+    actual_output = cint(usage.get("completion_tokens") or usage.get("output_tokens"))
+    prefix = "{0}|{1}|".format(settings.model_name or settings.ai_provider, task)
+
+    try:
+        frappe.cache().eval(_RECORD_USAGE_SCRIPT, 1, _stats_key(), prefix, 1, cint(prompt_tokens),
+                            actual_input, cint(predicted_output), actual_output, 1 if truncated else 0)
+    except Exception:
+        pass
+
+
+@frappe.whitelist()
+def get_token_budget_stats():
+    """Predicted vs actual token usage per model and task"""
+    frappe.only_for("System Manager")
+
+    try:
+        flat = frappe.cache().eval("return redis.call('HGETALL', KEYS[1])", 1, _stats_key()) or []
+    except Exception:
+        flat = []
+
+    stats = {}
+    for field, value in zip(flat[::2], flat[1::2]):
+        model, task, stat = frappe.safe_decode(field).rsplit("|", 2)
+        stats.setdefault((model, task), {"model": model, "task": task})[stat] = cint(frappe.safe_decode(value))
+
+    result = []
+    for row in stats.values():
+        calls = row.get("calls") or 1
+        row["avg_predicted_output"] = flt(row.get("predicted_output", 0) / calls, 1)
+        row["avg_actual_output"] = flt(row.get("actual_output", 0) / calls, 1)
+        row["output_utilisation"] = flt(row.get("actual_output", 0) / (row.get("predicted_output") or 1), 3)
+        row["input_estimate_ratio"] = flt(row.get("actual_input", 0) / (row.get("predicted_input") or 1), 3)
+        row["truncation_rate"] = flt(row.get("truncated", 0) / calls, 3)
+        row["suggested_max_output"] = int(row.get("max_output", 0) * 1.2)
+        result.append(row)
+    return sorted(result, key=lambda r: (r["model"], r["task"]))
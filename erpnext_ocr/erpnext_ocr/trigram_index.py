@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Trigram similarity index and Redis change log shared by the party and item indexes.
+
+A TrigramIndex holds normalized texts per key (a party or an item) with an
+exact lookup and trigram postings. Fuzzy candidates come from the rarest
+trigrams of the query and only a handful are scored, so a lookup stays well
+under a millisecond on large masters. Subclasses add their own exact lookups
+through ``add_key``.
+
+A ChangeLog records changed keys in Redis after commit. A LiveIndex keeps one
+index per process and site, compares one sequence number on each use and
+reloads only the changed keys. It rebuilds completely only when it has fallen
+behind the log or too many entries have been removed.
+"""
+
+from __future__ import unicode_literals
+import frappe
+import functools
+import threading
+from collections import Counter, defaultdict
+
+MIN_SCORE = 0.6
+# A fuzzy match is used unreviewed only from this score and this far ahead of the runner-up
+LINK_MIN_SCORE = 0.85
+LINK_MIN_MARGIN = 0.1
+CANDIDATE_GRAMS = 8
+MAX_CANDIDATES = 10
+MAX_LOGGED_CHANGES = 10000
+REBUILD_DEAD_RATIO = 0.2
+
+# Record one change and trim the log; returns the new sequence number
+_LOG_CHANGE_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], seq .. ':' .. ARGV[1])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+return seq
+"""
+
+
+def trigrams(normalized):
+    padded = "  {0} ".format(normalized)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(grams, other):
+    """Dice coefficient of two trigram sets"""
+    if not grams or not other:
+        return 0.0
+    return 2.0 * len(grams & other) / (len(grams) + len(other))
+
+
+def is_confident(score, runner_up):
+    """Whether a match is safe to use without review"""
+    return score >= LINK_MIN_SCORE and score - runner_up >= LINK_MIN_MARGIN
+
+
+class TrigramIndex(object):
+    def __init__(self):
+        self.seq = 0
+        self.entries = []           # id -> (key, normalized text) or None once removed
+        self.key_entries = {}       # key -> [ids]
+        self.postings = defaultdict(list)  # trigram -> [ids]
+        self.exact = {}             # normalized text -> [keys]
+        self.lookup_keys = {}       # key -> [(lookup, lookup key)] added through add_key
+        self.dead = 0
+
+    def add_key(self, key, lookup, lookup_key):
+        """Map ``lookup_key`` to ``key`` in an exact lookup; the first key added wins"""
+        if lookup_key and lookup_key not in lookup:
+            lookup[lookup_key] = key
+            self.lookup_keys.setdefault(key, []).append((lookup, lookup_key))
+
+    def add_text(self, key, normalized):
+        keys = self.exact.setdefault(normalized, [])
+        if key not in keys:
+            keys.append(key)
+        entry_id = len(self.entries)
+        self.entries.append((key, normalized))
+        self.key_entries.setdefault(key, []).append(entry_id)
+        postings = self.postings
+        for gram in trigrams(normalized):
+            postings[gram].append(entry_id)
+
+    def remove(self, key):
+        for entry_id in self.key_entries.pop(key, []):
+            _key, normalized = self.entries[entry_id]
+            keys = self.exact.get(normalized)
+            if keys and key in keys:
+                keys.remove(key)
+                if not keys:
+                    del self.exact[normalized]
+            self.entries[entry_id] = None
+            self.dead += 1
+        for lookup, lookup_key in self.lookup_keys.pop(key, []):
+            if lookup.get(lookup_key) == key:
+                del lookup[lookup_key]
+
+    def needs_rebuild(self):
+        return self.entries and self.dead > REBUILD_DEAD_RATIO * len(self.entries)
+
+    def match_text(self, normalized):
+        """``(key, score, matched_on, runner-up score)`` for normalized text, or None
+
+        The runner-up is the best score of any other key. Several keys with
+        the same text are a tie.
+        """
+        keys = self.exact.get(normalized)
+        if keys:
+            return keys[0], 1.0, "name", 1.0 if len(keys) > 1 else 0.0
+
+        grams = trigrams(normalized)
+        postings = sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len)
+        if not postings:
+            return None
+
+        # A close match shares most trigrams, so it shows up in the rarest ones
+        hits = Counter()
+        for posting in postings[:CANDIDATE_GRAMS]:
+            hits.update(posting)
+
+        scores = {}
+        for entry_id, _count in hits.most_common(MAX_CANDIDATES):
+            entry = self.entries[entry_id]
+            if entry is None:
+                continue
+            scores[entry[0]] = max(scores.get(entry[0], 0.0), similarity(grams, trigrams(entry[1])))
+        if not scores:
+            return None
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[0][0], ranked[0][1], "similar_name", ranked[1][1] if len(ranked) > 1 else 0.0
+
+
+class ChangeLog(object):
+    """Sequence number and recent changed keys of an index, in Redis"""
+
+    def __init__(self, sequence_key, changes_key):
+        self.sequence_key = sequence_key
+        self.changes_key = changes_key
+
+    def get_sequence(self):
+        cache = frappe.cache()
+        return int(cache.get(cache.make_key(self.sequence_key)) or 0)
+
+    def changes_since(self, seq, current_seq):
+        """Keys changed after ``seq``, or None when older changes are no longer in the log"""
+        missed = current_seq - seq
+        if missed <= 0 or missed > MAX_LOGGED_CHANGES:
+            return None
+
+        changes = frappe.cache().lrange(self.changes_key, -missed, -1)
+        if not changes:
+            return None
+        changed = set()
+        for position, item in enumerate(changes):
+            item_seq, _sep, key = frappe.safe_decode(item).partition(":")
+            if position == 0 and int(item_seq) > seq + 1:
+                # Older changes were trimmed from the log
+                return None
+            if int(item_seq) > seq:
+                changed.add(key)
+        return changed
+
+    def log(self, key):
+        cache = frappe.cache()
+        cache.eval(_LOG_CHANGE_SCRIPT, 2, cache.make_key(self.sequence_key),
+                   cache.make_key(self.changes_key), key, MAX_LOGGED_CHANGES)
+
+    def queue(self, *keys):
+        # Log after commit so other processes reload committed data
+        for key in keys:
+            if key:
+                frappe.db.after_commit.add(functools.partial(self.log, key))
+
+
+class LiveIndex(object):
+    """One index per process and site, kept current through a ChangeLog
+
+    ``new_index`` returns an empty index and ``load(index, keys=None)`` adds
+    all keys, or the given ones, from the database.
+    """
+
+    def __init__(self, change_log, new_index, load):
+        self.change_log = change_log
+        self.new_index = new_index
+        self.load = load
+        self._indexes = {}          # site -> index
+        self._lock = threading.Lock()
+
+    def get(self):
+        site = frappe.local.site
+        current_seq = self.change_log.get_sequence()
+
+        with self._lock:
+            index = self._indexes.get(site)
+            if index is not None and index.seq != current_seq:
+                index = self._catch_up(index, current_seq)
+            if index is None:
+                index = self._build()
+            self._indexes[site] = index
+        return index
+
+    def _build(self):
+        index = self.new_index()
+        # Read the sequence first so changes made while loading are applied on the next use
+        index.seq = self.change_log.get_sequence()
+        self.load(index)
+        return index
+
+    def _catch_up(self, index, current_seq):
+        """Reload the keys changed since the index was built, or None when a full rebuild is needed"""
+        changed = self.change_log.changes_since(index.seq, current_seq)
+        if changed is None:
+            return None
+        for key in changed:
+            index.remove(key)
+        if changed:
+            self.load(index, list(changed))
+        index.seq = current_seq
+        return None if index.needs_rebuild() else index
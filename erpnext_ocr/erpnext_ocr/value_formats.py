@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2025, John Vincent Fiel and contributors
+# For license information, please see license.txt
+
+"""Date and amount conventions for the values of one extracted document.
+
+A document's conventions are decided once, before any value is converted.
+The date order (day or month first) and the decimal separator come from
+the values themselves when any of them is unambiguous ("25/03/2025",
+"1.234,56"). Failing that, they come from what was last learned for the
+supplier, and then from the system's date and number formats. What a
+document shows unambiguously is remembered for its supplier in the cache.
+
+Conversion then uses precompiled patterns for the common shapes and only
+falls back to dateutil for anything else.
+"""
+
+from __future__ import unicode_literals
+import datetime
+import frappe
+import re
+
+DAY_FIRST = "DMY"
+MONTH_FIRST = "MDY"
+DECIMAL_POINT = "."
+DECIMAL_COMMA = ","
+
+SUPPLIER_FORMATS_KEY = "ocr_supplier_value_formats"
+# Bumped whenever a learned format changes, so cached mappings using it are rebuilt
+SUPPLIER_FORMATS_SEQUENCE_KEY = "ocr_supplier_value_formats_seq"
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+
+_ISO_DATE = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)")
+_NUMERIC_DATE = re.compile(r"(?<!\d)(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})(?!\d)")
+_DAY_MONTH_NAME = re.compile(r"(?<!\d)(\d{1,2})(?:st|nd|rd|th)?[\s.-]+([a-z]{3,9})\.?[\s.,-]+(\d{4})", re.IGNORECASE)
+_MONTH_NAME_DAY = re.compile(r"([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})", re.IGNORECASE)
+
+_PLAIN_AMOUNT = re.compile(r"-?\d+(?:\.\d{1,2})?$")
+# First number in the text with its grouping, and the signs around it: "(1,234.50)", "-12", "12-"
+_AMOUNT = re.compile(r"(\()?\s*(-)?\s*(\d(?:[\d.,'\s]*\d)?)\s*(\)|-)?")
+_NOT_NUMBER = re.compile(r"[^\d.,]")
+
+
+def _make_date(year, month, day):
+    year = int(year)
+    if year < 100:
+        year += 2000
+    try:
+        return datetime.date(year, int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _month_number(name):
+    return MONTHS.get(name[:3].lower())
+
+
+def date_order_of(value):
+    """Day or month first, when a numeric date shows it (a part above 12), else None"""
+    match = isinstance(value, str) and _NUMERIC_DATE.search(value)
+    if not match:
+        return None
+    first, second = int(match.group(1)), int(match.group(2))
+    if first > 12 and second <= 12:
+        return DAY_FIRST
+    if second > 12 and first <= 12:
+        return MONTH_FIRST
+    return None
+
+
+def decimal_separator_of(number):
+    """Decimal separator of a number made of digits, points and commas, when it shows it, else None"""
+    last_point, last_comma = number.rfind("."), number.rfind(",")
+    if last_point >= 0 and last_comma >= 0:
+        return DECIMAL_POINT if last_point > last_comma else DECIMAL_COMMA
+
+    separator = DECIMAL_POINT if last_point >= 0 else DECIMAL_COMMA if last_comma >= 0 else None
+    if separator is None:
+        return None
+    if number.count(separator) > 1:
+        # Repeated, so it groups thousands
+        return DECIMAL_COMMA if separator == DECIMAL_POINT else DECIMAL_POINT
+    if len(number) - number.rfind(separator) - 1 != 3:
+        return separator
+    if not number[:number.find(separator)].strip("0"):
+        # "0.125": thousands groups never lead with zero
+        return separator
+    # "1.234" or "1,234": either a thousands group or three decimals
+    return None
+
+
+def _find_amount(value):
+    """``(digits with separators, negative)`` of the first number in a string, or None"""
+    match = _AMOUNT.search(value)
+    if not match:
+        return None
+    opening, minus, number, closing = match.groups()
+    negative = bool(minus) or closing == "-" or bool(opening and closing == ")")
+    return _NOT_NUMBER.sub("", number), negative
+
+
+def _parse_with_dateutil(value, dayfirst):
+    try:
+        from dateutil import parser
+        return parser.parse(value, dayfirst=dayfirst)
+    except Exception:
+        return None
+
+
+class ValueFormats(object):
+    """Date order and decimal separator for one document, with the converters using them"""
+
+    def __init__(self, date_order=None, decimal_separator=None):
+        self.date_order = date_order
+        self.decimal_separator = decimal_separator
+
+    def parse_date(self, value):
+        """Date from a string, or None"""
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        if isinstance(value, datetime.date):
+            return value
+        if not isinstance(value, str):
+            return None
+
+        match = _ISO_DATE.search(value)
+        if match:
+            return _make_date(*match.groups())
+
+        match = _NUMERIC_DATE.search(value)
+        if match:
+            first, second, year = match.groups()
+            order = date_order_of(value) or self.date_order
+            if order == MONTH_FIRST:
+                return _make_date(year, first, second)
+            return _make_date(year, second, first)
+
+        match = _DAY_MONTH_NAME.search(value)
+        if match and _month_number(match.group(2)):
+            return _make_date(match.group(3), _month_number(match.group(2)), match.group(1))
+
+        match = _MONTH_NAME_DAY.search(value)
+        if match and _month_number(match.group(1)):
+            return _make_date(match.group(3), _month_number(match.group(1)), match.group(2))
+
+        parsed = _parse_with_dateutil(value, self.date_order != MONTH_FIRST)
+        return parsed.date() if parsed else None
+
+    def parse_datetime(self, value):
+        if isinstance(value, datetime.datetime):
+            return value
+        if not isinstance(value, str):
+            return None
+        try:
+            return datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            pass
+        return _parse_with_dateutil(value, self.date_order != MONTH_FIRST)
+
+    def parse_amount(self, value):
+        """Float from an amount, honouring its thousands and decimal separators; 0.0 when unreadable"""
+        if isinstance(value, bool):
+            return float(value)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if not isinstance(value, str):
+            return 0.0
+
+        value = value.strip()
+        if _PLAIN_AMOUNT.match(value):
+            return float(value)
+
+        found = _find_amount(value)
+        if not found:
+            return 0.0
+
+        number, negative = found
+        separator = decimal_separator_of(number) or self.decimal_separator or DECIMAL_POINT
+        if separator == DECIMAL_COMMA:
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+
+        try:
+            amount = float(number)
+        except ValueError:
+            return 0.0
+        return -amount if negative else amount
+
+
+def detect_formats(dates, amounts):
+    """``(date order, decimal separator)`` shown by a document's values; either may be None"""
+    votes = {DAY_FIRST: 0, MONTH_FIRST: 0, DECIMAL_POINT: 0, DECIMAL_COMMA: 0}
+    for value in dates:
+        order = date_order_of(value)
+        if order:
+            votes[order] += 1
+    for value in amounts:
+        found = isinstance(value, str) and _find_amount(value)
+        separator = found and decimal_separator_of(found[0])
+        if separator:
+            votes[separator] += 1
+
+    def winner(first, second):
+        if votes[first] == votes[second]:
+            return None
+        return first if votes[first] > votes[second] else second
+
+    return winner(DAY_FIRST, MONTH_FIRST), winner(DECIMAL_POINT, DECIMAL_COMMA)
+
+
+def get_system_formats():
+    """``(date order, decimal separator)`` of the system date and number formats"""
+    date_format = (frappe.db.get_default("date_format") or "dd-mm-yyyy").lower()
+    date_order = MONTH_FIRST if date_format.startswith("mm") else DAY_FIRST
+
+    number_format = frappe.db.get_default("number_format") or "#,###.##"
+    last = max(number_format.rfind("."), number_format.rfind(","))
+    # A trailing group of three is a thousands group ("#,###"), not decimals
+    if last >= 0 and len(number_format) - last - 1 != 3:
+        decimal_separator = number_format[last]
+    else:
+        decimal_separator = DECIMAL_POINT
+    return date_order, decimal_separator
+
+
+def get_supplier_formats(supplier):
+    """``(date order, decimal separator)`` learned for a supplier; either may be None"""
+    if not supplier:
+        return None, None
+    return frappe.cache().hget(SUPPLIER_FORMATS_KEY, supplier) or (None, None)
+
+
+def learn_supplier_formats(supplier, date_order, decimal_separator):
+    """Remember what a supplier's document showed, keeping what it did not show"""
+    if not supplier or not (date_order or decimal_separator):
+        return
+    learned = get_supplier_formats(supplier)
+    updated = (date_order or learned[0], decimal_separator or learned[1])
+    if updated != tuple(learned):
+        frappe.cache().hset(SUPPLIER_FORMATS_KEY, supplier, updated)
+        _bump_formats_sequence()
+
+
+def _bump_formats_sequence():
+    cache = frappe.cache()
+    cache.incr(cache.make_key(SUPPLIER_FORMATS_SEQUENCE_KEY))
+
+
+def get_formats_version():
+    """Changes whenever a learned supplier format or the system date or number format changes"""
+    cache = frappe.cache()
+    sequence = int(cache.get(cache.make_key(SUPPLIER_FORMATS_SEQUENCE_KEY)) or 0)
+    return "{0}{1}{2}".format(sequence, *get_system_formats())
+
+
+def get_value_formats(dates, amounts, supplier=None):
+    """Conventions for a document: its own values, then the supplier's, then the system's"""
+    date_order, decimal_separator = detect_formats(dates, amounts)
+    learn_supplier_formats(supplier, date_order, decimal_separator)
+
+    if not (date_order and decimal_separator):
+        supplier_formats = get_supplier_formats(supplier)
+        date_order = date_order or supplier_formats[0]
+        decimal_separator = decimal_separator or supplier_formats[1]
+    if not (date_order and decimal_separator):
+        system_formats = get_system_formats()
+        date_order = date_order or system_formats[0]
+        decimal_separator = decimal_separator or system_formats[1]
+
+    return ValueFormats(date_order, decimal_separator)
+
+
+@frappe.whitelist()
+def clear_supplier_formats(supplier=None):
+    """Forget the learned conventions of one supplier, or of all"""
+    frappe.only_for("System Manager")
+    if supplier:
+        frappe.cache().hdel(SUPPLIER_FORMATS_KEY, supplier)
+    else:
+        frappe.cache().delete_value(SUPPLIER_FORMATS_KEY)
+    _bump_formats_sequence()
@@ -98,6 +98,68 @@ doc_events = {
         # "on_cancel": "chanjeapp.hooks_datadog.SI.amend",
         # "on_trash": "chanjeapp.hooks_datadog.SI.trash"
     },
+    "AI Integration Settings": {
+        "on_update": "erpnext_ocr.erpnext_ocr.ai_router.clear_settings_cache",
+        "on_trash": "erpnext_ocr.erpnext_ocr.ai_router.clear_settings_cache"
+    },
+    "Supplier": {
+        "on_update": "erpnext_ocr.erpnext_ocr.party_index.on_party_change",
+        "on_trash": "erpnext_ocr.erpnext_ocr.party_index.on_party_change",
+        "after_rename": "erpnext_ocr.erpnext_ocr.party_index.on_party_change"
+    },
+    "Customer": {
+        "on_update": "erpnext_ocr.erpnext_ocr.party_index.on_party_change",
+        "on_trash": "erpnext_ocr.erpnext_ocr.party_index.on_party_change",
+        "after_rename": "erpnext_ocr.erpnext_ocr.party_index.on_party_change"
+    },
+    "OCR Party Alias": {
+        "on_update": "erpnext_ocr.erpnext_ocr.party_index.on_alias_change",
+        "on_trash": "erpnext_ocr.erpnext_ocr.party_index.on_alias_change"
+    },
+    "Item": {
+        "on_update": "erpnext_ocr.erpnext_ocr.item_index.on_item_change",
+        "on_trash": "erpnext_ocr.erpnext_ocr.item_index.on_item_change",
+        "after_rename": "erpnext_ocr.erpnext_ocr.item_index.on_item_change"
+    },
+    "OCR Item Alias": {
+        "on_update": "erpnext_ocr.erpnext_ocr.item_index.on_alias_change",
+        "on_trash": "erpnext_ocr.erpnext_ocr.item_index.on_alias_change"
+    },
+    "Purchase Invoice": {
+        "after_insert": "erpnext_ocr.erpnext_ocr.duplicate_index.index_invoice",
+        "on_update": "erpnext_ocr.erpnext_ocr.duplicate_index.index_invoice",
+        "on_submit": "erpnext_ocr.erpnext_ocr.item_index.learn_from_document",
+        "on_cancel": "erpnext_ocr.erpnext_ocr.duplicate_index.unindex_invoice",
+        "on_trash": "erpnext_ocr.erpnext_ocr.duplicate_index.unindex_invoice"
+    },
+    "Purchase Order": {
+        "on_submit": "erpnext_ocr.erpnext_ocr.item_index.learn_from_document"
+    },
+    "Purchase Receipt": {
+        "on_submit": "erpnext_ocr.erpnext_ocr.item_index.learn_from_document"
+    },
+    "OCR Field Alias": {
+        "on_update": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans",
+        "on_trash": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans"
+    },
+    "DocType": {
+        "on_update": [
+            "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans",
+            "erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read.clear_doctype_list_cache"
+        ],
+        "on_trash": [
+            "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans",
+            "erpnext_ocr.erpnext_ocr.doctype.ocr_read.ocr_read.clear_doctype_list_cache"
+        ]
+    },
+    "Custom Field": {
+        "on_update": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans",
+        "on_trash": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans"
+    },
+    "Property Setter": {
+        "on_update": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans",
+        "on_trash": "erpnext_ocr.erpnext_ocr.field_mapping.clear_mapping_plans"
+    },
 }
 
 # Scheduled Tasks
@@ -121,6 +183,13 @@ doc_events = {
 # 	]
 # }
 
+scheduler_events = {
+    "all": [
+        "erpnext_ocr.erpnext_ocr.doctype.ai_batch_job.ai_batch_job.poll_ai_batch_jobs",
+        "erpnext_ocr.erpnext_ocr.ai_usage.flush_usage_log"
+    ]
+}
+
 # Testing
 # -------
 